@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the autoscaler's decision latency against a fake API server.
+
+Feeds the stress-ng SAT's cpu_util_prct SLO alternately above and below
+its threshold and measures the time from the SLO evaluation (the metric
+crossing the threshold) to the scale PATCH arriving at, and returning
+from, the API server.
+
+    python benchmarks/bench_autoscaler.py --iterations 200 --latency 0.002
+"""
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import yaml  # noqa: E402
+from kubernetes import client  # noqa: E402
+
+from autoscaler import Autoscaler, ScalingPolicy  # noqa: E402
+from fake_apiserver import FakeApiServer  # noqa: E402
+from slo_engine import SLOEngine, Sample, StubMetricSource, parse_metric_definitions  # noqa: E402
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def run(iterations: int, latency: float, sat_path: Path) -> None:
+    with open(sat_path) as f:
+        services = parse_metric_definitions(yaml.safe_load(f))
+    service = next(name for name, d in services.items() if d.constraints)
+    raw = next(iter(services[service].raw.values()))
+    threshold = services[service].constraints[0].threshold
+    # One-sample windows: every evaluation reflects the value just ingested
+    for composite in services[service].composite.values():
+        composite.window = composite.frequency
+
+    server = FakeApiServer(latency=latency).start()
+    server.add_deployment(service, replicas=1)
+    apps_v1 = client.AppsV1Api(server.api_client())
+
+    source = StubMetricSource()
+    engine = SLOEngine(services, source)
+    # No cooldowns: every crossing produces a decision
+    policy = ScalingPolicy(min_replicas=1, max_replicas=1000, scale_up_cooldown=0, scale_down_cooldown=0)
+    scaler = Autoscaler(apps_v1, "default", {service: service}, services, policy=policy).attach(engine)
+    state = scaler._state[service]
+
+    to_server, end_to_end = [], []
+    for i in range(iterations):
+        value = threshold * 1.5 if i % 2 == 0 else threshold * 0.2
+        source.set_values(raw.name, [Sample(value, f"{service}-0", zone="zone-a")])
+        patches_before = server.count("PATCH", "/scale")
+        crossed_wall, crossed = time.time(), time.monotonic()
+        engine.ingest(service, raw, source.collect(service, raw), now=crossed_wall)
+        # Wait for the scale (the first iteration also reads the current scale)
+        while state.in_flight or server.count("PATCH", "/scale") == patches_before:
+            await asyncio.sleep(0)
+        done = time.monotonic()
+        received = [t for m, p, t in server.requests if m == "PATCH"][-1]
+        to_server.append(received - crossed)
+        end_to_end.append(done - crossed)
+
+    server.stop()
+    print(f"Autoscaler decision latency over {iterations} threshold crossings "
+          f"(fake API server latency {latency * 1000:.1f}ms):")
+    for label, values in (("crossing -> PATCH received", to_server), ("crossing -> PATCH completed", end_to_end)):
+        print(f"  {label:28s} p50 {percentile(values, 50) * 1000:7.2f}ms  "
+              f"p95 {percentile(values, 95) * 1000:7.2f}ms  p99 {percentile(values, 99) * 1000:7.2f}ms  "
+              f"mean {statistics.mean(values) * 1000:7.2f}ms")
+    print(f"  scale PATCHes: {server.count('PATCH', '/scale')}, scale GETs: {server.count('GET', '/scale')}, "
+          f"final replicas: {state.replicas}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated API server latency in seconds")
+    parser.add_argument("--sat", type=Path, default=ROOT / "KB" / "stressng_SAT.yaml")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    # Every crossing logs a violation; keep the report readable
+    logging.getLogger("SwarmAgent").setLevel(logging.ERROR)
+    asyncio.run(run(args.iterations, args.latency, args.sat))
+
+
+if __name__ == "__main__":
+    main()
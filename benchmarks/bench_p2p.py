@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+"""
+Simulate a P2P swarm of Swarm Agents on loopback and measure how it scales.
+
+For each swarm size N, a fresh process runs one asyncio event loop with
+Twisted's asyncio reactor (as the agent does) and on it:
+
+- a bootstrap SwchPeer standing in for the RA, which every agent enters
+  (p2p_public_ip/p2p_public_port point at it, as in generated configs);
+- N SwarmAgent instances (a leader and N-1 workers), each with its own
+  listen port, set up and joined through the agent's own
+  _initialise_p2p_network / _join_p2p_network and message handlers.
+
+Measured per size:
+
+- join: time for each agent to set up and join (leader first, then all
+  workers at once), and the wall time until every worker has joined;
+- discovery: time until get_connected_peers() of the leader, and of
+  every agent, lists all other agents (or the coverage reached);
+- MSG_GETSTATE round trips from the leader to each worker in turn, and
+  the fan-out time of one MSG_GETSTATE to all workers at once;
+- SAT broadcast: the leader's chunked SAT offer until every worker has
+  pulled and verified it.
+
+    python benchmarks/bench_p2p.py --sizes 2 5 10 25 50
+    python benchmarks/bench_p2p.py --sizes 10 --rounds 50 --json p2p.json
+
+Needs swchp2pcom and twisted (requirements.txt).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import yaml  # noqa: E402
+
+HOST = "127.0.0.1"
+APP_ID = "p2p-sim"
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def write_config(directory: str, index: int, listen_port: int, bootstrap_port: int) -> str:
+    """Agent config as generate-configMaps.py writes it, on loopback."""
+    role = "leader" if index == 0 else "worker"
+    config = {
+        "SA_id": f"SA-sim-{index:03d}", "SA_role": role, "password": "sim", "universe_id": "universe_sim",
+        "app_id": APP_ID, "resource_id": f"sim-{index:03d}", "api_ip": HOST, "api_port": 8080,
+        "p2p_public_ip": HOST, "p2p_public_port": bootstrap_port,
+        "p2p_listen_ip": HOST, "p2p_listen_port": listen_port,
+        "p2p_enabled": True, "metrics_enabled": False, "hot_reload": False,
+        "sat_store_dir": os.path.join(directory, f"sat-{index:03d}"),
+        "manifest_cache_dir": os.path.join(directory, f"manifests-{index:03d}"),
+        "p2p_peer_cache": os.path.join(directory, f"peers-{index:03d}.json"),
+    }
+    path = os.path.join(directory, f"config-{index:03d}.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+
+async def wait_until(predicate, timeout: float, interval: float = 0.005):
+    """Seconds until `predicate()` holds, or None on timeout."""
+    started = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - started > timeout:
+            return None
+        await asyncio.sleep(interval)
+    return time.perf_counter() - started
+
+
+async def simulate(size: int, options: dict, loop, reactor) -> dict:
+    from SA import SwarmAgent
+    from swchp2pcom import SwchPeer
+
+    reactor.startRunning(installSignalHandlers=False)
+    timeout = options["timeout"]
+    base_port = options["base_port"]
+    bootstrap = SwchPeer(peer_id="RA-sim", listen_ip=HOST, listen_port=base_port, public_ip=HOST,
+                         public_port=base_port, metadata={"peer_type": "ra", "appid": APP_ID})
+
+    with tempfile.TemporaryDirectory(prefix="bench-p2p-") as tmp:
+        sat_path = options["sat"]
+        agents = []
+        for index in range(size):
+            config_path = write_config(tmp, index, base_port + 1 + index, base_port)
+            # Workers start without the SAT so the broadcast has to reach them
+            agent = SwarmAgent(config_path=config_path,
+                               tosca_path=sat_path if index == 0 else os.path.join(tmp, "missing.yaml"))
+            agent.loop = loop
+            agent._sat_received = loop.create_future()
+            agents.append(agent)
+        leader, workers = agents[0], agents[1:]
+        ids = {agent.sa_id for agent in agents}
+
+        async def join(agent):
+            started = time.perf_counter()
+            await agent._initialise_p2p_network()
+            return time.perf_counter() - started
+
+        leader_join = await join(leader)
+        joins_started = time.perf_counter()
+        worker_joins = list(await asyncio.gather(*(join(agent) for agent in workers)))
+        all_joined = time.perf_counter() - joins_started
+
+        def sees_all(agent):
+            return ids - {agent.sa_id} <= set(agent.p2p_agent.get_connected_peers())
+
+        leader_discovery = await wait_until(lambda: sees_all(leader), timeout)
+        mesh_discovery = await wait_until(lambda: all(sees_all(agent) for agent in agents), timeout)
+        coverage = sum(len((ids - {a.sa_id}) & set(a.p2p_agent.get_connected_peers())) for a in agents)
+        coverage /= max(1, size * (size - 1))
+
+        # MSG_STATE replies to the leader's MSG_GETSTATE, keyed by worker
+        replies = {}
+
+        def on_state(peer_id, message):
+            future = replies.pop(peer_id, None)
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+        leader.dispatcher.register_message_handler("MSG_STATE", on_state)
+
+        async def getstate(worker_ids):
+            futures = {peer: loop.create_future() for peer in worker_ids}
+            replies.update(futures)
+            sent = time.perf_counter()
+            for peer in worker_ids:
+                leader.dispatcher.send(peer, "MSG_GETSTATE", {"appid": APP_ID})
+            try:
+                received = await asyncio.wait_for(asyncio.gather(*futures.values()), timeout)
+            except asyncio.TimeoutError:
+                return None
+            return [at - sent for at in received]
+
+        rtts = []
+        for _ in range(options["rounds"]):
+            for worker in workers:
+                rtt = await getstate([worker.sa_id])
+                if rtt:
+                    rtts.extend(rtt)
+        fanout = await getstate([worker.sa_id for worker in workers]) if workers else []
+
+        broadcast_started = time.perf_counter()
+        leader._broadcast_tosca()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(w._sat_received for w in workers)), timeout)
+            broadcast = time.perf_counter() - broadcast_started
+        except asyncio.TimeoutError:
+            broadcast = None
+        sat_received = sum(1 for w in workers if w._sat_received.done())
+
+        for agent in agents:
+            if agent.dispatcher:
+                await agent.dispatcher.close()
+
+    return {
+        "agents": size,
+        "leader_join_s": leader_join,
+        "join_p50_s": percentile(worker_joins, 50),
+        "join_p99_s": percentile(worker_joins, 99),
+        "all_joined_s": all_joined,
+        "leader_discovery_s": leader_discovery,
+        "mesh_discovery_s": mesh_discovery,
+        "mesh_coverage": coverage,
+        "rtt_p50_ms": percentile(rtts, 50) * 1000 if rtts else None,
+        "rtt_p99_ms": percentile(rtts, 99) * 1000 if rtts else None,
+        "rtt_lost": options["rounds"] * len(workers) - len(rtts),
+        "getstate_fanout_ms": max(fanout) * 1000 if fanout else None,
+        "sat_broadcast_s": broadcast,
+        "sat_received": sat_received,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_size(size: int, options: dict) -> dict:
+    """One simulated swarm; runs in its own process, as a reactor can be installed only once."""
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("SwarmAgent").setLevel(logging.WARNING)
+    from SA import install_asyncio_reactor
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    reactor = install_asyncio_reactor(loop)
+    try:
+        return loop.run_until_complete(simulate(size, options, loop, reactor))
+    finally:
+        reactor.stop()
+
+
+def fmt(value, unit="s", scale=1.0, width=8):
+    if value is None:
+        return f"{'-':>{width + len(unit)}}"
+    return f"{value * scale:>{width}.3f}{unit}"
+
+
+def print_table(results):
+    print(f"{'N':>4} {'leader join':>12} {'join p50':>9} {'join p99':>9} {'all joined':>11} "
+          f"{'leader sees':>12} {'mesh':>9} {'cover':>6} {'rtt p50':>10} {'rtt p99':>10} "
+          f"{'fan-out':>10} {'SAT bcast':>10} {'RSS':>8}")
+    for r in results:
+        print(f"{r['agents']:>4} {fmt(r['leader_join_s'], width=11)} {fmt(r['join_p50_s'])} "
+              f"{fmt(r['join_p99_s'])} {fmt(r['all_joined_s'], width=10)} "
+              f"{fmt(r['leader_discovery_s'], width=11)} {fmt(r['mesh_discovery_s'])} "
+              f"{r['mesh_coverage']:>6.0%} {fmt(r['rtt_p50_ms'], 'ms')} {fmt(r['rtt_p99_ms'], 'ms')} "
+              f"{fmt(r['getstate_fanout_ms'], 'ms')} {fmt(r['sat_broadcast_s'], width=9)} "
+              f"{r['peak_rss_mb']:>6.1f}MB")
+        if r["rtt_lost"] or r["sat_received"] < r["agents"] - 1:
+            print(f"     {r['rtt_lost']} MSG_GETSTATE replies lost, "
+                  f"SAT received by {r['sat_received']}/{r['agents'] - 1} workers")
+
+
+def main():
+    for module in ("swchp2pcom", "twisted"):
+        try:
+            __import__(module)
+        except ImportError:
+            sys.exit(f"bench_p2p.py needs {module}: pip install -r requirements.txt")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 5, 10, 25, 50], help="Agents per swarm")
+    parser.add_argument("--rounds", type=int, default=10, help="MSG_GETSTATE round trips per worker")
+    parser.add_argument("--base-port", type=int, default=47000, help="First loopback port used")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for discovery and replies")
+    parser.add_argument("--sat", type=Path, default=ROOT / "KB" / "stressng_SAT.yaml", help="SAT broadcast")
+    parser.add_argument("--json", type=Path, help="Save the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    # Each size gets its own port range, clear of sockets the previous run left in TIME_WAIT
+    stride = max(args.sizes) + 2
+    for position, size in enumerate(args.sizes):
+        options = {"rounds": args.rounds, "timeout": args.timeout, "sat": str(args.sat),
+                   "base_port": args.base_port + position * stride}
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results.append(pool.submit(run_size, size, options).result())
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the agent's translate -> apply -> ready pipeline.
+
+Generates synthetic SATs modelled on KB/stressng_SAT.yaml with 1 to 500
+microservices and, for each size, runs the SAT through translation, the
+ApplyEngine (server-side apply into a fresh in-process fake API server)
+and the RolloutTracker (watch-driven readiness, with the fake server's
+controller marking workloads ready after --ready-delay). A second apply
+of the same manifests measures the unchanged-redeploy path.
+
+Each size runs in its own process, so the reported peak RSS (agent code
+and fake API server together) belongs to that size alone. Results can
+be saved with --json and compared against a saved baseline with
+--compare; the run then fails when a metric regresses by more than
+--threshold.
+
+    python benchmarks/bench_pipeline.py --sizes 1 10 100 500
+    python benchmarks/bench_pipeline.py --latency 0.005 --error-rate 0.02 --json run.json
+    python benchmarks/bench_pipeline.py --compare run.json --threshold 0.15
+
+Translation uses the k3s_client translator when it is installed; with
+--translator basic (or when it is not installed) a minimal built-in
+Deployment/Service conversion stands in, so apply and readiness can
+still be measured.
+"""
+
+import argparse
+import copy
+import json
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+import yaml  # noqa: E402
+
+# Lower is better for all of these; compared by --compare
+COMPARED = ("translate_s", "apply_s", "apply_p99_ms", "ready_s", "ready_p99_s", "total_s", "reapply_s",
+            "peak_rss_mb")
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def make_sat(num_services: int, base_path: Path, seed: int = 1) -> dict:
+    """The base SAT with its microservice copied `num_services` times, varying replicas and load."""
+    with open(base_path) as f:
+        base = yaml.safe_load(f)
+    templates = base["service_template"]["node_templates"]
+    name, service = next((n, t) for n, t in templates.items() if t.get("type") == "swch:Microservice")
+    others = {n: t for n, t in templates.items() if n != name}
+    sat = copy.deepcopy(base)
+    sat["service_template"]["node_templates"] = dict(others)
+    for i in range(num_services):
+        instance = f"{name}-{i:03d}"
+        node = copy.deepcopy(service)
+        props = node.setdefault("properties", {})
+        props["replicas"] = 1 + (i + seed) % 3
+        props["labels"] = {**(props.get("labels") or {}), "app": instance, "service": instance}
+        if props.get("args"):
+            props["args"] = [str(1 + (i + seed) % 4) if arg == "1" else arg for arg in props["args"]]
+        sat["service_template"]["node_templates"][instance] = node
+    # Base policies target the original service; spread them over the copies
+    for entry in sat["service_template"].get("policies") or []:
+        for policy in entry.values():
+            if isinstance(policy, dict) and policy.get("targets"):
+                policy["targets"] = [f"{name}-{i:03d}" for i in range(min(2, num_services))]
+    return sat
+
+
+def basic_manifests(sat: dict, image_pull_secret: str = "regcred") -> list:
+    """A Deployment (and a Service when ports are declared) per microservice."""
+    manifests = []
+    for name, node in sat["service_template"]["node_templates"].items():
+        if node.get("type") != "swch:Microservice":
+            continue
+        props = node.get("properties") or {}
+        labels = {"app": name}
+        container = {"name": name, "image": props["image"]}
+        for key in ("command", "args"):
+            if props.get(key):
+                container[key] = list(props[key])
+        ports = [p for p in props.get("ports") or [] if isinstance(p, dict) and p.get("port")]
+        if ports:
+            container["ports"] = [{"containerPort": int(p.get("target", p["port"]))} for p in ports]
+        manifests.append({
+            "apiVersion": "apps/v1", "kind": "Deployment",
+            "metadata": {"name": name, "labels": {**(props.get("labels") or {}), **labels}},
+            "spec": {"replicas": int(props.get("replicas", 1)), "selector": {"matchLabels": labels},
+                     "template": {"metadata": {"labels": labels},
+                                  "spec": {"containers": [container],
+                                           "imagePullSecrets": [{"name": image_pull_secret}]}}},
+        })
+        if ports:
+            manifests.append({
+                "apiVersion": "v1", "kind": "Service", "metadata": {"name": name, "labels": labels},
+                "spec": {"selector": labels,
+                         "ports": [{"port": int(p["port"]), "targetPort": int(p.get("target", p["port"]))}
+                                   for p in ports]},
+            })
+    return manifests
+
+
+def translate(sat_path: str, translator: str) -> list:
+    if translator == "k3s":
+        from k3s_client.utils.manifest import get_kubernetes_manifest
+        return get_kubernetes_manifest(tosca_file=sat_path, image_pull_secret="regcred")
+    with open(sat_path) as f:
+        return basic_manifests(yaml.safe_load(f))
+
+
+def run_size(size: int, args: dict) -> dict:
+    """One benchmark run of a SAT with `size` microservices; runs in its own process."""
+    logging.basicConfig(level=logging.WARNING)
+    # Injected failures log a traceback each; keep the report readable
+    logging.getLogger("SwarmAgent").setLevel(logging.CRITICAL)
+    from apply_engine import ApplyEngine
+    from fake_apiserver import FakeApiServer
+    from readiness import TRACKED_KINDS, RolloutTracker
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as tmp:
+        sat_path = os.path.join(tmp, "sat.yaml")
+        with open(sat_path, "w") as f:
+            yaml.safe_dump(make_sat(size, Path(args["sat"]), args["seed"]), f, sort_keys=False)
+
+        for repeat in range(args["repeat"]):
+            server = FakeApiServer(latency=args["latency"], error_rate=args["error_rate"],
+                                   error_status=args["error_status"], ready_delay=args["ready_delay"],
+                                   seed=args["seed"] + repeat).start()
+            try:
+                api_client = server.api_client()
+                # Discovery is done once per agent process; keep it out of the measured apply
+                error_rate, server.error_rate = server.error_rate, 0.0
+                dynamic_client = server.dynamic_client(api_client, cache_file=os.path.join(tmp, f"discovery-{repeat}"))
+                server.error_rate = error_rate
+
+                started = time.perf_counter()
+                manifests = translate(sat_path, args["translator"])
+                translated = time.perf_counter()
+
+                engine = ApplyEngine(api_client, "default", max_workers=args["workers"],
+                                     dynamic_client=dynamic_client)
+                apply_started_wall = time.time()
+                report = engine.apply(manifests)
+                applied = time.perf_counter()
+
+                # Readiness of what was applied; objects failed by injected errors would never roll out
+                ok = {(r.kind, r.name) for r in report.results if r.status != "failed"}
+                tracked = [m for m in manifests if m.get("kind") in TRACKED_KINDS
+                           and (m["kind"], m["metadata"]["name"]) in ok]
+                tracker = RolloutTracker(dynamic_client, "default").track(tracked, started_at=apply_started_wall)
+                ready = tracker.wait(args["ready_timeout"])
+                done = time.perf_counter()
+                tracker.stop()
+                ready_times = [t for t in tracker.report()["workloads"].values() if t is not None]
+
+                reapply = engine.apply(manifests)
+                runs.append({
+                    "objects": len(manifests),
+                    "translate_s": translated - started,
+                    "apply_s": applied - translated,
+                    "latencies": [r.latency for r in report.results],
+                    "failed": len(report.failed),
+                    "ready": ready,
+                    "ready_s": done - applied,
+                    "ready_times": ready_times,
+                    "total_s": done - started,
+                    "reapply_s": reapply.wall_time,
+                    "requests": server.request_counts(),
+                })
+            finally:
+                server.stop()
+
+    latencies = [latency for run in runs for latency in run["latencies"]]
+    ready_times = [t for run in runs for t in run["ready_times"]]
+    median = lambda key: statistics.median(run[key] for run in runs)
+    return {
+        "services": size,
+        "objects": runs[0]["objects"],
+        "translate_s": median("translate_s"),
+        "apply_s": median("apply_s"),
+        "throughput": runs[0]["objects"] / median("apply_s") if median("apply_s") else None,
+        "apply_p50_ms": percentile(latencies, 50) * 1000,
+        "apply_p99_ms": percentile(latencies, 99) * 1000,
+        "failed": max(run["failed"] for run in runs),
+        "ready": all(run["ready"] for run in runs),
+        "ready_s": median("ready_s"),
+        "ready_p50_s": percentile(ready_times, 50),
+        "ready_p99_s": percentile(ready_times, 99),
+        "total_s": median("total_s"),
+        "reapply_s": median("reapply_s"),
+        "requests": runs[-1]["requests"],
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def print_table(results):
+    print(f"{'svcs':>5} {'objs':>5} {'translate':>10} {'apply':>9} {'obj/s':>8} {'p50':>8} {'p99':>8} "
+          f"{'failed':>6} {'ready':>9} {'ready p99':>9} {'total':>9} {'reapply':>9} {'RSS':>8}")
+    for r in results:
+        ready = f"{r['ready_s']:>8.3f}s" if r["ready"] else f"{'timeout':>9}"
+        ready_p99 = f"{r['ready_p99_s']:>8.3f}s" if r["ready_p99_s"] is not None else f"{'-':>9}"
+        print(f"{r['services']:>5} {r['objects']:>5} {r['translate_s']:>9.3f}s {r['apply_s']:>8.3f}s "
+              f"{r['throughput'] or 0:>8.1f} {r['apply_p50_ms']:>6.2f}ms {r['apply_p99_ms']:>6.2f}ms "
+              f"{r['failed']:>6} {ready} {ready_p99} {r['total_s']:>8.3f}s {r['reapply_s']:>8.3f}s "
+              f"{r['peak_rss_mb']:>6.1f}MB")
+
+
+def compare(results, baseline_path: Path, threshold: float) -> bool:
+    """Print changes against a saved run; returns False when a metric regressed past the threshold."""
+    with open(baseline_path) as f:
+        baseline = {r["services"]: r for r in json.load(f)["results"]}
+    ok = True
+    print(f"\nCompared with {baseline_path} (regression threshold {threshold:.0%}):")
+    for r in results:
+        before = baseline.get(r["services"])
+        if before is None:
+            continue
+        changes = []
+        for key in COMPARED:
+            old, new = before.get(key), r.get(key)
+            if not old or new is None:
+                continue
+            delta = (new - old) / old
+            flag = ""
+            if delta > threshold:
+                flag, ok = " REGRESSION", False
+            changes.append(f"{key} {delta:+.0%}{flag}")
+        print(f"  {r['services']:>4} services: " + ", ".join(changes))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 500], help="Microservices per SAT")
+    parser.add_argument("--sat", type=Path, default=ROOT / "KB" / "stressng_SAT.yaml", help="SAT to scale up")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=8, help="ApplyEngine workers (apply_workers)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake API server latency per request (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--ready-delay", type=float, default=0.05,
+                        help="Mean seconds from a workload change to the workload being ready")
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--translator", choices=("auto", "k3s", "basic"), default="auto")
+    parser.add_argument("--json", type=Path, help="Save the results to this file")
+    parser.add_argument("--compare", type=Path, help="Baseline results saved with --json")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    translator = args.translator
+    if translator == "auto":
+        try:
+            import k3s_client  # noqa: F401
+            translator = "k3s"
+        except ImportError:
+            translator = "basic"
+    print(f"translator: {translator}, API latency {args.latency * 1000:.1f}ms, error rate {args.error_rate:.1%}, "
+          f"ready delay {args.ready_delay * 1000:.0f}ms, {args.workers} apply workers, {args.repeat} repeats")
+
+    options = {"sat": str(args.sat), "seed": args.seed, "repeat": args.repeat, "workers": args.workers,
+               "latency": args.latency, "error_rate": args.error_rate, "error_status": args.error_status,
+               "ready_delay": args.ready_delay, "ready_timeout": args.ready_timeout, "translator": translator}
+    results = []
+    for size in args.sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results.append(pool.submit(run_size, size, options).result())
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": options, "results": results}, f, indent=2)
+        print(f"\nResults saved to {args.json}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
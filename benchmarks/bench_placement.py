@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the placement solver on synthetic clusters.
+
+Generates nodes with random capacities and provider labels, and
+microservices with random node_filter requirements, resource requests
+and Colocation groups drawn from a small set of shapes (as SATs reuse
+Resource templates). Reports the solve time of the indexed solver and
+of a straightforward per-node Python loop for comparison. With --qos,
+nodes also carry price/energy/bandwidth/latency values and services
+QoS weights; the solver then blends in the cached QoS scores.
+
+    python benchmarks/bench_placement.py --sizes 100x100 500x500 1000x1000
+    python benchmarks/bench_placement.py --qos --sizes 1000x1000 5000x5000
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from placement import NodeInfo, Predicate, PlacementSolver, Workload  # noqa: E402
+from qos import QoSScorer, qos_weights  # noqa: E402
+from slo_engine import OPERATORS  # noqa: E402
+
+PROVIDERS = ("sztaki", "edge", "aws", "azure")
+
+
+def make_cluster(num_nodes: int, num_services: int, seed: int, qos: bool = False):
+    rng = random.Random(seed)
+    nodes = [NodeInfo(f"node-{i:05d}", float(rng.choice((2, 4, 8, 16, 32))),
+                      rng.choice((4, 8, 16, 32, 64)) * 1e9,
+                      {"swarmchestrate.eu/provider": rng.choice(PROVIDERS),
+                       "kubernetes.io/hostname": f"node-{i:05d}"},
+                      {"price": rng.uniform(0.01, 2.0), "energy": rng.uniform(5, 200),
+                       "bandwidth": rng.choice((100, 1000, 10000)), "latency": rng.uniform(1, 150)} if qos else {})
+             for i in range(num_nodes)]
+    # A few QoS priority profiles, as services of one SAT share most policies
+    profiles = [qos_weights({objective: rng.random() for objective in ("price", "energy", "bandwidth", "latency")})
+                for _ in range(4)] if qos else [()]
+    shapes = [(Predicate("num-cpus", ">=", float(rng.choice((1, 2, 4)))),
+               Predicate("mem-size", ">", rng.choice((2, 4, 8)) * 1e9),
+               Predicate("provider", "==", rng.choice(PROVIDERS)))
+              for _ in range(8)]
+    workloads = {}
+    for i in range(num_services):
+        replicas = rng.choice((1, 1, 2, 3))
+        workloads[f"svc-{i:05d}"] = Workload(f"svc-{i:05d}", replicas, rng.choice(shapes)[:rng.randint(1, 3)],
+                                             rng.choice((0.1, 0.25, 0.5)) * replicas,
+                                             rng.choice((128, 256, 512)) * 2 ** 20 * replicas,
+                                             rng.choice(profiles))
+    names = sorted(workloads)
+    rng.shuffle(names)
+    # A tenth of the services are colocated in pairs
+    pairs = names[:num_services // 10]
+    groups = [pairs[i:i + 2] for i in range(0, len(pairs), 2)] + [[name] for name in names[len(pairs):]]
+    return nodes, workloads, groups
+
+
+def naive_solve(nodes, workloads, groups):
+    """The same greedy spread placement, filtering every node in Python."""
+    free = {n.name: [n.cpus, n.memory] for n in nodes}
+    counts = {n.name: 0 for n in nodes}
+
+    def satisfies(node, predicate):
+        if predicate.prop == "num-cpus":
+            actual = node.cpus
+        elif predicate.prop == "mem-size":
+            actual = node.memory
+        else:
+            values = [v for k, v in node.labels.items() if predicate.prop in (k, k.rsplit("/", 1)[-1])]
+            return any(OPERATORS[predicate.operator](v, predicate.value) for v in values)
+        return OPERATORS[predicate.operator](actual, predicate.value)
+
+    units = []
+    for unit in groups:
+        cpu = sum(workloads[n].cpu for n in unit)
+        memory = sum(workloads[n].memory for n in unit)
+        units.append((unit, cpu, memory))
+    mean_cpu = statistics.mean(n.cpus for n in nodes)
+    mean_memory = statistics.mean(n.memory for n in nodes)
+    units.sort(key=lambda u: (-(u[1] / mean_cpu + u[2] / mean_memory), u[0][0]))
+    assignments = {}
+    for unit, cpu, memory in units:
+        best = None
+        for node in nodes:
+            if free[node.name][0] < cpu or free[node.name][1] < memory:
+                continue
+            if not all(satisfies(node, p) for name in unit for p in workloads[name].predicates):
+                continue
+            left = ((free[node.name][0] - cpu) / node.cpus + (free[node.name][1] - memory) / node.memory)
+            key = (-left, counts[node.name], node.name)
+            if best is None or key < best[0]:
+                best = (key, node)
+        if best is None:
+            continue
+        node = best[1]
+        free[node.name][0] -= cpu
+        free[node.name][1] -= memory
+        counts[node.name] += 1
+        for name in unit:
+            assignments[name] = node.name
+    return assignments
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["100x100", "500x500", "1000x1000"],
+                        help="NODESxSERVICES cluster sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-naive", action="store_true", help="Skip the pure-Python baseline")
+    parser.add_argument("--qos", action="store_true", help="Score nodes on QoS too (no naive baseline)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.qos:
+        return bench_qos(args)
+
+    print(f"{'nodes':>6} {'services':>8} {'placed':>7} {'indexed':>10} {'naive':>10} {'speedup':>8}")
+    for size in args.sizes:
+        num_nodes, num_services = (int(v) for v in size.lower().split("x"))
+        nodes, workloads, groups = make_cluster(num_nodes, num_services, args.seed)
+        # Building the index is part of every solve: the agent builds it from fresh node data
+        indexed, result = timed(lambda: PlacementSolver(nodes).solve(workloads, groups), args.repeat)
+        line = f"{num_nodes:>6} {num_services:>8} {len(result.assignments):>7} {indexed * 1000:>8.2f}ms"
+        if not args.no_naive:
+            naive, assignments = timed(lambda: naive_solve(nodes, workloads, groups), max(1, args.repeat // 2))
+            if assignments != result.assignments:
+                print(f"  warning: naive and indexed placements differ for {size}")
+            line += f" {naive * 1000:>8.2f}ms {naive / indexed:>7.1f}x"
+        print(line)
+
+
+def bench_qos(args):
+    print(f"{'nodes':>6} {'services':>8} {'placed':>7} {'cold':>10} {'warm':>10} {'per service':>12} {'rank':>9}")
+    for size in args.sizes:
+        num_nodes, num_services = (int(v) for v in size.lower().split("x"))
+        nodes, workloads, groups = make_cluster(num_nodes, num_services, args.seed, qos=True)
+        scorer = QoSScorer()
+        # Cold: the scorer builds its matrix and score vectors; warm: node data unchanged, all cached
+        cold, _ = timed(lambda: PlacementSolver(nodes, scorer=scorer).solve(workloads, groups), 1)
+        warm, result = timed(lambda: PlacementSolver(nodes, scorer=scorer).solve(workloads, groups), args.repeat)
+        weights = next(iter(workloads.values())).qos
+        ranking, _ = timed(lambda: scorer.rank(weights), args.repeat)
+        print(f"{num_nodes:>6} {num_services:>8} {len(result.assignments):>7} {cold * 1000:>8.2f}ms "
+              f"{warm * 1000:>8.2f}ms {warm / num_services * 1e6:>10.1f}us {ranking * 1000:>7.2f}ms")
+    print(f"scorer cache: {scorer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
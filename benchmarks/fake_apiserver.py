@@ -0,0 +1,481 @@
+# fake_apiserver.py
+
+"""
+In-process fake Kubernetes API server for benchmarks.
+
+Serves the small part of the API the agent uses from an in-memory
+store over real HTTP, so the official kubernetes client (and its
+connection pool, serialisation, dynamic discovery and watches) is
+exercised unchanged:
+
+- discovery (/version, /api, /apis, /api/v1, /apis/apps/v1)
+- list (with equality label selectors), get, create, replace, delete
+- server-side apply, JSON merge and strategic merge patches (merged as
+  JSON merge patches), and the Deployment scale subresource
+- watches, streamed from resourceVersion with BOOKMARK-free chunked output
+
+A simple controller marks Deployments, StatefulSets and DaemonSets ready
+`ready_delay` seconds after each spec change, so readiness tracking can
+be measured. Optional per-request latency models a remote API server and
+`error_rate` injects failures into non-discovery requests.
+"""
+
+import copy
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# (group/version, plural, kind, namespaced)
+RESOURCES = [
+    ("v1", "namespaces", "Namespace", False),
+    ("v1", "nodes", "Node", False),
+    ("v1", "persistentvolumes", "PersistentVolume", False),
+    ("v1", "configmaps", "ConfigMap", True),
+    ("v1", "secrets", "Secret", True),
+    ("v1", "services", "Service", True),
+    ("v1", "serviceaccounts", "ServiceAccount", True),
+    ("v1", "persistentvolumeclaims", "PersistentVolumeClaim", True),
+    ("v1", "pods", "Pod", True),
+    ("apps/v1", "deployments", "Deployment", True),
+    ("apps/v1", "statefulsets", "StatefulSet", True),
+    ("apps/v1", "daemonsets", "DaemonSet", True),
+]
+_BY_PLURAL = {(gv, plural): (kind, namespaced) for gv, plural, kind, namespaced in RESOURCES}
+WORKLOAD_KINDS = {"Deployment", "StatefulSet", "DaemonSet"}
+
+_PATH = re.compile(r"^/(?:api/(?P<core>v1)|apis/(?P<group>[^/]+)/(?P<version>[^/]+))"
+                   r"(?:/namespaces/(?P<ns>[^/]+))?/(?P<plural>[^/]+)(?:/(?P<name>[^/]+))?(?:/(?P<sub>scale))?$")
+_DISCOVERY = {"/version", "/api", "/apis", "/api/v1", "/apis/apps/v1"}
+
+Key = Tuple[str, Optional[str], str]
+
+
+class FakeApiServer:
+    """
+    Minimal API server over an in-memory object store.
+
+    Usage:
+        server = FakeApiServer(latency=0.002, ready_delay=0.05).start()
+        api_client = server.api_client()
+        ...
+        server.stop()
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 error_rate: float = 0.0, error_status: int = 500, ready_delay: float = 0.0,
+                 ready_jitter: float = 0.5, seed: int = 1):
+        """
+        Args:
+            latency: Seconds added to every request
+            error_rate: Fraction of non-discovery, non-watch requests failed with `error_status`
+            error_status: HTTP status of injected failures (500, 429, 503, ...)
+            ready_delay: Mean seconds from a workload spec change to the workload being ready
+            ready_jitter: Relative spread of ready_delay (0.5: uniform in [0.5, 1.5] x ready_delay)
+            seed: Seed of the error and readiness randomness
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.ready_delay = ready_delay
+        self.ready_jitter = ready_jitter
+        self.objects: Dict[Key, Dict[str, Any]] = {}
+        # (method, path, monotonic receive time) of every request
+        self.requests: List[Tuple[str, str, float]] = []
+        self.injected_errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._resource_version = 0
+        # (resourceVersion, event type, object) in order, for watches
+        self._events: List[Tuple[int, str, Dict[str, Any]]] = []
+        # (due, sequence, key, generation) of pending readiness transitions
+        self._pending: List[Tuple[float, int, Key, int]] = []
+        self._sequence = itertools.count()
+        self._stopped = threading.Event()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeApiServer":
+        for target, name in ((self._httpd.serve_forever, "fake-apiserver"),
+                             (self._run_controller, "fake-controller")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        with self._changed:
+            self._changed.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def api_client(self):
+        """A kubernetes.client.ApiClient pointed at this server."""
+        from kubernetes import client
+        configuration = client.Configuration()
+        configuration.host = self.url
+        configuration.connection_pool_maxsize = 32
+        return client.ApiClient(configuration)
+
+    def dynamic_client(self, api_client=None, cache_file: Optional[str] = None):
+        """A kubernetes.dynamic.DynamicClient on this server (discovery cached in `cache_file`)."""
+        from kubernetes import dynamic
+        return dynamic.DynamicClient(api_client or self.api_client(), cache_file=cache_file)
+
+    def _next_version(self) -> str:
+        self._resource_version += 1
+        return str(self._resource_version)
+
+    def add_deployment(self, name: str, namespace: str = "default", replicas: int = 1) -> Dict[str, Any]:
+        obj = {
+            "apiVersion": "apps/v1", "kind": "Deployment",
+            "metadata": {"name": name, "namespace": namespace},
+            "spec": {"replicas": replicas, "selector": {"matchLabels": {"app": name}},
+                     "template": {"metadata": {"labels": {"app": name}},
+                                  "spec": {"containers": [{"name": name, "image": "busybox"}]}}},
+            "status": {"replicas": replicas},
+        }
+        with self._lock:
+            return copy.deepcopy(self._store("Deployment", namespace, name, obj, created=True))
+
+    def count(self, method: str, pattern: str = "") -> int:
+        with self._lock:
+            return sum(1 for m, path, _ in self.requests if m == method and pattern in path)
+
+    def request_counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for method, _, _ in self.requests:
+                counts[method] = counts.get(method, 0) + 1
+            return counts
+
+    # Store
+
+    def _store(self, kind: str, namespace: Optional[str], name: str, obj: Dict[str, Any],
+               created: bool = False, spec_changed: bool = True) -> Dict[str, Any]:
+        """Save an object, record its watch event and schedule readiness; lock held."""
+        meta = obj.setdefault("metadata", {})
+        meta["name"] = name
+        if namespace:
+            meta["namespace"] = namespace
+        if created:
+            meta.setdefault("uid", str(uuid.uuid4()))
+            meta.setdefault("creationTimestamp", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            meta["generation"] = 1
+        elif spec_changed:
+            meta["generation"] = meta.get("generation", 1) + 1
+        meta["resourceVersion"] = self._next_version()
+        key = (kind, namespace, name)
+        if kind in WORKLOAD_KINDS and (created or spec_changed):
+            replicas = (obj.get("spec") or {}).get("replicas", 1)
+            obj["status"] = {"observedGeneration": meta["generation"], "replicas": replicas,
+                             "updatedReplicas": 0, "readyReplicas": 0, "availableReplicas": 0}
+            spread = self.ready_delay * self.ready_jitter
+            due = time.monotonic() + max(0.0, self.ready_delay + self._rng.uniform(-spread, spread))
+            heapq.heappush(self._pending, (due, next(self._sequence), key, meta["generation"]))
+        self.objects[key] = obj
+        self._record("ADDED" if created else "MODIFIED", obj)
+        return obj
+
+    def _record(self, event_type: str, obj: Dict[str, Any]) -> None:
+        self._events.append((int(obj["metadata"]["resourceVersion"]), event_type, copy.deepcopy(obj)))
+        self._changed.notify_all()
+
+    def _run_controller(self) -> None:
+        """Mark workloads ready once their readiness delay has passed."""
+        while not self._stopped.is_set():
+            with self._changed:
+                now = time.monotonic()
+                while self._pending and self._pending[0][0] <= now:
+                    _, _, key, generation = heapq.heappop(self._pending)
+                    obj = self.objects.get(key)
+                    if obj is None or obj["metadata"].get("generation") != generation:
+                        continue
+                    obj["status"] = _ready_status(obj)
+                    obj["metadata"]["resourceVersion"] = self._next_version()
+                    self._record("MODIFIED", obj)
+                timeout = (self._pending[0][0] - now) if self._pending else 0.5
+                self._changed.wait(min(max(timeout, 0.001), 0.5))
+
+    # Requests
+
+    def handle(self, method: str, path: str, body: Optional[Dict[str, Any]],
+               query: Optional[Dict[str, str]] = None,
+               content_type: str = "application/json") -> Tuple[int, Dict[str, Any]]:
+        """Serve one non-watch request; returns (status, JSON body)."""
+        query = query or {}
+        with self._lock:
+            self.requests.append((method, path, time.monotonic()))
+            if path in _DISCOVERY:
+                return 200, _discovery(path)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.injected_errors += 1
+                return self.error_status, _status(self.error_status, "InternalError", "injected failure")
+            match = _PATH.match(path)
+            if not match:
+                return 404, _status(404, "NotFound", path)
+            group_version = match["core"] or f"{match['group']}/{match['version']}"
+            if (group_version, match["plural"]) not in _BY_PLURAL:
+                return 404, _status(404, "NotFound", path)
+            kind, namespaced = _BY_PLURAL[(group_version, match["plural"])]
+            namespace = match["ns"] if namespaced else None
+            name = match["name"]
+            if name is None:
+                if method == "GET":
+                    return 200, self._list(kind, group_version, namespace, query.get("labelSelector"))
+                if method == "POST":
+                    return self._create(kind, group_version, namespace, body or {})
+                return 405, _status(405, "MethodNotAllowed", method)
+            return self._item(method, kind, group_version, namespace, name, match["sub"], body, content_type)
+
+    def _list(self, kind: str, group_version: str, namespace: Optional[str],
+              selector: Optional[str]) -> Dict[str, Any]:
+        items = [copy.deepcopy(obj) for (k, ns, _), obj in self.objects.items()
+                 if k == kind and (namespace is None or ns == namespace) and _selects(selector, obj)]
+        return {"apiVersion": group_version, "kind": f"{kind}List",
+                "metadata": {"resourceVersion": str(self._resource_version)}, "items": items}
+
+    def _create(self, kind: str, group_version: str, namespace: Optional[str],
+                body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        name = (body.get("metadata") or {}).get("name")
+        if (kind, namespace, name) in self.objects:
+            return 409, _status(409, "AlreadyExists", f"{kind.lower()} \"{name}\" already exists")
+        obj = {**copy.deepcopy(body), "apiVersion": group_version, "kind": kind}
+        return 201, copy.deepcopy(self._store(kind, namespace, name, obj, created=True))
+
+    def _item(self, method: str, kind: str, group_version: str, namespace: Optional[str], name: str,
+              subresource: Optional[str], body: Optional[Dict[str, Any]],
+              content_type: str) -> Tuple[int, Dict[str, Any]]:
+        key = (kind, namespace, name)
+        obj = self.objects.get(key)
+        if subresource == "scale":
+            if obj is None:
+                return 404, _status(404, "NotFound", f"deployments \"{name}\" not found")
+            if method == "PATCH":
+                replicas = ((body or {}).get("spec") or {}).get("replicas")
+                if replicas is not None and int(replicas) != obj["spec"].get("replicas"):
+                    obj["spec"]["replicas"] = int(replicas)
+                    self._store(kind, namespace, name, obj)
+            elif method != "GET":
+                return 405, _status(405, "MethodNotAllowed", method)
+            return 200, _scale_of(obj)
+
+        if method == "GET":
+            if obj is None:
+                return 404, _status(404, "NotFound", f"{kind.lower()} \"{name}\" not found")
+            return 200, copy.deepcopy(obj)
+        if method == "DELETE":
+            if obj is None:
+                return 404, _status(404, "NotFound", f"{kind.lower()} \"{name}\" not found")
+            del self.objects[key]
+            obj["metadata"]["resourceVersion"] = self._next_version()
+            self._record("DELETED", obj)
+            return 200, _status(200, "", "deleted") | {"status": "Success"}
+        if method not in ("PATCH", "PUT"):
+            return 405, _status(405, "MethodNotAllowed", method)
+
+        body = copy.deepcopy(body or {})
+        if obj is None:
+            if method == "PUT" or "apply-patch" not in content_type:
+                return 404, _status(404, "NotFound", f"{kind.lower()} \"{name}\" not found")
+            obj = {**body, "apiVersion": group_version, "kind": kind}
+            return 201, copy.deepcopy(self._store(kind, namespace, name, obj, created=True))
+
+        before = copy.deepcopy(obj.get("spec"))
+        if method == "PUT":
+            updated = {**body, "apiVersion": group_version, "kind": kind, "status": obj.get("status")}
+            updated["metadata"] = {**obj["metadata"], **(body.get("metadata") or {})}
+        else:
+            # Server-side apply and strategic merge are both merged as JSON merge patches here
+            body.pop("status", None)
+            updated = _merge(copy.deepcopy(obj), body)
+        spec_changed = updated.get("spec") != before
+        if updated == obj:
+            return 200, copy.deepcopy(obj)
+        return 200, copy.deepcopy(self._store(kind, namespace, name, updated, spec_changed=spec_changed))
+
+    def watch(self, path: str, query: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        """Watch events after `resourceVersion` until `timeoutSeconds` or stop()."""
+        match = _PATH.match(path)
+        if not match or match["name"]:
+            return
+        group_version = match["core"] or f"{match['group']}/{match['version']}"
+        kind, namespaced = _BY_PLURAL.get((group_version, match["plural"]), (None, False))
+        namespace = match["ns"] if namespaced else None
+        selector = query.get("labelSelector")
+        deadline = time.monotonic() + float(query.get("timeoutSeconds") or 300)
+        with self._lock:
+            self.requests.append(("WATCH", path, time.monotonic()))
+            since = int(query.get("resourceVersion") or self._resource_version)
+        position = 0
+        while not self._stopped.is_set() and time.monotonic() < deadline:
+            with self._changed:
+                while position < len(self._events) and self._events[position][0] <= since:
+                    position += 1
+                if position >= len(self._events):
+                    self._changed.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+                    continue
+                batch = self._events[position:]
+                position = len(self._events)
+            for version, event_type, obj in batch:
+                since = version
+                meta = obj["metadata"]
+                if obj.get("kind") != kind or (namespace and meta.get("namespace") != namespace):
+                    continue
+                if _selects(selector, obj):
+                    yield {"type": event_type, "object": obj}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; avoid Nagle + delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def _serve(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                url = urlsplit(self.path)
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                if server.latency:
+                    time.sleep(server.latency)
+                if method == "GET" and query.get("watch") in ("true", "True", "1"):
+                    return self._stream(url.path, query)
+                status, payload = server.handle(method, url.path, body, query,
+                                                self.headers.get("Content-Type") or "application/json")
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, path: str, query: Dict[str, str]):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for event in server.watch(path, query):
+                        data = json.dumps(event).encode() + b"\n"
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_PATCH(self):
+                self._serve("PATCH")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def do_PUT(self):
+                self._serve("PUT")
+
+            def do_DELETE(self):
+                self._serve("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _merge(target: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON merge patch (RFC 7386): maps merge, None deletes, anything else replaces."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+
+def _selects(selector: Optional[str], obj: Dict[str, Any]) -> bool:
+    """Equality-based label selectors: "a=b", "a==b", "a!=b" and "a", comma separated."""
+    if not selector:
+        return True
+    labels = (obj.get("metadata") or {}).get("labels") or {}
+    for term in selector.split(","):
+        term = term.strip()
+        if "!=" in term:
+            label, value = term.split("!=", 1)
+            if labels.get(label.strip()) == value.strip():
+                return False
+        elif "=" in term:
+            label, value = term.replace("==", "=").split("=", 1)
+            if labels.get(label.strip()) != value.strip():
+                return False
+        elif term and term not in labels:
+            return False
+    return True
+
+
+def _ready_status(obj: Dict[str, Any]) -> Dict[str, Any]:
+    generation = obj["metadata"]["generation"]
+    if obj["kind"] == "DaemonSet":
+        return {"observedGeneration": generation, "desiredNumberScheduled": 1,
+                "updatedNumberScheduled": 1, "numberAvailable": 1, "numberReady": 1}
+    replicas = (obj.get("spec") or {}).get("replicas", 1)
+    return {"observedGeneration": generation, "replicas": replicas, "updatedReplicas": replicas,
+            "readyReplicas": replicas, "availableReplicas": replicas}
+
+
+def _scale_of(obj: Dict[str, Any]) -> Dict[str, Any]:
+    meta = obj["metadata"]
+    return {"apiVersion": "autoscaling/v1", "kind": "Scale",
+            "metadata": {"name": meta["name"], "namespace": meta["namespace"],
+                         "resourceVersion": meta["resourceVersion"]},
+            "spec": {"replicas": obj["spec"]["replicas"]},
+            "status": {"replicas": (obj.get("status") or {}).get("replicas", 0),
+                       "selector": f"app={meta['name']}"}}
+
+
+def _discovery(path: str) -> Dict[str, Any]:
+    if path == "/version":
+        return {"major": "1", "minor": "31", "gitVersion": "v1.31.0-fake", "platform": "linux/amd64"}
+    if path == "/api":
+        return {"kind": "APIVersions", "versions": ["v1"], "serverAddressByClientCIDRs": []}
+    if path == "/apis":
+        version = {"groupVersion": "apps/v1", "version": "v1"}
+        return {"kind": "APIGroupList", "apiVersion": "v1",
+                "groups": [{"name": "apps", "versions": [version], "preferredVersion": version}]}
+    group_version = path.split("/", 2)[2]
+    resources = []
+    for gv, plural, kind, namespaced in RESOURCES:
+        if gv != group_version:
+            continue
+        resources.append({"name": plural, "singularName": kind.lower(), "namespaced": namespaced, "kind": kind,
+                          "verbs": ["create", "delete", "get", "list", "patch", "update", "watch"]})
+        if kind == "Deployment":
+            resources.append({"name": f"{plural}/scale", "singularName": "", "namespaced": True,
+                              "kind": "Scale", "group": "autoscaling", "version": "v1",
+                              "verbs": ["get", "patch", "update"]})
+    return {"kind": "APIResourceList", "groupVersion": group_version, "resources": resources}
+
+
+def _status(code: int, reason: str, message: str) -> Dict[str, Any]:
+    return {"apiVersion": "v1", "kind": "Status", "status": "Failure",
+            "code": code, "reason": reason, "message": message}
@@ -1,25 +1,91 @@
 #!/usr/bin/env python3
 
 import argparse
-import json
 import shutil
 import subprocess
 from pathlib import Path
 
+import yaml
+
 from utility import generate_tosca_configmap as write_tosca_configmap
 from utility import generate_swarm_configmap as write_swarm_configmap
-
-
-def get_k8s_node_names():
-    result = subprocess.run(
-        ["kubectl", "get", "nodes", "-o", "json"],
-        check=True,
-        capture_output=True,
+from utility import generate_swarm_base_configmap as write_swarm_base_configmap
+from utility import TOSCA_DIGEST_LABEL, TOSCA_PART_LABEL
+
+FIELD_MANAGER = "swarm-agent-generator"
+
+
+def iter_k8s_node_names(page_size=500):
+    """
+    Yield the cluster's node names a page at a time (list calls with
+    limit/continue), through the kubernetes client when it is installed,
+    else through kubectl.
+    """
+    try:
+        from kubernetes import client, config
+    except ImportError:
+        yield from _iter_kubectl_node_names(page_size)
+        return
+
+    try:
+        config.load_kube_config()
+    except Exception:
+        config.load_incluster_config()
+    api = client.CoreV1Api()
+    token = None
+    while True:
+        page = api.list_node(limit=page_size, _continue=token)
+        for item in page.items:
+            yield item.metadata.name
+        token = page.metadata._continue
+        if not token:
+            return
+
+
+def _iter_kubectl_node_names(page_size):
+    process = subprocess.Popen(
+        ["kubectl", "get", "nodes", "-o", "name", f"--chunk-size={page_size}"],
+        stdout=subprocess.PIPE,
         text=True,
     )
+    with process.stdout:
+        for line in process.stdout:
+            line = line.strip()
+            if line:
+                yield line.split("/", 1)[-1]
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, process.args)
+
+
+def get_k8s_node_names(page_size=500):
+    return list(iter_k8s_node_names(page_size))
+
+
+def load_overrides(path):
+    """Node name -> config fields, from a YAML mapping."""
+    with open(path, "r", encoding="utf-8") as f:
+        overrides = yaml.safe_load(f) or {}
+    if not isinstance(overrides, dict) or not all(isinstance(v, dict) for v in overrides.values()):
+        raise ValueError(f"{path} must map node names to config fields")
+    return overrides
+
 
-    data = json.loads(result.stdout)
-    return [item["metadata"]["name"] for item in data["items"]]
+def apply_output(output_dir, dry_run=False, sat_digest=None, namespace="swarm-system"):
+    """
+    Apply every generated manifest with one server-side kubectl apply.
+
+    With `sat_digest` (a packaged SAT), part ConfigMaps of other SAT
+    versions are deleted afterwards.
+    """
+    command = ["kubectl", "apply", "--server-side", "--force-conflicts",
+               f"--field-manager={FIELD_MANAGER}", "-f", str(output_dir)]
+    if dry_run:
+        command.append("--dry-run=server")
+    subprocess.run(command, check=True)
+
+    if sat_digest and not dry_run:
+        subprocess.run(["kubectl", "delete", "configmap", "-n", namespace, "--ignore-not-found",
+                        "-l", f"{TOSCA_PART_LABEL},{TOSCA_DIGEST_LABEL}!={sat_digest[:12]}"], check=True)
 
 
 def copy_base_k3s_yamls(k3s_dir, output_dir):
@@ -50,13 +116,25 @@ def generate_configs(
     leader=None,
     output_base="../output",
     k3s_dir="../k3s",
+    layout="base",
+    overrides_path=None,
+    page_size=500,
+    apply=False,
+    dry_run=False,
+    compress=False,
+    part_size=None,
 ):
     tosca_path = Path(tosca_path)
 
     if not tosca_path.exists():
         raise FileNotFoundError(f"TOSCA file not found: {tosca_path}")
 
-    node_names = get_k8s_node_names()
+    overrides = load_overrides(overrides_path) if overrides_path else {}
+    if overrides and layout != "base":
+        raise ValueError("--overrides needs --layout base")
+
+    # Only names are kept, never the full Node objects
+    node_names = get_k8s_node_names(page_size)
 
     if not node_names:
         raise RuntimeError("No Kubernetes nodes found")
@@ -64,16 +142,17 @@ def generate_configs(
     if leader is None:
         leader = node_names[0]
 
-    if leader not in node_names:
+    known = set(node_names)
+    if leader not in known:
         raise ValueError(
             f"Leader '{leader}' is not a Kubernetes node. "
-            f"Available nodes: {node_names}"
+            f"Available nodes: {node_names[:20]}{' ...' if len(node_names) > 20 else ''}"
         )
+    unknown = sorted(set(overrides) - known)
+    if unknown:
+        print(f"[WARNING] Overrides for nodes not in the cluster: {unknown}")
 
-    resource_input = {
-        "LEADER": leader,
-        "Worker": [node for node in node_names if node != leader],
-    }
+    workers = [node for node in node_names if node != leader]
 
     output_dir = Path(output_base) / f"cluster_{job_id}"
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -86,24 +165,38 @@ def generate_configs(
     tosca_configmap_path = output_dir / "03-configmap-swarm-agent-tosca.yaml"
     swarm_configmap_path = output_dir / "04-configmap-swarm-agent-config.yaml"
 
-    write_tosca_configmap(
+    sat_digest = write_tosca_configmap(
         str(tosca_path),
         output_file=str(tosca_configmap_path),
+        compress=compress,
+        part_size=part_size,
     )
 
-    write_swarm_configmap(
-        resource_input,
-        application_id=job_id,
-        output_file=str(swarm_configmap_path),
-        ra_ip=hub_ra_ip,
-    )
+    if layout == "base":
+        write_swarm_base_configmap(
+            leader,
+            application_id=job_id,
+            ra_ip=hub_ra_ip,
+            overrides=overrides,
+            output_file=str(swarm_configmap_path),
+        )
+    else:
+        write_swarm_configmap(
+            {"LEADER": leader, "Worker": workers},
+            application_id=job_id,
+            output_file=str(swarm_configmap_path),
+            ra_ip=hub_ra_ip,
+        )
 
     print("Generated configs successfully")
     print(f"Output folder: {output_dir}")
     print(f"TOSCA ConfigMap: {tosca_configmap_path}")
-    print(f"Swarm ConfigMap: {swarm_configmap_path}")
+    print(f"Swarm ConfigMap: {swarm_configmap_path} ({layout} layout)")
     print(f"Leader: {leader}")
-    print(f"Workers: {resource_input['Worker']}")
+    print(f"Workers: {len(workers)}")
+
+    if apply:
+        apply_output(output_dir, dry_run=dry_run, sat_digest=sat_digest)
 
 
 def main():
@@ -117,6 +210,21 @@ def main():
     parser.add_argument("--leader", default=None)
     parser.add_argument("--output-base", default="../output")
     parser.add_argument("--k3s-dir", default="../k3s")
+    parser.add_argument("--layout", choices=("base", "per-node"), default="base",
+                        help="base: one shared config plus per-node overrides; "
+                             "per-node: a config file per node (small clusters)")
+    parser.add_argument("--overrides", default=None,
+                        help="YAML mapping node names to config fields that differ from the base")
+    parser.add_argument("--page-size", type=int, default=500,
+                        help="Nodes fetched per list call")
+    parser.add_argument("--apply", action="store_true",
+                        help="Apply the generated manifests to the cluster in one server-side apply")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --apply, validate against the API server without persisting")
+    parser.add_argument("--compress", action="store_true",
+                        help="Package the SAT as gzip binaryData, split across ConfigMaps when large")
+    parser.add_argument("--part-size", type=int, default=None,
+                        help="With --compress, compressed bytes per ConfigMap")
 
     args = parser.parse_args()
 
@@ -127,6 +235,13 @@ def main():
         leader=args.leader,
         output_base=args.output_base,
         k3s_dir=args.k3s_dir,
+        layout=args.layout,
+        overrides_path=args.overrides,
+        page_size=args.page_size,
+        apply=args.apply,
+        dry_run=args.dry_run,
+        compress=args.compress,
+        part_size=args.part_size,
     )
 
 
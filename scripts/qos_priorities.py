@@ -0,0 +1 @@
+../src/qos_priorities.py
\ No newline at end of file
@@ -1,7 +1,14 @@
 # utility.py
-import yaml
+import base64
+import hashlib
+import json
+import zlib
 from pathlib import Path
 
+import yaml
+
+from qos_priorities import extract_qos_priorities  # noqa: F401
+
 """
 
 Utility functions for YAML handling
@@ -48,41 +55,6 @@ def get_resource_capacity(capacity_config_path, res_id):
 
     return cpu, memory
 
-def extract_qos_priorities(qos_data):
-    qos_priority = {}
-
-    if not qos_data:
-        return qos_priority
-
-    # Case 1: qos_data is already a dict:
-    # {"bandwidth": {...}, "cost": {...}, "energy": {...}}
-    if isinstance(qos_data, dict):
-        iterator = qos_data.items()
-
-    # Case 2: qos_data is a list:
-    # [{"bandwidth": {...}}, {"cost": {...}}]
-    elif isinstance(qos_data, list):
-        iterator = []
-        for item in qos_data:
-            if isinstance(item, dict):
-                iterator.extend(item.items())
-    else:
-        print(f"[WARNING] Unexpected QoS format: {type(qos_data)}")
-        return qos_priority
-
-    for key, val in iterator:
-        if not isinstance(val, dict):
-            continue
-
-        priority = val.get("priority")
-        if priority is None:
-            priority = val.get("properties", {}).get("priority")
-
-        if priority is not None:
-            normalized_key = "price" if key == "cost" else key
-            qos_priority[normalized_key] = priority
-
-    return qos_priority
 
 def generate_tosca_configmap(
     tosca_path: str,
@@ -90,10 +62,18 @@ def generate_tosca_configmap(
     configmap_name: str = "swarm-agent-tosca",
     namespace: str = "swarm-system",
     key_prefix: str = "tosca-",
-) -> None:
+    compress: bool = False,
+    part_size: int = None,
+):
     """
     Read a TOSCA/manifest file from `tosca_path` and wrap it into a
     Kubernetes ConfigMap using block-style `|` under data:.
+
+    The file is streamed line by line. With `compress`, it is packaged
+    as gzip binaryData instead (see generate_tosca_package).
+
+    Returns:
+        The SAT's sha256 when compressed, else None
     """
 
     path = Path(tosca_path)
@@ -101,88 +81,231 @@ def generate_tosca_configmap(
     if not path.is_file():
         raise FileNotFoundError(f"TOSCA file not found: {tosca_path}")
 
-    # Read the original TOSCA / manifest content
-    with path.open("r", encoding="utf-8") as f:
-        content = f.read().rstrip("\n")
+    if compress:
+        return generate_tosca_package(tosca_path, output_file, configmap_name, namespace,
+                                      part_size or TOSCA_PART_SIZE)
 
     # Key name inside data: (e.g. tosca-lead-worker.yaml)
     #key_name = f"{key_prefix}{path.name}"
     key_name = "tosca.yaml"
-    lines = []
-    lines.append("apiVersion: v1")
-    lines.append("kind: ConfigMap")
-    lines.append("metadata:")
-    lines.append(f"  name: {configmap_name}")
-    lines.append(f"  namespace: {namespace}")
-    lines.append("data:")
-    lines.append(f"  {key_name}: |")
 
-    # Indent each line of the file content by 4 spaces (2 for data key, 2 more for block content)
-    for line in content.splitlines():
-        lines.append(f"    {line}")
-
-    final_yaml = "\n".join(lines) + "\n"
-
-    with open(output_file, "w", encoding="utf-8") as f:
-        f.write(final_yaml)
+    with path.open("r", encoding="utf-8") as src, open(output_file, "w", encoding="utf-8") as out:
+        write_configmap_header(out, configmap_name, namespace)
+        out.write(f"  {key_name}: |\n")
+        # Indent each line of the file content by 4 spaces (2 for data key, 2 more for block content)
+        for line in src:
+            line = line.rstrip("\n")
+            out.write(f"    {line}\n" if line else "\n")
 
+    check_configmap_size(output_file)
     print(f"✅ TOSCA ConfigMap written to: {output_file}")
     print(f"   - data key: {key_name}")
     print(f"   - source file: {tosca_path}")
 
+
+# Packaged SATs; the agent side lives in src/sat_package.py
+TOSCA_MANIFEST_KEY = "tosca.manifest.json"
+TOSCA_PART_KEY = "tosca.yaml.gz.{index:03d}"
+TOSCA_PART_LABEL = "swarmchestrate.eu/sat-part-of"
+TOSCA_DIGEST_LABEL = "swarmchestrate.eu/sat-digest"
+# Compressed bytes per ConfigMap; base64 and metadata stay under the 1 MiB limit
+TOSCA_PART_SIZE = 700 * 1024
+READ_BLOCK = 64 * 1024
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def _iter_gzip_parts(path, part_size):
+    """Gzip the file as a stream and yield the output in `part_size` pieces."""
+    # wbits 16+ writes a gzip header with no timestamp, so equal SATs give equal parts
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = bytearray()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK), b""):
+            pending += compressor.compress(block)
+            while len(pending) >= part_size:
+                yield bytes(pending[:part_size])
+                del pending[:part_size]
+    pending += compressor.flush()
+    while len(pending) > part_size:
+        yield bytes(pending[:part_size])
+        del pending[:part_size]
+    yield bytes(pending)
+
+
+def _write_binary_configmap(out, name, namespace, key, data, labels=None, manifest=None):
+    out.write("---\n"
+              "apiVersion: v1\n"
+              "kind: ConfigMap\n"
+              "metadata:\n"
+              f"  name: {name}\n"
+              f"  namespace: {namespace}\n")
+    if labels:
+        out.write("  labels:\n")
+        for label, value in labels.items():
+            out.write(f'    {label}: "{value}"\n')
+    if manifest is not None:
+        out.write("data:\n"
+                  f"  {TOSCA_MANIFEST_KEY}: |\n"
+                  f"    {json.dumps(manifest, sort_keys=True)}\n")
+    out.write("binaryData:\n"
+              f"  {key}: {base64.b64encode(data).decode('ascii')}\n")
+
+
+def generate_tosca_package(tosca_path, output_file, configmap_name="swarm-agent-tosca",
+                           namespace="swarm-system", part_size=TOSCA_PART_SIZE):
+    """
+    Package a SAT as gzip binaryData, split across ConfigMaps when large.
+
+    `configmap_name` holds the manifest (SAT digest and size, and the hash
+    of every part) and the last part. Earlier parts go to ConfigMaps named
+    after the SAT digest, written first so that the manifest never refers
+    to parts that are not there yet. The agent reads the mounted part and
+    fetches the others through the API. Only one part is held in memory.
+
+    Returns:
+        The SAT's sha256
+    """
+    digest, size = _file_sha256(tosca_path)
+    parts = []
+    compressed_size = 0
+    with open(output_file, "w", encoding="utf-8") as out:
+        previous = None
+        for data in _iter_gzip_parts(tosca_path, part_size):
+            if previous is not None:
+                index = len(parts)
+                part = {"configmap": f"{configmap_name}-{digest[:12]}-{index}",
+                        "key": TOSCA_PART_KEY.format(index=index),
+                        "sha256": hashlib.sha256(previous).hexdigest(), "size": len(previous)}
+                _write_binary_configmap(out, part["configmap"], namespace, part["key"], previous,
+                                        labels={TOSCA_PART_LABEL: configmap_name,
+                                                TOSCA_DIGEST_LABEL: digest[:12]})
+                parts.append(part)
+                compressed_size += len(previous)
+            previous = data
+
+        index = len(parts)
+        last = {"configmap": configmap_name, "key": TOSCA_PART_KEY.format(index=index),
+                "sha256": hashlib.sha256(previous).hexdigest(), "size": len(previous)}
+        parts.append(last)
+        compressed_size += len(previous)
+        manifest = {"version": 1, "encoding": "gzip", "digest": digest, "size": size,
+                    "namespace": namespace, "parts": parts}
+        _write_binary_configmap(out, configmap_name, namespace, last["key"], previous, manifest=manifest)
+
+    print(f"✅ TOSCA package written to: {output_file}")
+    print(f"   - {size} bytes, {compressed_size} compressed, {len(parts)} ConfigMaps")
+    print(f"   - digest: {digest}")
+    return digest
+
+
 #!/usr/bin/env python3
 
+# Kubernetes rejects objects larger than this
+CONFIGMAP_LIMIT = 1024 * 1024
+
+
+def swarm_config_block(application_id, ra_ip, sa_id=None, role=None, resource_id=None):
+    """Swarm Agent config fields; the per-node ones are left out when not given."""
+    fields = []
+    if sa_id is not None:
+        fields += [f'SA_id: "{sa_id}"', f'SA_role: "{role}"']
+    fields += [
+        'password: "secure_password_123"',
+        'universe_id: "universe_prod_001"',
+        f'app_id: "{application_id}"',
+    ]
+    if resource_id is not None:
+        fields.append(f'resource_id: "{resource_id}"')
+    fields += [
+        'api_ip: "ra-service.swarm-system.svc.cluster.local"',
+        "api_port: 8080",
+        f'p2p_public_ip: "{ra_ip}"',
+        "p2p_public_port: 5000",
+        'p2p_listen_ip: "127.0.0.1"',
+        "p2p_listen_port: 5000",
+    ]
+    return "\n".join(fields) + "\n"
+
+
+def write_configmap_header(out, name, namespace="swarm-system"):
+    out.write("apiVersion: v1\n"
+              "kind: ConfigMap\n"
+              "metadata:\n"
+              f"  name: {name}\n"
+              f"  namespace: {namespace}\n"
+              "data:\n")
+
+
+def write_configmap_entry(out, key, text):
+    """Write one block-style data entry, a line at a time."""
+    out.write(f"  {key}: |\n")
+    for line in text.splitlines():
+        out.write(f"    {line}\n" if line else "\n")
+
+
+def check_configmap_size(path):
+    size = Path(path).stat().st_size
+    if size > CONFIGMAP_LIMIT * 0.9:
+        print(f"[WARNING] {path} is {size} bytes, close to the {CONFIGMAP_LIMIT} byte ConfigMap limit")
+    return size
+
+
 def generate_swarm_configmap(resource_dict, application_id, ra_ip, output_file="swarm-config.yaml"):
+    """
+    One config file per node (config-<node>.yaml) in the swarm-agent-config
+    ConfigMap. Written as it goes; grows with the cluster, see
+    generate_swarm_base_configmap for large clusters.
+    """
     leader_name = resource_dict.get("LEADER")
     workers = resource_dict.get("Worker", [])
 
-    def make_block(sa_id, role, resource_id):
-        return f"""SA_id: "{sa_id}"
-SA_role: "{role}"
-password: "secure_password_123"
-universe_id: "universe_prod_001"
-app_id: "{application_id}"
-resource_id: "{resource_id}"
-api_ip: "ra-service.swarm-system.svc.cluster.local"
-api_port: 8080
-p2p_public_ip: "{ra_ip}"
-p2p_public_port: 5000
-p2p_listen_ip: "127.0.0.1"
-p2p_listen_port: 5000
-
-"""
+    with open(output_file, "w") as f:
+        write_configmap_header(f, "swarm-agent-config")
 
-    lines = []
-    lines.append("apiVersion: v1")
-    lines.append("kind: ConfigMap")
-    lines.append("metadata:")
-    lines.append("  name: swarm-agent-config")
-    lines.append("  namespace: swarm-system")
-    lines.append("data:")
+        # ✅ Leader
+        if leader_name:
+            write_configmap_entry(f, f"config-{leader_name}.yaml",
+                                  swarm_config_block(application_id, ra_ip, f"SA-{leader_name}", "leader", leader_name))
 
-    # ✅ Leader
-    if leader_name:
-        filename = f"config-{leader_name}.yaml"
-        sa_id = f"SA-{leader_name}"
-        block = make_block(sa_id, "leader", leader_name)
+        # ✅ Workers
+        for worker in workers:
+            write_configmap_entry(f, f"config-{worker}.yaml",
+                                  swarm_config_block(application_id, ra_ip, f"SA-{worker}", "worker", worker))
 
-        lines.append(f"  {filename}: |")
-        for line in block.splitlines():
-            lines.append(f"    {line}")
+    check_configmap_size(output_file)
+    print(f"✅ Correct block-style ConfigMap written to: {output_file}")
 
-    # ✅ Workers
-    for worker in workers:
-        filename = f"config-{worker}.yaml"
-        sa_id = f"SA-{worker}"
-        block = make_block(sa_id, "worker", worker)
 
-        lines.append(f"  {filename}: |")
-        for line in block.splitlines():
-            lines.append(f"    {line}")
+def generate_swarm_base_configmap(leader, application_id, ra_ip, overrides=None, output_file="swarm-config.yaml"):
+    """
+    One shared base.yaml in the swarm-agent-config ConfigMap, whatever the
+    cluster size. Each agent derives SA_id, SA_role and resource_id from its
+    node name and the `leader` entry, then applies its entry of
+    `node_overrides` (only for the nodes given in `overrides`).
 
-    final_yaml = "\n".join(lines) + "\n"
+    Args:
+        leader: Leader node name
+        application_id: Application (job) id
+        ra_ip: Hub RA IP
+        overrides: Optional node name -> dict of config fields for that node
+        output_file: Output YAML file
+    """
+    base = f'leader: "{leader}"\n' + swarm_config_block(application_id, ra_ip)
+    if overrides:
+        base += yaml.safe_dump({"node_overrides": overrides}, sort_keys=True)
 
     with open(output_file, "w") as f:
-        f.write(final_yaml)
+        write_configmap_header(f, "swarm-agent-config")
+        write_configmap_entry(f, "base.yaml", base)
 
-    print(f"✅ Correct block-style ConfigMap written to: {output_file}")
+    check_configmap_size(output_file)
+    print(f"✅ Base ConfigMap written to: {output_file} ({len(overrides or {})} node overrides)")
@@ -2,24 +2,47 @@ from base64 import b64encode
 import json, os
 import sys
 
-from kubernetes import client, config, utils
-from kubernetes.client import ApiClient
 import subprocess
 
 import yaml
 import logging
 import asyncio
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 from utility import load_configuration
-from swchp2pcom import SwchPeer
-import threading
-from twisted.internet import reactor
+from startup_profile import PROFILER
+from metrics import (EVENT_LOOP_LAG, MANIFEST_CACHE_LOOKUPS, P2P_DROPPED, P2P_QUEUE_DEPTH, READY,
+                     RECONCILE_LAG, RECONCILE_QUEUE_DEPTH, STARTUP_PHASE_SECONDS, TRANSLATION_SECONDS,
+                     MetricsServer)
+from manifest_cache import ManifestCache
+from sharding import shard_manifests
+from p2p_bootstrap import (MSG_PEER_ENDPOINT, JoinError, PeerCache, WILDCARD_IPS, bootstrap_candidates,
+                           format_endpoint, join_with_retry, parse_endpoint)
+from p2p_dispatch import PeerDispatcher, transport_pending_bytes
+from sat_transfer import (ChunkAssembler, ChunkedPayload, DEFAULT_CHUNK_SIZE, DEFAULT_FANOUT,
+                          MSG_SAT_CHUNK, MSG_SAT_OFFER, MSG_SAT_PULL, MSG_SAT_WANT, relay_tree)
+from sat_package import SATPackageError, is_package, unpack
+import time
+
+# kubernetes, k3s_client (translator), ruamel.yaml, twisted and swchp2pcom
+# are imported where they are first needed: a cached translation never
+# loads the translator and a P2P-less agent never loads twisted.
+if TYPE_CHECKING:
+    from kubernetes import client
+    from swchp2pcom import SwchPeer
+    from readiness import RolloutTracker
+    from app_state import ApplicationStateCache
+    from apply_engine import ApplyEngine
+    from reconcile import Reconciler
+    from slo_engine import SLOEngine
+    from autoscaler import Autoscaler
+    from qos import QoSScorer
+    from placement import NodeInfo
+    from migration import MigrationController
+    from watch_cache import WatchCache
 
 
 #from sardou.manifestGenerator import get_kubernetes_manifest
-from k3s_client.utils.manifest import get_kubernetes_manifest
 #from k3s_client.api.applications import ApplicationManager
-from ruamel.yaml import YAML
 from io import StringIO
 from pathlib import Path
 
@@ -32,7 +55,34 @@ from pathlib import Path
 # )
 
 logger = logging.getLogger("SwarmAgent") 
-def ensure_namespace(v1: client.CoreV1Api, ns: str):
+
+# Config keys that take effect without a restart when the config ConfigMap changes
+HOT_RELOAD_KEYS = frozenset({
+    'sharded_deploy', 'status_interval', 'heartbeat_interval', 'apply_workers', 'manifest_debug_path',
+    'reconcile_interval', 'reconcile_qps', 'reconcile_burst', 'reconcile_max_backoff',
+    'reload_interval', 'reload_debounce',
+    'placement_enabled', 'placement_strategy', 'placement_mode', 'placement_capacity_file',
+    'placement_qos_weight', 'migration_slo_after', 'migration_cooldown',
+    'migration_prepull_timeout', 'migration_rollout_timeout',
+})
+
+
+def install_asyncio_reactor(loop: asyncio.AbstractEventLoop):
+    """
+    Install Twisted's asyncio reactor on `loop` and return it.
+
+    Must run before anything imports twisted.internet.reactor, so the
+    P2P layer shares the agent's event loop instead of a reactor thread.
+    """
+    if "twisted.internet.reactor" not in sys.modules:
+        from twisted.internet import asyncioreactor
+        asyncioreactor.install(loop)
+    from twisted.internet import reactor
+    return reactor
+
+
+def ensure_namespace(v1: "client.CoreV1Api", ns: str):
+    from kubernetes import client
     print("ensure_namespace_1")
     try:
         v1.read_namespace(ns)
@@ -43,8 +93,9 @@ def ensure_namespace(v1: client.CoreV1Api, ns: str):
             raise
     print("ensure_namespace_2")
 
-def ensure_docker_registry_secret(v1: client.CoreV1Api, ns: str, name: str,
+def ensure_docker_registry_secret(v1: "client.CoreV1Api", ns: str, name: str,
                                   server: str, username: str, password: str, email: str = "unused@example.com"):
+    from kubernetes import client
     log = logger
     log.info("Ensuring image pull secret %s in ns %s (server=%s, user=%s)", name, ns, server, username)
     dockercfg = {
@@ -90,14 +141,42 @@ class SwarmAgent:
         self.logger = logging.getLogger("SwarmAgent")
         self.config: Optional[Dict[str, Any]] = None
         self.is_running = False
-        self.p2p_agent: Optional[SwchPeer] = None
+        self.p2p_agent: Optional["SwchPeer"] = None
+        self.dispatcher: Optional[PeerDispatcher] = None
+        # Event loop state, set up by run()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.reactor = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # Translated manifests, handed from translation straight to deployment
+        self.manifests: List[Dict[str, Any]] = []
+        self.rollout_tracker: Optional["RolloutTracker"] = None
+        self.state_cache: Optional["ApplicationStateCache"] = None
+        self.dynamic_client = None
+        self.namespace = "default"
+        # This agent's share of the manifests and the engine that applied them
+        self.desired_manifests: List[Dict[str, Any]] = []
+        self.apply_engine: Optional["ApplyEngine"] = None
+        self.reconciler: Optional["Reconciler"] = None
+        # Node QoS scores, reused across placements while node data is unchanged
+        self._qos_scorer: Optional["QoSScorer"] = None
+        # Service -> node moves made by the migration controller; placement keeps them
+        self.migrations: Dict[str, str] = {}
+        # Deployment -> node, from the live Deployments' migrated-to annotation
+        self._migrated_nodes: Dict[str, str] = {}
+        self.migration: Optional["MigrationController"] = None
+        self._node_watch: Optional["WatchCache"] = None
 
         # Load configuration
-        self.config = load_configuration(config_path)
+        with PROFILER.phase("config"):
+            self.config = load_configuration(config_path)
         if not self.config:
             raise ValueError("Failed to load configuration")
         #self.tosca = load_configuration(tosca_path)
+        self.config_path = config_path
         self.tosca_path = tosca_path
+        # A gzip-packaged SAT (tosca.manifest.json) is unpacked into the SAT store at startup
+        self.sat_package_path: Optional[str] = tosca_path if is_package(tosca_path) else None
         # Extract configuration values
         self.sa_id = self.config['SA_id']
         self.password = self.config['password']
@@ -111,9 +190,460 @@ class SwarmAgent:
         self.app_id = self.config['app_id']
         self.resource_id = self.config['resource_id']
         self.sa_role = self.config['SA_role']
+        # Each agent deploys the share of the application placed on its own node
+        self.node_name = os.getenv("NODE_NAME") or self.resource_id
+        self.p2p_enabled = self.config.get('p2p_enabled', False)
+        # Join through the bootstrap and any cached peers at once, first to accept wins
+        self.p2p_bootstrap = [parse_endpoint(e) for e in self.config.get('p2p_bootstrap', [])]
+        self.p2p_join_deadline = float(self.config.get('p2p_join_deadline', 60))
+        self.p2p_join_attempt_timeout = float(self.config.get('p2p_join_attempt_timeout', 10))
+        self.p2p_join_backoff = float(self.config.get('p2p_join_backoff', 1))
+        self.p2p_join_max_backoff = float(self.config.get('p2p_join_max_backoff', 15))
+        self.p2p_join_cached_peers = int(self.config.get('p2p_join_cached_peers', 8))
+        self.peer_cache = PeerCache(self.config.get('p2p_peer_cache', "/var/cache/swarm-agent/peers.json"))
+        self._peer_cache_save: Optional[asyncio.TimerHandle] = None
+        self._endpoint_sent: set = set()
+        self.heartbeat_path = self.config.get('heartbeat_path', "/tmp/swarm-agent.heartbeat")
+        self._apply_runtime_settings()
+        # Follow the mounted config and SAT ConfigMaps instead of needing a pod restart
+        self.hot_reload = self.config.get('hot_reload', True)
+        # The LSA evaluates the SAT's metrics and SLO constraints for the application
+        self.slo_enabled = self.config.get('slo_enabled', True)
+        self.slo_engine: Optional["SLOEngine"] = None
+        self._slo_task: Optional[asyncio.Task] = None
+        # Scale Deployments on their SLO constraints; replicas then belong to the autoscaler
+        self.autoscale_enabled = self.config.get('autoscale_enabled', True)
+        self.autoscaler: Optional["Autoscaler"] = None
+        # Move services off degraded nodes or away from lasting SLO violations (LSA only)
+        self.migration_enabled = self.config.get('migration_enabled', True)
+        self._reload_lock: Optional[asyncio.Lock] = None
+        # Level-triggered repair of deleted or mutated objects after the first deploy
+        self.reconcile_enabled = self.config.get('reconcile_enabled', True)
+        self.metrics_enabled = self.config.get('metrics_enabled', True)
+        self.metrics_port = int(self.config.get('metrics_port', 9090))
+        self.metrics_server: Optional[MetricsServer] = None
+        self._startup_complete = False
+        self._translation_cached = False
+        self._last_heartbeat: Optional[float] = None
+
+        # Chunked SAT distribution from the LSA over the P2P channel
+        self.sat_from_p2p = self.config.get('sat_from_p2p', False)
+        self.sat_chunk_size = int(self.config.get('sat_chunk_size', DEFAULT_CHUNK_SIZE))
+        self.sat_wait_timeout = float(self.config.get('sat_wait_timeout', 300))
+        # Direct receivers per holder; each relays the SAT on to its share of the workers
+        self.sat_fanout = int(self.config.get('sat_fanout', DEFAULT_FANOUT))
+        self.sat_want_interval = float(self.config.get('sat_want_interval', 15))
+        self.sat_store_dir = Path(self.config.get('sat_store_dir', "/var/cache/swarm-agent/sat"))
+        self._sat_payload: Optional[ChunkedPayload] = None
+        self._sat_assembler = ChunkAssembler()
+        # digest -> peers this agent offers the SAT to once it holds it
+        self._sat_relay: Dict[str, List[str]] = {}
+        # digest -> when we last pulled it, so offers from several holders cause one transfer
+        self._sat_pulling: Dict[str, float] = {}
+        self._sat_received: Optional[asyncio.Future] = None
+
+        # Persistent cache of TOSCA translations, shared across pod restarts
+        cache_bypass = os.getenv("SA_MANIFEST_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+        self.manifest_cache = ManifestCache(
+                cache_dir=self.config.get('manifest_cache_dir', "/var/cache/swarm-agent/manifests"),
+                max_entries=int(self.config.get('manifest_cache_max_entries', 32)),
+                max_bytes=int(self.config.get('manifest_cache_max_bytes', 64 * 1024 * 1024)),
+                enabled=self.config.get('manifest_cache_enabled', True) and not cache_bypass
+                )
 
         self.logger.info(f"SwarmAgent {self.sa_id} initialised with role: {self.sa_role}, SAT locates at {self.tosca_path}")
 
+    def _apply_runtime_settings(self):
+        """(Re)read the settings listed in HOT_RELOAD_KEYS from self.config"""
+        self.sharded_deploy = self.config.get('sharded_deploy', True)
+        self.status_interval = float(self.config.get('status_interval', 30))
+        self.heartbeat_interval = float(self.config.get('heartbeat_interval', 10))
+        self.reload_interval = float(self.config.get('reload_interval', 5))
+        self.reload_debounce = float(self.config.get('reload_debounce', 3))
+        if getattr(self, 'apply_engine', None):
+            self.apply_engine.max_workers = int(self.config.get('apply_workers', 8))
+        if getattr(self, 'reconciler', None):
+            self.reconciler.resync_interval = float(self.config.get('reconcile_interval', 300))
+            self.reconciler.max_backoff = float(self.config.get('reconcile_max_backoff', 300))
+            self.reconciler.set_rate_limit(float(self.config.get('reconcile_qps', 5)),
+                                           int(self.config.get('reconcile_burst', 10)))
+
+    async def run(self):
+        """
+        Run the Swarm Agent on the current asyncio event loop until stop().
+
+        Twisted runs on the same loop through the asyncio reactor, so P2P
+        handling, rollout tracking and status reporting are cooperative
+        tasks. Translation and apply still use blocking Kubernetes calls
+        and run in a worker thread.
+        """
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._reload_lock = asyncio.Lock()
+        self._spawn(self._heartbeat_loop(), "heartbeat")
+        # Always up: the DaemonSet's probes need /healthz and /readyz
+        await self._start_metrics_server()
+
+        self._sat_received = self.loop.create_future()
+
+        try:
+            if self.sat_package_path:
+                with PROFILER.phase("sat_unpack"):
+                    self.tosca_path = str(await asyncio.to_thread(unpack, self.sat_package_path, self.sat_store_dir))
+            if self.p2p_enabled:
+                # Twisted is only loaded by agents that actually use P2P
+                with PROFILER.phase("imports"):
+                    self.reactor = install_asyncio_reactor(self.loop)
+                if not self.reactor.running:
+                    self.reactor.startRunning(installSignalHandlers=False)
+                with PROFILER.phase("p2p_join"):
+                    await self._initialise_p2p_network()
+                if self.sa_role.lower() == 'leader':
+                    # Step 4: let workers fetch the SAT while we translate our own share
+                    self._broadcast_tosca()
+                elif self.sat_from_p2p:
+                    await self._wait_for_tosca()
+            await asyncio.to_thread(self.start)
+            PROFILER.mark_ready()
+            PROFILER.log(self.logger)
+            self._startup_complete = True
+            READY.set(1)
+
+            # Only the LSA answers state queries; a watch of every Pod on each
+            # worker would multiply the API server load by the node count
+            if self.dynamic_client is not None and self.sa_role.lower() == 'leader':
+                from app_state import ApplicationStateCache
+                self.state_cache = ApplicationStateCache(self.dynamic_client, self.namespace).start()
+            self._spawn(self._status_loop(), "status")
+            if self.rollout_tracker:
+                self._spawn(self._await_rollout(), "rollout")
+            if self.reconcile_enabled and self.apply_engine and self.desired_manifests:
+                await self._start_reconciler()
+            if self.hot_reload:
+                self._start_file_watchers()
+            if self.slo_enabled and self.sa_role.lower() == 'leader':
+                self._start_slo_engine()
+            if self.migration_enabled and self.sa_role.lower() == 'leader':
+                self._start_migration()
+            await self._stop_event.wait()
+        finally:
+            await self._drain()
+
+    def _spawn(self, coro, name: str) -> asyncio.Task:
+        task = self.loop.create_task(coro, name=f"sa-{name}")
+        self._tasks.append(task)
+        return task
+
+    async def _drain(self):
+        """Cancel background tasks and release watches on shutdown"""
+        self.is_running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self.rollout_tracker:
+            self.rollout_tracker.stop()
+        if self.state_cache:
+            self.state_cache.stop()
+        if self.reconciler:
+            self.reconciler.stop()
+        if self.autoscaler:
+            await self.autoscaler.close()
+        if self.migration:
+            await self.migration.close()
+        if self._node_watch:
+            self._node_watch.stop()
+        if self.dispatcher:
+            await self.dispatcher.close()
+        if self._peer_cache_save:
+            self._peer_cache_save.cancel()
+        self.peer_cache.save()
+        if self.metrics_server:
+            await self.metrics_server.close()
+        # The reactor is bound to this loop and is torn down with it
+        self.logger.info("Swarm Agent drained")
+
+    async def _heartbeat_loop(self):
+        """Touch the heartbeat file while the event loop is responsive (container HEALTHCHECK)"""
+        path = Path(self.heartbeat_path)
+        while True:
+            try:
+                path.touch()
+            except OSError as e:
+                self.logger.warning(f"Could not update heartbeat {path}: {e}")
+            self._last_heartbeat = time.monotonic()
+            await asyncio.sleep(self.heartbeat_interval)
+            # Anything beyond the requested sleep is time the loop was blocked
+            EVENT_LOOP_LAG.set(max(0.0, time.monotonic() - self._last_heartbeat - self.heartbeat_interval))
+
+    async def _start_reconciler(self):
+        """Keep the deployed objects in their desired state until the agent stops"""
+        from reconcile import Reconciler
+        self.reconciler = Reconciler(
+                self.apply_engine, self.namespace, self.desired_manifests,
+                resync_interval=float(self.config.get('reconcile_interval', 300)),
+                qps=float(self.config.get('reconcile_qps', 5)),
+                burst=int(self.config.get('reconcile_burst', 10)),
+                max_backoff=float(self.config.get('reconcile_max_backoff', 300)),
+                preserve_paths=self._preserved_paths())
+        await asyncio.to_thread(self.reconciler.start)
+        self._spawn(self.reconciler.run(), "reconcile")
+
+    def _preserved_paths(self) -> tuple:
+        """Fields the reconciler leaves to the autoscaler and the migration controller"""
+        paths = ("spec.replicas",) if self.autoscale_enabled else ()
+        if self.migration_enabled:
+            from migration import PLACEMENT_PATHS
+            paths += PLACEMENT_PATHS
+        return paths
+
+    def _start_file_watchers(self):
+        """Watch the mounted config and SAT files for ConfigMap updates"""
+        from file_watch import FileWatcher
+        sat_watch = ((self.sat_package_path, self._on_sat_package_changed) if self.sat_package_path
+                     else (self.tosca_path, self._on_sat_changed))
+        for name, path, on_change in (("config", self.config_path, self._on_config_changed),
+                                      ("SAT", *sat_watch)):
+            watcher = FileWatcher(path, on_change, interval=self.reload_interval,
+                                  debounce=self.reload_debounce, name=name).prime()
+            self._spawn(watcher.run(), f"watch-{name.lower()}")
+
+    async def _on_config_changed(self, content: bytes):
+        """Apply a changed config; settings outside HOT_RELOAD_KEYS need a restart"""
+        new_config = await asyncio.to_thread(load_configuration, self.config_path)
+        if not new_config:
+            self.logger.error("Changed configuration is invalid, keeping the current one")
+            return
+        changed = {key for key in set(self.config) | set(new_config)
+                   if self.config.get(key) != new_config.get(key)}
+        if not changed:
+            return
+        self.config = new_config
+        self._apply_runtime_settings()
+        self.logger.info(f"Configuration reloaded, changed: {sorted(changed & HOT_RELOAD_KEYS)}")
+        if changed - HOT_RELOAD_KEYS:
+            self.logger.warning(f"Changes to {sorted(changed - HOT_RELOAD_KEYS)} take effect after a restart")
+        if 'sharded_deploy' in changed:
+            # A different share of the application now belongs to this agent
+            await self._on_sat_changed(None)
+
+    async def _on_sat_package_changed(self, content: bytes):
+        """Unpack a changed SAT package, then reload it like a changed SAT file"""
+        try:
+            path = await asyncio.to_thread(unpack, self.sat_package_path, self.sat_store_dir)
+        except SATPackageError as e:
+            self.logger.error(f"Changed SAT package is invalid, keeping the current SAT: {e}")
+            return
+        if str(path) == self.tosca_path:
+            return
+        self.tosca_path = str(path)
+        await self._on_sat_changed(None)
+
+    async def _on_sat_changed(self, content: Optional[bytes]):
+        """Re-translate a changed SAT and apply only the objects that changed"""
+        async with self._reload_lock:
+            tracker = self.rollout_tracker
+            await asyncio.to_thread(self._reload_application)
+        if self.rollout_tracker is not tracker:
+            self._spawn(self._await_rollout(), "rollout")
+        if self.p2p_enabled and self.dispatcher and self.sa_role.lower() == 'leader':
+            self._broadcast_tosca()
+        if self.slo_enabled and self.sa_role.lower() == 'leader':
+            self._start_slo_engine()
+        if self.migration_enabled and self.sa_role.lower() == 'leader':
+            self._start_migration()
+
+    def _start_slo_engine(self):
+        """(Re)start SLO evaluation from the metrics declared in the current SAT"""
+        from slo_engine import NetdataSource, SLOEngine, StubMetricSource, parse_metric_definitions
+
+        try:
+            with open(self.tosca_path, "r") as f:
+                services = parse_metric_definitions(yaml.safe_load(f))
+        except Exception as e:
+            self.logger.error(f"Could not read SLO definitions from the SAT: {e}")
+            return
+        if self._slo_task:
+            self._slo_task.cancel()
+            self._slo_task = None
+        if not services:
+            self.slo_engine = None
+            return
+
+        def zone_of(node: Optional[str]) -> Optional[str]:
+            from kube_client import get_node_labels
+            return get_node_labels(node).get("topology.kubernetes.io/zone") if node else None
+
+        # Sensors without a source of their own (or slo_source: stub) use the local stub
+        stub = StubMetricSource()
+        sources = {}
+        if self.config.get('slo_source', "sensor") == "sensor":
+            sources["netdata"] = NetdataSource(self.config.get('netdata_url', "http://localhost:19999"),
+                                               zone_of=zone_of)
+        else:
+            self.logger.info("SLO metrics come from the local stub source")
+        self.slo_engine = SLOEngine(services, stub, sources=sources)
+        if self.autoscale_enabled:
+            self._start_autoscaler(services)
+        self._slo_task = self._spawn(self.slo_engine.run(), "slo")
+
+    def _start_autoscaler(self, services):
+        """Scale the Deployments of services that declare SLO constraints"""
+        from autoscaler import Autoscaler, ScalingPolicy, scale_targets
+        from kube_client import get_apps_v1
+
+        targets = scale_targets(self.manifests, [name for name, d in services.items() if d.constraints])
+        previous = self.autoscaler
+        if not targets:
+            self.autoscaler = None
+            if previous:
+                self._spawn(previous.close(), "autoscaler-close")
+            return
+        self.autoscaler = Autoscaler(get_apps_v1(), self.namespace, targets, services,
+                                     policy=ScalingPolicy.from_config(self.config))
+        if previous:
+            self.autoscaler.inherit(previous)
+        self.autoscaler.attach(self.slo_engine)
+
+    def _object_id(self, obj: Dict[str, Any]) -> tuple:
+        meta = obj.get("metadata") or {}
+        return obj.get("apiVersion"), obj.get("kind"), meta.get("namespace") or self.namespace, meta.get("name")
+
+    def _reload_application(self):
+        """Translate the current SAT and apply the delta to this agent's share"""
+        from apply_engine import object_hash
+
+        previous_manifests = self.manifests
+        try:
+            manifests = self._convert_application_tosca_to_k3s()
+        except SystemExit as e:
+            # Translation reports errors by exiting; a bad update must not stop the agent
+            self.logger.error(f"Changed SAT could not be translated, keeping the running application: {e}")
+            return
+        if self.apply_engine is None:
+            self._deploy_application(manifests)
+            return
+
+        share = self._select_share(manifests) or []
+        desired_hashes = {self._object_id(obj): object_hash(obj) for obj in self.desired_manifests}
+        new_ids = {self._object_id(obj) for obj in manifests}
+        changed = [obj for obj in share if desired_hashes.get(self._object_id(obj)) != object_hash(obj)]
+        # Only delete what this agent deployed and the SAT no longer contains;
+        # objects that moved to another node are applied by that node's agent
+        removed = [obj for obj in self.desired_manifests if self._object_id(obj) not in new_ids]
+        # Deployments migrated here since our last translation are ours too
+        removed_ids = {self._object_id(obj) for obj in removed}
+        removed += [obj for obj in previous_manifests
+                    if obj.get("kind") == "Deployment" and self._object_id(obj) not in new_ids
+                    and self._object_id(obj) not in removed_ids
+                    and self._migrated_nodes.get((obj.get("metadata") or {}).get("name")) == self.node_name]
+        self.logger.info(f"SAT delta for this agent: {len(changed)} changed, {len(removed)} removed, "
+                         f"{len(share) - len(changed)} unchanged")
+
+        started = time.time()
+        if changed:
+            # Server-side apply forces our values, so keep what the autoscaler
+            # and the migration controller set, as the reconciler does
+            report = self.apply_engine.apply(changed, overrides=self._live_overrides(changed))
+            if report.failed:
+                self.logger.error(f"{len(report.failed)} objects failed to apply")
+        for obj in removed:
+            self.apply_engine.delete_one(obj)
+        self.desired_manifests = share
+        if self.reconciler:
+            self.reconciler.set_desired(share)
+
+        if changed:
+            from readiness import RolloutTracker
+            if self.rollout_tracker:
+                self.rollout_tracker.stop()
+            self.rollout_tracker = RolloutTracker(self.dynamic_client, self.namespace)
+            self.rollout_tracker.track(changed, started_at=started)
+
+    def _live_overrides(self, objs: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+        """Live values of the preserved paths that `objs` also set, per object (blocking)"""
+        from apply_engine import get_path
+
+        overrides = {}
+        for obj in objs:
+            paths = [path for path in self._preserved_paths() if get_path(obj, path) is not None]
+            if not paths:
+                continue
+            meta = obj.get("metadata") or {}
+            try:
+                resource = self.dynamic_client.resources.get(api_version=obj.get("apiVersion"), kind=obj.get("kind"))
+                live = resource.get(name=meta.get("name"), namespace=meta.get("namespace") or self.namespace).to_dict()
+            except Exception as e:
+                if getattr(e, "status", None) != 404:
+                    self.logger.warning(f"Could not read live {obj.get('kind')}/{meta.get('name')}: {e}")
+                continue
+            values = {path: get_path(live, path) for path in paths if get_path(live, path) is not None}
+            if values:
+                overrides[self.apply_engine.object_key(obj)] = values
+        return overrides
+
+    async def _start_metrics_server(self):
+        """Serve /healthz and /readyz, and /metrics unless metrics are disabled, on the agent's exposed port"""
+        if self.metrics_enabled:
+            self._register_metric_callbacks()
+        self.metrics_server = MetricsServer(port=self.metrics_port, liveness=self._liveness,
+                                            readiness=self._readiness, serve_metrics=self.metrics_enabled)
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            self.logger.error(f"Metrics server could not bind port {self.metrics_port}: {e}")
+            self.metrics_server = None
+
+    def _register_metric_callbacks(self):
+        STARTUP_PHASE_SECONDS.set_function(
+                lambda: {phase: seconds for phase, seconds in PROFILER.report().items() if phase != "total"})
+        RECONCILE_LAG.set_function(lambda: self.reconciler.lag() if self.reconciler else None)
+        RECONCILE_QUEUE_DEPTH.set_function(lambda: self.reconciler.queue_depth() if self.reconciler else None)
+        P2P_QUEUE_DEPTH.set_function(
+                lambda: {peer: s["depth"] for peer, s in self.dispatcher.stats()["peers"].items()}
+                if self.dispatcher else None)
+        P2P_DROPPED.set_function(
+                lambda: {peer: s["dropped"] + s["coalesced"] for peer, s in self.dispatcher.stats()["peers"].items()}
+                if self.dispatcher else None)
+
+    def _liveness(self):
+        """Live while the event loop keeps running the heartbeat task"""
+        if self._last_heartbeat is None:
+            return True, {}
+        age = time.monotonic() - self._last_heartbeat
+        return age < 3 * self.heartbeat_interval + 5, {"heartbeat_age": round(age, 3)}
+
+    def _readiness(self):
+        """Ready once startup finished and the state caches are synced"""
+        synced = self.state_cache.synced if self.state_cache else None
+        ok = self._startup_complete and self.is_running and synced is not False
+        return ok, {"started": self._startup_complete, "state_synced": synced,
+                    "app_state": self.state_cache.state if self.state_cache else "unknown"}
+
+    async def _status_loop(self):
+        """Report status periodically until the agent stops"""
+        while self.is_running:
+            status = self.get_status()
+            self.logger.info(f"Status: SA {status['sa_id']} ({status['role']}) - Running: {status['is_running']} - Ready: {status['ready']} - App: {status['app_state']}")
+            if self.dispatcher:
+                self.logger.info(f"P2P queues: {self.dispatcher.stats()['total']}")
+            if self.reconciler:
+                self.logger.info(f"Reconcile: {self.reconciler.stats()}")
+            if self.slo_engine and self.slo_engine.violations():
+                self.logger.warning(f"SLO violations: {[(v.service, v.slo, v.group) for v in self.slo_engine.violations()]}")
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.status_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _await_rollout(self):
+        """Wait for the rollout tracker without holding a thread"""
+        done = self.loop.create_future()
+        self.rollout_tracker.add_done_callback(
+                lambda: self.loop.call_soon_threadsafe(lambda: done.done() or done.set_result(None)))
+        await done
+        self.logger.info(f"Rollout report: {self.rollout_tracker.report()}")
+
     def start(self):
         """
         Start the Swarm Agent
@@ -154,11 +684,8 @@ class SwarmAgent:
         self.logger.info("Starting as Lead Swarm Agent (LSA)")
 
  
-        # Step 2: Initialise P2P network and wait for agents
-        # Ze-TODO: this requires further work to integrate with RA
-        #self._initialise_p2p_network()
-
-        #self.logger.info("P2P initialised, expecting sending resource request")
+        # Step 2: P2P network is initialised on the event loop by run()
+        # Ze-TODO: this requires further work to integrate with RA (p2p_enabled)
 
         # Step 3: Initialise SA with app TOSCA
         #self._process_app_TOSCA()
@@ -168,20 +695,19 @@ class SwarmAgent:
 
        
         # Step 5: Deploy applications using the converted manifests
-        self._deploy_application()
+        self._deploy_application(self.manifests)
 
     def _start_as_worker(self):
         """Start as Worker Swarm Agent"""
         self.logger.info("Starting as Worker Swarm Agent (SA)")
 
-        # Step 2: Join P2P network
-        #self._initialise_p2p_network()
+        # Step 2: P2P network is joined on the event loop by run()
 
         # Step 3: Translate TOSCA into K3s applications
-        #self._convert_application_tosca_to_k3s()
+        self._convert_application_tosca_to_k3s()
 
-        # Step 5: Deploy applications using the converted manifests
-        #self._deploy_application()
+        # Step 5: Deploy the microservices placed on this node
+        self._deploy_application(self.manifests)
 
     def _process_app_TOSCA(self):
         """Step 1:  Initialise connection to RA API servers"""
@@ -189,10 +715,12 @@ class SwarmAgent:
         # TODO: Implement actual API connection
         self.logger.info("API connection initialised")
 
-    def _initialise_p2p_network(self):
+    async def _initialise_p2p_network(self):
         """Step 2: Setup P2P network metadata, MSG handler, and Join the network"""
         self.logger.info(f"Setting up P2P network on {self.p2p_listen_ip}:{self.p2p_listen_port}")
         try:
+            # Imported once the asyncio reactor is installed
+            from swchp2pcom import SwchPeer
             self.p2p_agent = SwchPeer(
                     peer_id=self.sa_id,
                     listen_ip=self.p2p_listen_ip,  # Listen on all interfaces
@@ -209,6 +737,15 @@ class SwarmAgent:
             #self.p2p_agent.on("peer:connected", self._on_peer_connected)
             #self.p2p_agent.on("peer:disconnected", self._on_peer_disconnected)
 
+            # All sends go through per-peer queues so a slow peer cannot stall the loop
+            self.dispatcher = PeerDispatcher(
+                    self.p2p_agent.send, self.p2p_agent.register_message_handler,
+                    max_queue=int(self.config.get('p2p_queue_size', 256)),
+                    max_age=float(self.config.get('p2p_message_max_age', 30)),
+                    batch_types=frozenset({MSG_SAT_OFFER, MSG_SAT_PULL, MSG_SAT_WANT}),
+                    pending_bytes=self._peer_pending_bytes,
+                    max_pending_bytes=int(self.config.get('p2p_max_pending_bytes', 1024 * 1024)))
+
             self.logger.info(f"P2P agent initialised on port {self.p2p_listen_ip}:{self.p2p_listen_port}")
 
         except Exception as e:
@@ -218,65 +755,118 @@ class SwarmAgent:
         # Register core message handlers
         def _on_getstate(peer_id, message):
             logging.info(f"Sending state for application: {message['appid']}")
-            self.p2p_agent.send(peer_id, "MSG_STATE", {"appid": message['appid'], "state": "running"})
+            # Answered from the watch-maintained cache; repeated queries from
+            # one peer merge into a single pending reply
+            status = self.get_status()
+            self.dispatcher.send(peer_id, "MSG_STATE", {"appid": message['appid'], "state": status['app_state'],
+                                                        "staleness": status['state_staleness']},
+                                 coalesce_key=("MSG_STATE", message['appid']))
             return
-        self.p2p_agent.register_message_handler("MSG_GETSTATE", _on_getstate)
+        self.dispatcher.register_message_handler("MSG_GETSTATE", _on_getstate)
 
         def _on_resource_response(peer_id, message):
             logging.info(f"Resource response arrived from RA: {peer_id}, for application: {message['appid']}")
             return
-        self.p2p_agent.register_message_handler("MSG_RESOURCE_RESPONSE", _on_resource_response)
+        self.dispatcher.register_message_handler("MSG_RESOURCE_RESPONSE", _on_resource_response)
 
+        self._register_sat_transfer_handlers()
+
+        def _on_peer_endpoint(peer_id, message):
+            try:
+                endpoint = parse_endpoint(message["endpoint"])
+            except (KeyError, ValueError) as e:
+                self.logger.warning(f"Ignoring endpoint from {peer_id}: {e}")
+                return
+            self._remember_peer(endpoint, peer_id)
+            # Answer a newly joined peer with our own endpoint
+            self._announce_endpoint([peer_id])
+        self.dispatcher.register_message_handler(MSG_PEER_ENDPOINT, _on_peer_endpoint)
 
         if self.sa_role.lower() == 'leader':
             # self._bootstrap_network()
-            Truth = self._join_p2p_network()
+            Truth = await self._join_p2p_network()
             self.logger.info(f"LSA joined P2P network {Truth}")
             connected = self.p2p_agent.get_connected_peers()
             self.logger.info(f"Connected to {len(connected)} peers")
         else:
-            self._join_p2p_network()
+            await self._join_p2p_network()
             self.logger.info(f"SA {self.sa_id} joined P2P network")
         return
 
-    def _start_reactor_bg(self):
-        """Run Twisted reactor in a background thread."""
-        def run_reactor():
-            reactor.run(installSignalHandlers=False)
-        threading.Thread(target=run_reactor, name="twisted-reactor", daemon=True).start()
-
-    def _join_p2p_network(self):
-        self.logger.info(f"Try joining on {self.p2p_public_ip}:{self.p2p_public_port}")
-
-        # Start Twisted reactor in background
-        self._start_reactor_bg()
+    def _peer_pending_bytes(self, peer_id: str) -> Optional[int]:
+        """Bytes still buffered in the transport to `peer_id`, or None when it cannot be found"""
+        peer = self.p2p_agent
+        getter = getattr(peer, "get_transport", None)
+        if callable(getter):
+            transport = getter(peer_id)
+        else:
+            # SwchPeer keeps one protocol per connected peer; it has no public accessor
+            connections = next((getattr(peer, name) for name in ("connections", "peers", "protocols")
+                                if isinstance(getattr(peer, name, None), dict)), {})
+            transport = getattr(connections.get(peer_id), "transport", None)
+        return transport_pending_bytes(transport)
 
-        join_done = threading.Event()
-        join_success = [False]
+    async def _join_p2p_network(self) -> bool:
+        """
+        Enter the P2P network through the configured bootstrap peers and
+        the peers cached by the last run, all at once.
 
-        # Ensure join happens inside reactor's thread
-        def join_on_reactor():
-            deferred = self.p2p_agent.enter(self.p2p_public_ip, self.p2p_public_port)
+        The first candidate to accept wins and the other attempts are
+        cancelled. Failed rounds are retried with backoff until
+        p2p_join_deadline, after which the agent carries on unjoined.
+        """
+        self.peer_cache.load()
+        configured = [(self.p2p_public_ip, int(self.p2p_public_port)), *self.p2p_bootstrap]
+        own = self._advertised_endpoint()
 
-            #def on_join_success(protocol):
-            def on_join_success(_):
-                self.logger.info("Joined P2P network successfully")
-            # Start listening/servicing inside reactor thread
-                #self.p2p_agent.start()
-                join_success[0] = True
-                join_done.set()
+        def candidates():
+            return bootstrap_candidates(configured, self.peer_cache.endpoints(), own,
+                                        max_cached=self.p2p_join_cached_peers)
 
-            def on_join_failure(f):
-                self.logger.error(f"Join failed: {getattr(f, 'getErrorMessage', lambda: f)()}")
-                join_success[0] = False
-                join_done.set()
+        self.logger.info(f"Try joining through {len(candidates())} candidates "
+                         f"({len(self.peer_cache)} cached peers), deadline {self.p2p_join_deadline:.0f}s")
 
-            deferred.addCallback(on_join_success)
-            deferred.addErrback(on_join_failure)
+        async def enter(host: str, port: int):
+            # The reactor runs on our loop, so the join Deferred is awaited directly
+            await self.p2p_agent.enter(host, port).asFuture(self.loop)
 
-        reactor.callFromThread(join_on_reactor)
-        join_done.wait()
-        return join_success[0]
+        try:
+            endpoint, _ = await join_with_retry(enter, candidates, self.p2p_join_deadline,
+                                                self.p2p_join_attempt_timeout, self.p2p_join_backoff,
+                                                self.p2p_join_max_backoff)
+        except JoinError as e:
+            self.logger.error(f"Join failed: {e}")
+            return False
+        self._remember_peer(endpoint)
+        self._announce_endpoint(self.p2p_agent.get_connected_peers())
+        self.logger.info("Joined P2P network successfully")
+        return True
+
+    def _advertised_endpoint(self) -> Optional[tuple]:
+        """Where other agents can reach our listener, if known"""
+        host = self.config.get('p2p_advertise_ip') or os.getenv("POD_IP") or self.p2p_listen_ip
+        if host in WILDCARD_IPS:
+            return None
+        return host, int(self.p2p_listen_port)
+
+    def _announce_endpoint(self, peers):
+        own = self._advertised_endpoint()
+        if own is None:
+            return
+        for peer in peers:
+            if peer != self.sa_id and peer not in self._endpoint_sent:
+                self._endpoint_sent.add(peer)
+                self.dispatcher.send(peer, MSG_PEER_ENDPOINT, {"endpoint": format_endpoint(own)},
+                                     coalesce_key=MSG_PEER_ENDPOINT)
+
+    def _remember_peer(self, endpoint: tuple, peer_id: Optional[str] = None):
+        """Record a peer endpoint; the cache is written at most once a second"""
+        self.peer_cache.record(endpoint, peer_id)
+        if self._peer_cache_save is None and self.loop is not None:
+            def _save():
+                self._peer_cache_save = None
+                self.peer_cache.save()
+            self._peer_cache_save = self.loop.call_later(1.0, _save)
 
     def _resource_request(self):
         """
@@ -290,7 +880,7 @@ class SwarmAgent:
             self.logger.info("Start sending resource intialisation request...")
             #sa_id=com.findPeers({"appid":args.getstate, "peer_type":"leader"})
             # No need to join - we're the first node
-            self.p2p_agent.send("wmin.ac.uk", "MSG_RESOURCE_REQUEST", {"cpu": "2"})
+            self.dispatcher.send("wmin.ac.uk", "MSG_RESOURCE_REQUEST", {"cpu": "2"}, droppable=False)
             self.logger.info("Resource request send successfully!")
         except Exception as e:
             self.logger.error(f"Sending resource request failed: {str(e)}")
@@ -303,74 +893,344 @@ class SwarmAgent:
     def _broadcast_tosca(self):
         """Step 4: broadcast tosca to SAs"""
         self.logger.info("Broadcasting app TOSCA to SAs through P2P network")
-        # TODO: Implement TOSCA broadcasting using P2P
-        self.logger.info("TOSCA broadcasted")
-
-    def _convert_application_tosca_to_k3s(self):
+        with open(self.tosca_path, "rb") as f:
+            self._sat_payload = ChunkedPayload(f.read(), kind="sat", chunk_size=self.sat_chunk_size)
+
+        # Offers are tiny; each worker pulls the chunks only if it does not
+        # already hold this digest, then relays them to its share of the rest
+        peers = sorted(peer for peer in self.p2p_agent.get_connected_peers() if peer != self.sa_id)
+        self._offer_sat(peers)
+        self.logger.info(f"TOSCA {self._sat_payload.digest[:12]} offered to {len(peers)} peers "
+                         f"through {min(len(peers), self.sat_fanout)} relays "
+                         f"({self._sat_payload.size} bytes, {self._sat_payload.compressed_size} compressed, "
+                         f"{self._sat_payload.total} chunks)")
+
+    def _offer_sat(self, peers: List[str]):
+        """Offer the held SAT to at most sat_fanout peers, each relaying to a share of `peers`"""
+        offer = {"appid": self.app_id, **self._sat_payload.offer()}
+        for peer, relay in relay_tree(peers, self.sat_fanout):
+            self.dispatcher.send(peer, MSG_SAT_OFFER, {**offer, "relay": relay}, coalesce_key=MSG_SAT_OFFER)
+
+    def _serve_sat(self, digest: str) -> bool:
+        """Make the SAT with `digest` available to peers that pull it, if it is held"""
+        if self._sat_payload is not None and self._sat_payload.digest == digest:
+            return True
+        payload = self._sat_assembler.held.get(digest)
+        stored = self._sat_store_path(digest)
+        if payload is None and stored.exists():
+            payload = stored.read_bytes()
+        if payload is None:
+            return False
+        self._sat_payload = ChunkedPayload(payload, kind="sat", chunk_size=self.sat_chunk_size)
+        return True
+
+    def _relay_sat(self, digest: str, relay: List[str]):
+        if relay and self._serve_sat(digest):
+            self._offer_sat(relay)
+
+    async def _send_sat_chunks(self, peer_id: str, payload: ChunkedPayload):
+        # Chunks wait for room in the peer's bounded queue instead of overfilling it
+        for chunk in payload.messages():
+            if not await self.dispatcher.send_when_ready(peer_id, MSG_SAT_CHUNK, chunk):
+                return
+        self.logger.info(f"Sent {payload.total} TOSCA chunks to {peer_id}")
+
+    def _sat_store_path(self, digest: str) -> Path:
+        return self.sat_store_dir / f"{digest}.yaml"
+
+    def _register_sat_transfer_handlers(self):
+        """Register both sides of the chunked SAT transfer protocol"""
+        def _on_sat_want(peer_id, message):
+            if self._sat_payload is not None:
+                self.dispatcher.send(peer_id, MSG_SAT_OFFER, {"appid": self.app_id, **self._sat_payload.offer()},
+                                     coalesce_key=MSG_SAT_OFFER)
+        self.dispatcher.register_message_handler(MSG_SAT_WANT, _on_sat_want)
+
+        def _on_sat_pull(peer_id, message):
+            if self._sat_payload is None or message.get("digest") != self._sat_payload.digest:
+                self.logger.warning(f"Peer {peer_id} pulled unknown TOSCA {message.get('digest')}")
+                return
+            self._spawn(self._send_sat_chunks(peer_id, self._sat_payload), f"sat-upload-{peer_id}")
+        self.dispatcher.register_message_handler(MSG_SAT_PULL, _on_sat_pull)
+
+        def _on_sat_offer(peer_id, message):
+            digest = message["digest"]
+            if message.get("kind") != "sat":
+                return
+            relay = [peer for peer in message.get("relay") or [] if peer != self.sa_id]
+            stored = self._sat_store_path(digest)
+            if self._sat_assembler.holds(digest) or stored.exists():
+                self.logger.info(f"TOSCA {digest[:12]} already held, skipping transfer")
+                self._sat_ready(stored if stored.exists() else Path(self.tosca_path))
+                self._relay_sat(digest, relay)
+                return
+            if relay:
+                self._sat_relay[digest] = relay
+            pulled = self._sat_pulling.get(digest)
+            if pulled is not None and time.monotonic() - pulled < self.sat_want_interval:
+                return
+            self._sat_pulling[digest] = time.monotonic()
+            self.dispatcher.send(peer_id, MSG_SAT_PULL, {"digest": digest}, coalesce_key=(MSG_SAT_PULL, digest))
+        self.dispatcher.register_message_handler(MSG_SAT_OFFER, _on_sat_offer)
+
+        def _on_sat_chunk(peer_id, message):
+            payload = self._sat_assembler.add_chunk(message)
+            if payload is None:
+                return
+            path = self._sat_store_path(message["digest"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(payload)
+            tmp_path.replace(path)
+            self.logger.info(f"TOSCA {message['digest'][:12]} received from {peer_id} ({len(payload)} bytes)")
+            self._sat_ready(path)
+            # Serve it from here on, first to the peers we relay to
+            self._serve_sat(message["digest"])
+            self._relay_sat(message["digest"], self._sat_relay.pop(message["digest"], []))
+        self.dispatcher.register_message_handler(MSG_SAT_CHUNK, _on_sat_chunk)
+
+        # A SAT we already have mounted never needs to be transferred
+        mounted = Path(self.tosca_path)
+        if mounted.exists():
+            self._sat_assembler.add_held(mounted.read_bytes())
+
+    def _sat_ready(self, path: Path):
+        if self._sat_received is not None and not self._sat_received.done():
+            self._sat_received.set_result(path)
+        elif self._startup_complete and self.hot_reload and str(path) != self.tosca_path:
+            # A newer SAT offered by the LSA while we are running
+            self.tosca_path = str(path)
+            self._spawn(self._on_sat_changed(None), "sat-reload")
+
+    def _convert_application_tosca_to_k3s(self) -> List[Dict[str, Any]]:
+        """Translate the SAT into Kubernetes manifest objects, kept in memory"""
+        started = time.perf_counter()
+        with PROFILER.phase("translation"):
+            manifests = self._translate_tosca()
+        TRANSLATION_SECONDS.observe(time.perf_counter() - started,
+                                    cache="hit" if self._translation_cached else "miss")
+        return manifests
+
+    def _translate_tosca(self) -> List[Dict[str, Any]]:
         print("[DEBUG] Now inside convert application tosca")
         self.logger.info("Converting Tosca into k3s manifests.")
         #tpl = parse_tosca(self.tosca_path)
-        yaml_parser = YAML()
-        yaml_parser.default_flow_style = False
 
         TOSCA_FILE = self.tosca_path
-        OUTPUT_FILE = "application-manifest.yaml"
         IMAGE_PULL_SECRET = "regcred"
+        # Optional debug artifact; the deploy step never reads it back
+        DEBUG_OUTPUT_FILE = os.getenv("SA_MANIFEST_DEBUG_PATH", self.config.get('manifest_debug_path'))
 
         path = Path(TOSCA_FILE)
         if not path.exists():
             sys.exit(f"Error: TOSCA file '{TOSCA_FILE}' not found.")
 
         try:
-            with open(path, "r") as f:
-                tosca_yaml = f.read()
-            
-            #manifests = get_kubernetes_manifest(tosca_yaml)
-            self.logger.info("Calling get_k8s_manifest function")
-            # k3s_client function:
-            manifests = get_kubernetes_manifest(tosca_file=TOSCA_FILE, image_pull_secret=IMAGE_PULL_SECRET)
-            #manifests = get_kubernetes_manifest(tosca_yaml, image_pull_secret=IMAGE_PULL_SECRET)
-            
+            with open(path, "rb") as f:
+                tosca_content = f.read()
+
+            cache_key = self.manifest_cache.make_key(tosca_content, IMAGE_PULL_SECRET)
+            manifests = self.manifest_cache.get(cache_key)
+            self._translation_cached = manifests is not None
+            MANIFEST_CACHE_LOOKUPS.inc(result="hit" if manifests is not None else "miss")
+            if manifests is not None:
+                self.logger.info(f"Manifest cache hit for SAT {cache_key[:12]}, skipping translation")
+            else:
+                self.logger.info(f"Manifest cache miss for SAT {cache_key[:12]}")
+                #manifests = get_kubernetes_manifest(tosca_yaml)
+                self.logger.info("Calling get_k8s_manifest function")
+                # k3s_client function (only loaded when a translation is needed):
+                with PROFILER.phase("imports"):
+                    from k3s_client.utils.manifest import get_kubernetes_manifest
+                manifests = get_kubernetes_manifest(tosca_file=TOSCA_FILE, image_pull_secret=IMAGE_PULL_SECRET)
+                #manifests = get_kubernetes_manifest(tosca_yaml, image_pull_secret=IMAGE_PULL_SECRET)
+                if manifests:
+                    self.manifest_cache.put(cache_key, manifests)
+            self.logger.info(f"Manifest cache stats: {self.manifest_cache.stats()}")
+
             if not manifests:
                 self.logger.info("No Manifests!")
                 sys.exit("Warning: No Kubernetes manifests generated.")
-            self.logger.info(" Manifest is there, now dump the output!")
-            with open(OUTPUT_FILE, "w") as f:
-                self.logger.info("Manifests have been translated! We now dump manifests into {OUTPUT_FILE}")
-                yaml_parser.dump_all(manifests, f)
+
+            if DEBUG_OUTPUT_FILE:
+                from ruamel.yaml import YAML
+                yaml_parser = YAML()
+                yaml_parser.default_flow_style = False
+                with open(DEBUG_OUTPUT_FILE, "w") as f:
+                    yaml_parser.dump_all(manifests, f)
+                self.logger.info(f"Debug copy of manifests written to '{DEBUG_OUTPUT_FILE}'")
         except Exception as e:
             sys.exit(f"Error: {e}")
 
-        self.logger.info("✅ Kubernetes manifests written to '{OUTPUT_FILE}' ({len(manifests)} items)")
+        # Placement and sharding keep migrated services on their new nodes,
+        # also after the leader restarted and on every worker
+        migrated = self._live_migrations(manifests) if self.migration_enabled else {}
+        if self.config.get('placement_enabled', True):
+            with PROFILER.phase("placement"):
+                manifests = self._place_application(manifests)
+        if migrated:
+            from migration import apply_pins
+            manifests = apply_pins(manifests, migrated)
+
+        self.manifests = list(manifests)
+        self.logger.info(f"✅ Kubernetes manifests translated ({len(self.manifests)} items)")
+        return self.manifests
+
+    def _live_migrations(self, manifests: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Deployment -> node of the migrations recorded on the live Deployments; adds them to self.migrations"""
+        from autoscaler import scale_targets
+        from kube_client import get_apps_v1
+        from migration import migrated_nodes
+        from placement import parse_workloads
+
+        try:
+            apps_v1 = get_apps_v1()
+            live = apps_v1.api_client.sanitize_for_serialization(
+                    apps_v1.list_namespaced_deployment(self.namespace)).get("items") or []
+            nodes = migrated_nodes(live)
+            self._migrated_nodes = nodes
+            if nodes:
+                services = scale_targets(manifests, parse_workloads(self._read_sat(), manifests))
+                self.migrations.update({service: nodes[deployment] for service, deployment in services.items()
+                                        if deployment in nodes})
+        except Exception as e:
+            self.logger.warning(f"Could not read migrated Deployments, placing without them: {e}")
+            return {}
+        return nodes
+
+    def _read_sat(self) -> Dict[str, Any]:
+        with open(self.tosca_path, "r") as f:
+            return yaml.safe_load(f) or {}
 
-    def _deploy_application(self):
-        """Step 5/6: Initialise application by loading TOSCA and deploying resources"""
+    def _placement_nodes(self, max_age: float = 60.0) -> List["NodeInfo"]:
+        """Candidate nodes: the cluster's Node objects, unless a capacity file describes them"""
+        from placement import nodes_from_kubernetes, nodes_from_node_types
+
+        capacity_file = self.config.get('placement_capacity_file')
+        if capacity_file:
+            with open(capacity_file, "r") as f:
+                return nodes_from_node_types((yaml.safe_load(f) or {}).get("node_types"))
+        from kube_client import list_nodes
+        return nodes_from_kubernetes(list_nodes(max_age=max_age))
+
+    def _place_application(self, manifests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Pin microservices to nodes that satisfy their node_filter and Colocation policies"""
+        from placement import place_manifests
+
+        try:
+            if self._qos_scorer is None:
+                from qos import QoSScorer
+                self._qos_scorer = QoSScorer()
+            # Migrated services stay where they were moved to
+            placed, _ = place_manifests(self._read_sat(), manifests, self._placement_nodes(),
+                                        strategy=self.config.get('placement_strategy', "spread"),
+                                        mode=self.config.get('placement_mode', "affinity"),
+                                        scorer=self._qos_scorer,
+                                        qos_weight=float(self.config.get('placement_qos_weight', 0.5)),
+                                        fixed=self.migrations)
+            return placed
+        except Exception as e:
+            self.logger.error(f"Placement failed, keeping the translated node mapping: {e}")
+            return manifests
+
+    def _choose_migration_target(self, service: str, avoid: set, fixed: Dict[str, str]) -> Optional[str]:
+        """Best node for `service` outside `avoid`, with the other services kept where they are"""
+        from placement import PlacementSolver, colocation_groups, parse_workloads
+
+        sat = self._read_sat()
+        workloads = parse_workloads(sat, self.manifests)
+        nodes = [node for node in self._placement_nodes(max_age=0) if node.name not in avoid]
+        solver = PlacementSolver(nodes, strategy=self.config.get('placement_strategy', "spread"),
+                                 scorer=self._qos_scorer,
+                                 qos_weight=float(self.config.get('placement_qos_weight', 0.5)))
+        return solver.solve(workloads, colocation_groups(sat, workloads), fixed=fixed).assignments.get(service)
+
+    def _start_migration(self):
+        """(Re)build the migration controller for the current SAT and follow node health"""
+        from autoscaler import scale_targets
+        from kube_client import get_apps_v1, get_core_v1, get_dynamic_client
+        from migration import MigrationController, Migrator
+        from placement import colocation_groups, parse_workloads
+
+        try:
+            sat = self._read_sat()
+            workloads = parse_workloads(sat, self.manifests)
+            groups = colocation_groups(sat, workloads)
+        except Exception as e:
+            self.logger.error(f"Could not read the SAT for migration: {e}")
+            return
+        deployments = scale_targets(self.manifests, workloads)
+        previous = self.migration
+        migrator = Migrator(get_core_v1(), get_apps_v1(), self.namespace,
+                            prepull_timeout=float(self.config.get('migration_prepull_timeout', 300)),
+                            rollout_timeout=float(self.config.get('migration_rollout_timeout', 600)))
+        self.migration = MigrationController(
+                migrator, deployments, self._choose_migration_target, groups=groups,
+                slo_after=float(self.config.get('migration_slo_after', 600)),
+                cooldown=float(self.config.get('migration_cooldown', 900)),
+                on_migrated=self.migrations.__setitem__)
+        self.migration.set_pins(self.manifests)
+        self.migration.pins.update({s: n for s, n in self.migrations.items() if s in deployments})
+        if previous:
+            self.migration.inherit(previous)
+        self.migration.attach(self.slo_engine, self.loop)
+        if self._node_watch is None:
+            from watch_cache import WatchCache
+            self._node_watch = WatchCache(get_dynamic_client(), "v1", "Node")
+            self._node_watch.add_listener(self._on_node_event)
+            self._node_watch.start()
+
+    def _on_node_event(self, event_type: str, node: Dict[str, Any]):
+        # Looked up per event, so a rebuilt controller receives them (watch thread)
+        if self.migration:
+            self.migration.node_event(event_type, node)
+
+    def _deploy_application(self, manifests: List[Dict[str, Any]]):
+        """Step 5/6: Initialise application by deploying the translated manifests"""
+        with PROFILER.phase("apply"):
+            self._apply_manifests(manifests)
+
+    def _apply_manifests(self, manifests: List[Dict[str, Any]]):
         self.logger.info(f"Initialising application {self.app_id}")
         #self.logger.info(f"Loading TOSCA for resource {self.resource_id}")
 
         try:
-            # Load in-cluster config (uses ServiceAccount mounted in pod)
-            config.load_incluster_config()
-            k8s_client = ApiClient()
-            v1 = client.CoreV1Api(k8s_client)
+            with PROFILER.phase("imports"):
+                from apply_engine import ApplyEngine
+                from kube_client import get_api_client, get_core_v1, get_dynamic_client
+                from readiness import RolloutTracker
+
+            # Process-wide, pooled client (uses ServiceAccount mounted in pod)
+            v1 = get_core_v1()
 
             #folder = "k3s"
-            namespace = "default"   # <-- use the namespace you want
+            namespace = self.namespace
             ensure_namespace(v1, namespace)
         # Create/refresh the regcred secret first (equivalent to your kubectl command)
-           
-            folder = "./"
-            for fname in os.listdir(folder):
-                if not fname.endswith(".yaml"):
-                    continue
-                fpath = os.path.join(folder, fname)
-
-                self.logger.info(f"Applying {fpath}")
-                try:
-                    # Can apply multi-doc yaml (--- separators)
-                    utils.create_from_yaml(k8s_client, fpath, namespace="default")
-                except Exception as e:
-                    self.logger.error(f"Failed applying {fpath}: {e}")
+
+            manifests = self._select_share(manifests)
+            if manifests is None:
+                self.logger.info("Sharded deploy disabled, leaving deployment to the LSA")
+                return
+
+            self.logger.info(f"Applying {len(manifests)} manifest objects")
+            self.dynamic_client = get_dynamic_client()
+            engine = ApplyEngine(get_api_client(), namespace=namespace,
+                                 max_workers=int(self.config.get('apply_workers', 8)),
+                                 mode=self.config.get('apply_mode', "apply"),
+                                 dynamic_client=self.dynamic_client)
+            self.apply_engine = engine
+            apply_started = time.time()
+            # A restarted agent must not undo the autoscaler's and the migration
+            # controller's changes either, as on reload
+            report = engine.apply(manifests, overrides=self._live_overrides(manifests))
+            self.desired_manifests = manifests
+            if report.failed:
+                self.logger.error(f"{len(report.failed)} objects failed to apply")
+
+            # Follow the rollout through watch events instead of fire-and-forget
+            self.rollout_tracker = RolloutTracker(self.dynamic_client, namespace)
+            self.rollout_tracker.track(manifests, started_at=apply_started)
 
             self.logger.info("Application initialised")
 
@@ -378,16 +1238,46 @@ class SwarmAgent:
             self.logger.error(f"Error starting Swarm Agent: {e}")
 
 
-    def _wait_for_tosca(self):
+    def _select_share(self, manifests: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """This agent's share of the manifests, or None when the LSA deploys everything"""
+        is_leader = self.sa_role.lower() == 'leader'
+        if self.sharded_deploy:
+            from kube_client import get_node_labels
+            return shard_manifests(manifests, self.node_name, get_node_labels(self.node_name), is_leader)
+        return list(manifests) if is_leader else None
+
+    async def _wait_for_tosca(self):
         """Step SA-5: Wait for TOSCA broadcast from LSA"""
         self.logger.info("Waiting for TOSCA broadcast from LSA")
-        # TODO: Implement TOSCA reception
-        self.logger.info("TOSCA received")
+        deadline = time.monotonic() + self.sat_wait_timeout
+        while True:
+            # Ask every peer in case we joined after the broadcast or our relay
+            # went away; any agent holding the SAT answers with an offer
+            for peer in self.p2p_agent.get_connected_peers():
+                if peer != self.sa_id:
+                    self.dispatcher.send(peer, MSG_SAT_WANT, {"appid": self.app_id}, coalesce_key=MSG_SAT_WANT)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.logger.warning(f"No TOSCA broadcast within {self.sat_wait_timeout}s, using {self.tosca_path}")
+                return
+            try:
+                path = await asyncio.wait_for(asyncio.shield(self._sat_received),
+                                              timeout=min(self.sat_want_interval, remaining))
+                break
+            except asyncio.TimeoutError:
+                continue
+        self.tosca_path = str(path)
+        self.logger.info(f"TOSCA received: {self.tosca_path}")
 
     def stop(self):
         """Stop the Swarm Agent"""
         self.logger.info("Stopping Swarm Agent")
         self.is_running = False
+        if self.rollout_tracker:
+            self.rollout_tracker.stop()
+        # Safe from signal handlers and other threads; wakes run() immediately
+        if self.loop and self._stop_event and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stop_event.set)
 
     def get_status(self) -> Dict[str, Any]:
         """Get current status of the Swarm Agent"""
@@ -397,7 +1287,10 @@ class SwarmAgent:
                 'is_running': self.is_running,
                 'universe_id': self.universe_id,
                 'app_id': self.app_id,
-                'resource_id': self.resource_id
+                'resource_id': self.resource_id,
+                'ready': self.rollout_tracker.is_ready if self.rollout_tracker else False,
+                'app_state': self.state_cache.state if self.state_cache else "unknown",
+                'state_staleness': self.state_cache.staleness() if self.state_cache else None
                 }
 
 
@@ -0,0 +1,154 @@
+# app_state.py
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from apply_engine import FIELD_MANAGER, MANAGED_BY_LABEL
+from readiness import rollout_complete
+from watch_cache import WatchCache
+
+logger = logging.getLogger("SwarmAgent")
+
+CRASH_REASONS = {"CrashLoopBackOff", "ImagePullBackOff", "ErrImagePull", "CreateContainerConfigError"}
+
+
+def _deployment_of_pod(pod: Dict[str, Any]) -> Optional[str]:
+    """Name of the Deployment owning a pod, via its ReplicaSet owner reference."""
+    meta = pod.get("metadata") or {}
+    template_hash = (meta.get("labels") or {}).get("pod-template-hash")
+    for owner in meta.get("ownerReferences") or []:
+        if owner.get("kind") == "ReplicaSet" and template_hash:
+            suffix = f"-{template_hash}"
+            name = owner.get("name", "")
+            if name.endswith(suffix):
+                return name[:-len(suffix)]
+    return None
+
+
+def _pod_summary(pod: Dict[str, Any]) -> Dict[str, Any]:
+    status = pod.get("status") or {}
+    ready = any(c.get("type") == "Ready" and c.get("status") == "True"
+                for c in status.get("conditions") or [])
+    crashing = any(((c.get("state") or {}).get("waiting") or {}).get("reason") in CRASH_REASONS
+                   for c in status.get("containerStatuses") or [])
+    restarts = sum(c.get("restartCount") or 0 for c in status.get("containerStatuses") or [])
+    return {"phase": status.get("phase"), "ready": ready, "crashing": crashing, "restarts": restarts}
+
+
+class ApplicationStateCache:
+    """
+    Informer-style, incrementally maintained state of the application.
+
+    Deployments (managed by the agent) and Pods in the namespace are
+    followed through watch caches. Every event updates only the summary
+    of the object it concerns, so state queries (MSG_GETSTATE,
+    get_status(), HTTP probes) are answered from memory without touching
+    the API server. Snapshots report how stale the data is.
+    """
+
+    def __init__(self, dynamic_client, namespace: str):
+        """
+        Args:
+            dynamic_client: kubernetes.dynamic.DynamicClient
+            namespace: Namespace the application is deployed in
+        """
+        self.namespace = namespace
+        self._deployments = WatchCache(dynamic_client, "apps/v1", "Deployment", namespace=namespace,
+                                       label_selector=f"{MANAGED_BY_LABEL}={FIELD_MANAGER}")
+        self._pods = WatchCache(dynamic_client, "v1", "Pod", namespace=namespace)
+        self._deployments.add_listener(self._on_deployment)
+        self._pods.add_listener(self._on_pod)
+
+        self._lock = threading.Lock()
+        # deployment name -> {"ready", "replicas", "ready_replicas", "pods", "ready_pods", "crashing", "restarts"}
+        self._workloads: Dict[str, Dict[str, Any]] = {}
+        # pod name -> (deployment name, pod summary)
+        self._pod_index: Dict[str, tuple] = {}
+        self._app_state = "unknown"
+
+    def start(self) -> "ApplicationStateCache":
+        self._deployments.start()
+        self._pods.start()
+        return self
+
+    def stop(self) -> None:
+        self._deployments.stop()
+        self._pods.stop()
+
+    @property
+    def synced(self) -> bool:
+        return self._deployments.synced.is_set() and self._pods.synced.is_set()
+
+    def _workload(self, name: str) -> Dict[str, Any]:
+        return self._workloads.setdefault(name, {
+                "managed": False, "ready": False, "replicas": 0, "ready_replicas": 0,
+                "pods": 0, "ready_pods": 0, "crashing": 0, "restarts": 0})
+
+    def _on_deployment(self, event_type: str, obj: Dict[str, Any]) -> None:
+        name = (obj.get("metadata") or {}).get("name")
+        with self._lock:
+            if event_type == "DELETED":
+                workload = self._workloads.get(name)
+                if workload is not None:
+                    workload["managed"] = False
+            else:
+                status = obj.get("status") or {}
+                workload = self._workload(name)
+                workload.update(
+                        managed=True,
+                        ready=rollout_complete(obj),
+                        replicas=(obj.get("spec") or {}).get("replicas", 1),
+                        ready_replicas=status.get("readyReplicas") or 0)
+            self._recompute()
+
+    def _on_pod(self, event_type: str, obj: Dict[str, Any]) -> None:
+        pod_name = (obj.get("metadata") or {}).get("name")
+        with self._lock:
+            previous = self._pod_index.pop(pod_name, None)
+            if previous is not None:
+                self._account(previous[0], previous[1], -1)
+            if event_type != "DELETED":
+                deployment = _deployment_of_pod(obj)
+                if deployment is not None:
+                    summary = _pod_summary(obj)
+                    self._pod_index[pod_name] = (deployment, summary)
+                    self._account(deployment, summary, 1)
+            self._recompute()
+
+    def _account(self, deployment: str, summary: Dict[str, Any], sign: int) -> None:
+        workload = self._workload(deployment)
+        workload["pods"] += sign
+        workload["ready_pods"] += sign * summary["ready"]
+        workload["crashing"] += sign * summary["crashing"]
+        workload["restarts"] += sign * summary["restarts"]
+
+    def _recompute(self) -> None:
+        managed = [w for w in self._workloads.values() if w["managed"]]
+        if not managed:
+            self._app_state = "absent"
+        elif any(w["crashing"] for w in managed):
+            self._app_state = "degraded"
+        elif all(w["ready"] for w in managed):
+            self._app_state = "running"
+        else:
+            self._app_state = "progressing"
+
+    @property
+    def state(self) -> str:
+        """Overall application state: unknown/absent/progressing/running/degraded."""
+        return self._app_state if self.synced else "unknown"
+
+    def staleness(self) -> Optional[float]:
+        """Seconds since the older of the two caches was last confirmed current."""
+        syncs = [self._deployments.last_sync, self._pods.last_sync]
+        if any(s is None for s in syncs):
+            return None
+        return time.time() - min(syncs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Application state and per-workload summaries, from memory."""
+        with self._lock:
+            workloads = {name: dict(w) for name, w in self._workloads.items() if w["managed"]}
+        return {"state": self.state, "staleness": self.staleness(), "workloads": workloads}
@@ -0,0 +1,326 @@
+# apply_engine.py
+
+import copy
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from kubernetes import dynamic, utils
+from kubernetes.client import ApiClient
+
+from metrics import APPLY_RUN_SECONDS, APPLY_SECONDS, record_api_error
+
+logger = logging.getLogger("SwarmAgent")
+
+FIELD_MANAGER = "swarm-agent"
+HASH_ANNOTATION = "swarmchestrate.eu/applied-hash"
+MANAGED_BY_LABEL = "app.kubernetes.io/managed-by"
+
+# "create" only creates objects and treats 409 as success (legacy behaviour);
+# "apply" server-side applies objects whose generated content changed.
+APPLY_MODES = ("create", "apply")
+
+# Objects are applied tier by tier; everything in a tier may depend on the
+# tiers before it but not on its siblings.
+APPLY_TIERS = [
+    ("cluster", {"Namespace", "CustomResourceDefinition"}),
+    ("config", {"Secret", "ConfigMap", "PersistentVolumeClaim", "PersistentVolume",
+                "ServiceAccount", "Role", "RoleBinding", "ClusterRole", "ClusterRoleBinding"}),
+    ("network", {"Service"}),
+    ("workload", {"Deployment", "StatefulSet", "DaemonSet", "ReplicaSet", "Job", "CronJob", "Pod"}),
+]
+# Kinds we do not know about are applied last, after the workloads
+UNKNOWN_TIER = "other"
+
+
+@dataclass
+class ApplyResult:
+    """Outcome of applying a single object."""
+    kind: str
+    name: str
+    status: str  # "created", "exists", "applied", "unchanged", "deleted" or "failed"
+    latency: float
+    error: Optional[str] = None
+    # resourceVersion returned by a server-side apply
+    resource_version: Optional[str] = None
+
+
+@dataclass
+class ApplyReport:
+    """Outcome of a full apply run."""
+    results: List[ApplyResult] = field(default_factory=list)
+    wall_time: float = 0.0
+
+    @property
+    def failed(self) -> List[ApplyResult]:
+        return [r for r in self.results if r.status == "failed"]
+
+    def summary(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for r in self.results:
+            counts[r.status] = counts.get(r.status, 0) + 1
+        return {"objects": len(self.results), "wall_time": round(self.wall_time, 3), **counts}
+
+
+def _flatten(docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Expand `kind: *List` documents into their items."""
+    flat = []
+    for doc in docs:
+        if doc.get("kind", "").endswith("List") and "items" in doc:
+            flat.extend(_flatten(doc["items"]))
+        else:
+            flat.append(doc)
+    return flat
+
+
+def object_hash(obj: Dict[str, Any]) -> str:
+    """Stable hash of a generated object, ignoring our own hash annotation."""
+    clean = copy.deepcopy(obj)
+    annotations = clean.get("metadata", {}).get("annotations") or {}
+    annotations.pop(HASH_ANNOTATION, None)
+    encoded = json.dumps(clean, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def get_path(obj: Dict[str, Any], path: str) -> Any:
+    """Value at a dotted path such as "spec.replicas", or None."""
+    for part in path.split("."):
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(part)
+    return obj
+
+
+def set_path(obj: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        obj = obj.setdefault(part, {})
+    obj[parts[-1]] = value
+
+
+def group_into_tiers(docs: Iterable[Dict[str, Any]]) -> List[tuple]:
+    """Group manifest objects into (tier name, objects) in apply order."""
+    tiers: Dict[str, List[Dict[str, Any]]] = {name: [] for name, _ in APPLY_TIERS}
+    tiers[UNKNOWN_TIER] = []
+    for doc in _flatten(docs):
+        kind = doc.get("kind", "")
+        for name, kinds in APPLY_TIERS:
+            if kind in kinds:
+                tiers[name].append(doc)
+                break
+        else:
+            tiers[UNKNOWN_TIER].append(doc)
+    return [(name, objs) for name, objs in tiers.items() if objs]
+
+
+class ApplyEngine:
+    """
+    Apply manifest objects in dependency tiers, concurrently within a tier.
+
+    Namespaces/CRDs go first, then Secrets, ConfigMaps and PVCs, then
+    Services, then workloads. Each tier is submitted through a bounded
+    worker pool and completes before the next tier starts.
+
+    In "apply" mode every object is stamped with a hash of its generated
+    content. Live hashes are read with one LIST call per kind and only
+    objects whose hash changed are sent as server-side apply PATCHes.
+    """
+
+    def __init__(self, api_client: ApiClient, namespace: str = "default",
+                 max_workers: int = 8, mode: str = "apply",
+                 dynamic_client: Optional[dynamic.DynamicClient] = None):
+        """
+        Args:
+            api_client: Kubernetes API client shared by all workers
+            namespace: Namespace for objects that do not set one
+            max_workers: Maximum number of concurrent API requests
+            mode: "apply" (server-side apply, skip unchanged) or "create"
+            dynamic_client: Shared dynamic client; built from api_client if omitted
+        """
+        if mode not in APPLY_MODES:
+            raise ValueError(f"Unknown apply mode '{mode}', expected one of {APPLY_MODES}")
+        self.api_client = api_client
+        self.namespace = namespace
+        self.max_workers = max(1, max_workers)
+        self.mode = mode
+        self._dynamic = dynamic_client
+
+    @property
+    def dynamic_client(self) -> dynamic.DynamicClient:
+        if self._dynamic is None:
+            self._dynamic = dynamic.DynamicClient(self.api_client)
+        return self._dynamic
+
+    def apply(self, docs: Iterable[Dict[str, Any]],
+              overrides: Optional[Dict[Tuple[str, str, Optional[str], str], Dict[str, Any]]] = None) -> ApplyReport:
+        """
+        Apply all objects and return per-object results and wall-clock time.
+
+        Args:
+            overrides: (apiVersion, kind, namespace, name) -> the apply_one
+                overrides of that object
+        """
+        report = ApplyReport()
+        start = time.perf_counter()
+        tiers = group_into_tiers(docs)
+        overrides = overrides or {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="apply") as pool:
+            if self.mode == "apply":
+                live_hashes = self._list_live_hashes(pool, [obj for _, objs in tiers for obj in objs])
+                apply_one = lambda obj: self._server_side_apply_one(obj, live_hashes,
+                                                                    overrides.get(self.object_key(obj)))
+            else:
+                apply_one = self._create_one
+
+            for tier_name, objs in tiers:
+                tier_start = time.perf_counter()
+                results = list(pool.map(apply_one, objs))
+                report.results.extend(results)
+                logger.info(f"Applied tier '{tier_name}': {len(objs)} objects "
+                            f"in {time.perf_counter() - tier_start:.3f}s")
+        report.wall_time = time.perf_counter() - start
+        APPLY_RUN_SECONDS.observe(report.wall_time)
+        logger.info(f"Apply finished ({self.mode}): {report.summary()}")
+        return report
+
+    def apply_one(self, obj: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None) -> ApplyResult:
+        """
+        Server-side apply a single object, regardless of its applied hash.
+
+        Args:
+            overrides: Dotted field path -> value set in the applied body but
+                left out of the applied hash (e.g. live spec.replicas)
+        """
+        return self._server_side_apply_one(obj, {}, overrides)
+
+    def delete_one(self, obj: Dict[str, Any]) -> ApplyResult:
+        """Delete a single object; an object that is already gone counts as deleted."""
+        kind = obj.get("kind", "?")
+        name = obj.get("metadata", {}).get("name", "?")
+        start = time.perf_counter()
+        try:
+            resource = self.dynamic_client.resources.get(api_version=obj.get("apiVersion", ""), kind=kind)
+            self.dynamic_client.delete(resource, name=name,
+                                       namespace=self._object_namespace(obj, resource.namespaced))
+            status, error = "deleted", None
+        except Exception as e:
+            if getattr(e, "status", None) == 404:
+                status, error = "deleted", None
+            else:
+                record_api_error("delete", e)
+                status, error = "failed", str(e)
+        return self._result(kind, name, status, time.perf_counter() - start, error)
+
+    def object_key(self, obj: Dict[str, Any]) -> Tuple[str, str, Optional[str], str]:
+        meta = obj.get("metadata", {})
+        return obj.get("apiVersion", ""), obj.get("kind", ""), self._object_namespace(obj), meta.get("name")
+
+    def _object_namespace(self, obj: Dict[str, Any], namespaced: bool = True) -> Optional[str]:
+        if not namespaced:
+            return None
+        return obj.get("metadata", {}).get("namespace") or self.namespace
+
+    def _list_live_hashes(self, pool: ThreadPoolExecutor,
+                          objs: List[Dict[str, Any]]) -> Dict[Tuple[str, str, Optional[str], str], str]:
+        """
+        Read the applied-hash annotation of every managed object, with one
+        LIST call per (apiVersion, kind, namespace).
+        """
+        groups = {(obj.get("apiVersion", ""), obj.get("kind", ""), self._object_namespace(obj))
+                  for obj in objs}
+
+        def list_group(group):
+            api_version, kind, namespace = group
+            try:
+                resource = self.dynamic_client.resources.get(api_version=api_version, kind=kind)
+                if not resource.namespaced:
+                    namespace = None
+                listed = resource.get(namespace=namespace,
+                                      label_selector=f"{MANAGED_BY_LABEL}={FIELD_MANAGER}").to_dict()
+            except Exception as e:
+                record_api_error("list", e)
+                # Unknown kind (e.g. a CRD applied in this run) or list failure:
+                # fall back to applying every object of this kind
+                logger.warning(f"Could not list {kind} in {namespace or 'cluster scope'}: {e}")
+                return {}
+            hashes = {}
+            for item in listed.get("items", []):
+                meta = item.get("metadata", {})
+                live_hash = (meta.get("annotations") or {}).get(HASH_ANNOTATION)
+                if live_hash:
+                    hashes[(api_version, kind, meta.get("namespace"), meta.get("name"))] = live_hash
+            return hashes
+
+        live: Dict[Tuple[str, str, Optional[str], str], str] = {}
+        for hashes in pool.map(list_group, groups):
+            live.update(hashes)
+        logger.info(f"Listed {len(groups)} kinds, found {len(live)} managed objects")
+        return live
+
+    def _server_side_apply_one(self, obj: Dict[str, Any],
+                               live_hashes: Dict[Tuple[str, str, Optional[str], str], str],
+                               overrides: Optional[Dict[str, Any]] = None) -> ApplyResult:
+        api_version = obj.get("apiVersion", "")
+        kind = obj.get("kind", "?")
+        name = obj.get("metadata", {}).get("name", "?")
+        start = time.perf_counter()
+        resource_version = None
+        try:
+            resource = self.dynamic_client.resources.get(api_version=api_version, kind=kind)
+            namespace = self._object_namespace(obj, resource.namespaced)
+            desired_hash = object_hash(obj)
+            if live_hashes.get((api_version, kind, namespace, name)) == desired_hash:
+                status, error = "unchanged", None
+            else:
+                body = copy.deepcopy(obj)
+                meta = body.setdefault("metadata", {})
+                meta.setdefault("annotations", {})[HASH_ANNOTATION] = desired_hash
+                meta.setdefault("labels", {})[MANAGED_BY_LABEL] = FIELD_MANAGER
+                if namespace:
+                    meta["namespace"] = namespace
+                for path, value in (overrides or {}).items():
+                    set_path(body, path, value)
+                applied = self.dynamic_client.server_side_apply(
+                        resource, body=body, name=name, namespace=namespace,
+                        field_manager=FIELD_MANAGER, force_conflicts=True)
+                resource_version = getattr(getattr(applied, "metadata", None), "resourceVersion", None)
+                status, error = "applied", None
+        except Exception as e:
+            record_api_error("apply", e)
+            status, error = "failed", str(e)
+        result = self._result(kind, name, status, time.perf_counter() - start, error)
+        result.resource_version = resource_version
+        return result
+
+    def _create_one(self, obj: Dict[str, Any]) -> ApplyResult:
+        kind = obj.get("kind", "?")
+        name = obj.get("metadata", {}).get("name", "?")
+        start = time.perf_counter()
+        try:
+            utils.create_from_dict(self.api_client, obj, namespace=self.namespace)
+            status, error = "created", None
+        except utils.FailToCreateError as e:
+            if all(getattr(exc, "status", None) == 409 for exc in e.api_exceptions):
+                status, error = "exists", None
+            else:
+                for exc in e.api_exceptions:
+                    record_api_error("create", exc)
+                status, error = "failed", str(e)
+        except Exception as e:
+            record_api_error("create", e)
+            status, error = "failed", str(e)
+        return self._result(kind, name, status, time.perf_counter() - start, error)
+
+    @staticmethod
+    def _result(kind: str, name: str, status: str, latency: float,
+                error: Optional[str]) -> ApplyResult:
+        APPLY_SECONDS.observe(latency, kind=kind, status=status)
+        if error:
+            logger.error(f"Failed applying {kind}/{name}: {error}")
+        elif status != "unchanged":
+            logger.info(f"{kind}/{name} {status} in {latency * 1000:.1f}ms")
+        return ApplyResult(kind=kind, name=name, status=status, latency=latency, error=error)
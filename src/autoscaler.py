@@ -0,0 +1,242 @@
+# autoscaler.py
+
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from metrics import REGISTRY
+from slo_engine import SLOConstraint, SLOEngine, SLOStatus, ServiceMetrics
+
+logger = logging.getLogger("SwarmAgent")
+
+# Field manager of replica changes; the reconciler leaves spec.replicas to it
+AUTOSCALER_FIELD_MANAGER = "swarm-agent-autoscaler"
+REPLICAS_PATH = "spec.replicas"
+
+AUTOSCALE_DECISION_SECONDS = REGISTRY.histogram(
+        "swarm_agent_autoscale_decision_seconds",
+        "Time from the SLO evaluation that triggered a scale to the completed scale PATCH.",
+        ["direction"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+AUTOSCALE_EVENTS = REGISTRY.counter(
+        "swarm_agent_autoscale_events_total", "Scale operations per service and direction.",
+        ["service", "direction"])
+AUTOSCALE_REPLICAS = REGISTRY.gauge(
+        "swarm_agent_autoscale_replicas", "Replicas last set or observed by the autoscaler.", ["service"])
+
+
+@dataclass
+class ScalingPolicy:
+    """How aggressively a service is scaled."""
+    min_replicas: int = 1
+    max_replicas: int = 10
+    # Replicas added or removed per decision: the larger of step and step_ratio * current
+    step: int = 1
+    step_ratio: float = 0.0
+    scale_up_cooldown: float = 60.0
+    scale_down_cooldown: float = 300.0
+    # Scale down only once the metric is this fraction of the threshold on the healthy side
+    hysteresis: float = 0.2
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ScalingPolicy":
+        """Build a policy from the `autoscale_*` keys of the agent config."""
+        defaults = cls()
+        return cls(**{name: type(getattr(defaults, name))(config.get(f"autoscale_{name}", getattr(defaults, name)))
+                      for name in cls.__dataclass_fields__})
+
+    def step_for(self, replicas: int) -> int:
+        return max(self.step, math.ceil(replicas * self.step_ratio))
+
+
+def comfortably_healthy(constraint: SLOConstraint, value: float, hysteresis: float) -> bool:
+    """True when `value` is inside the threshold by at least the hysteresis margin."""
+    margin = abs(constraint.threshold) * hysteresis
+    if constraint.operator in (">", ">="):
+        return value < constraint.threshold - margin
+    if constraint.operator in ("<", "<="):
+        return value > constraint.threshold + margin
+    # Equality constraints give no direction to scale in
+    return False
+
+
+def scale_targets(manifests: Iterable[Dict[str, Any]], services: Iterable[str]) -> Dict[str, str]:
+    """
+    Map SAT services to the Deployments that run them, by name or by
+    the `app`/`service` label the SAT assigns.
+    """
+    services = set(services)
+    targets: Dict[str, str] = {}
+    for obj in manifests:
+        if obj.get("kind") != "Deployment":
+            continue
+        meta = obj.get("metadata") or {}
+        labels = meta.get("labels") or {}
+        for candidate in (meta.get("name"), labels.get("service"), labels.get("app")):
+            if candidate in services and candidate not in targets:
+                targets[candidate] = meta.get("name")
+                break
+    return targets
+
+
+@dataclass
+class _ServiceState:
+    deployment: str
+    replicas: Optional[int] = None
+    last_scale: float = -math.inf
+    healthy_since: Optional[float] = None
+    in_flight: bool = False
+
+
+class Autoscaler:
+    """
+    Scales Deployments on the SLO evaluations of their service.
+
+    Observes every evaluation of the SLO engine. A violated constraint
+    scales the service up by one step once the scale-up cooldown has
+    passed; the service is scaled down only after every constraint has
+    been comfortably healthy (see ScalingPolicy.hysteresis) for the
+    scale-down cooldown. Replica counts are changed through the scale
+    subresource, never by re-applying the manifest.
+    """
+
+    def __init__(self, apps_v1, namespace: str, targets: Dict[str, str],
+                 services: Dict[str, ServiceMetrics], policy: Optional[ScalingPolicy] = None,
+                 policies: Optional[Dict[str, ScalingPolicy]] = None):
+        """
+        Args:
+            apps_v1: kubernetes.client.AppsV1Api
+            namespace: Namespace of the Deployments
+            targets: Service name -> Deployment name, see scale_targets()
+            services: SLO definitions of the services
+            policy: Default scaling policy
+            policies: Per-service policies overriding `policy`
+        """
+        self.apps_v1 = apps_v1
+        self.namespace = namespace
+        self.services = services
+        self.policy = policy or ScalingPolicy()
+        self.policies = policies or {}
+        self._state = {service: _ServiceState(deployment) for service, deployment in targets.items()}
+        # service -> (slo, group) -> latest status
+        self._latest: Dict[str, Dict[Tuple[str, str], SLOStatus]] = {service: {} for service in targets}
+        self._tasks: set = set()
+
+    def inherit(self, previous: "Autoscaler") -> None:
+        """
+        Take over the state and running scales of the autoscaler this one replaces.
+
+        Services still scaling the same Deployment keep their replica
+        count, cooldowns and in-flight flag, so a reload neither loses the
+        cooldown nor scales a service twice at once.
+        """
+        for service, state in previous._state.items():
+            if service in self._state and self._state[service].deployment == state.deployment:
+                self._state[service] = state
+        for task in previous._tasks:
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        previous._tasks = set()
+
+    def attach(self, engine: SLOEngine) -> "Autoscaler":
+        engine.add_listener(self.observe, changes_only=False)
+        logger.info(f"Autoscaling {sorted(self._state)} in {self.namespace}")
+        return self
+
+    def policy_for(self, service: str) -> ScalingPolicy:
+        return self.policies.get(service, self.policy)
+
+    def _constraint(self, service: str, slo: str) -> Optional[SLOConstraint]:
+        for constraint in self.services[service].constraints:
+            if constraint.name == slo:
+                return constraint
+        return None
+
+    def observe(self, status: SLOStatus) -> None:
+        """SLO engine observer; schedules a scale when a decision is due (event loop)."""
+        state = self._state.get(status.service)
+        if state is None:
+            return
+        self._latest[status.service][(status.slo, status.group)] = status
+        if state.in_flight:
+            return
+        if state.replicas is None or self.decide(status.service) is not None:
+            state.in_flight = True
+            task = asyncio.get_running_loop().create_task(self._scale(status.service, status.timestamp))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def decide(self, service: str, now: Optional[float] = None) -> Optional[int]:
+        """Replica count `service` should be scaled to now, or None to leave it."""
+        now = time.time() if now is None else now
+        state = self._state[service]
+        policy = self.policy_for(service)
+        statuses = list(self._latest[service].values())
+        if state.replicas is None or not statuses:
+            return None
+
+        if any(s.violated for s in statuses):
+            state.healthy_since = None
+            if now - state.last_scale < policy.scale_up_cooldown or state.replicas >= policy.max_replicas:
+                return None
+            return min(policy.max_replicas, state.replicas + policy.step_for(state.replicas))
+
+        healthy = all(comfortably_healthy(self._constraint(service, s.slo), s.value, policy.hysteresis)
+                      for s in statuses if self._constraint(service, s.slo) is not None)
+        if not healthy:
+            # Inside the hysteresis band: neither direction
+            state.healthy_since = None
+            return None
+        if state.healthy_since is None:
+            state.healthy_since = now
+        if (now - state.healthy_since < policy.scale_down_cooldown
+                or now - state.last_scale < policy.scale_down_cooldown
+                or state.replicas <= policy.min_replicas):
+            return None
+        return max(policy.min_replicas, state.replicas - policy.step_for(state.replicas))
+
+    def _read_replicas(self, deployment: str) -> int:
+        scale = self.apps_v1.read_namespaced_deployment_scale(deployment, self.namespace)
+        return scale.spec.replicas or 0
+
+    def _patch_replicas(self, deployment: str, replicas: int) -> None:
+        self.apps_v1.patch_namespaced_deployment_scale(
+                deployment, self.namespace, {"spec": {"replicas": replicas}},
+                field_manager=AUTOSCALER_FIELD_MANAGER)
+
+    async def _scale(self, service: str, triggered_at: float) -> None:
+        state = self._state[service]
+        try:
+            if state.replicas is None:
+                state.replicas = await asyncio.to_thread(self._read_replicas, state.deployment)
+                AUTOSCALE_REPLICAS.set(state.replicas, service=service)
+            desired = self.decide(service)
+            if desired is None or desired == state.replicas:
+                return
+            direction = "up" if desired > state.replicas else "down"
+            await asyncio.to_thread(self._patch_replicas, state.deployment, desired)
+            AUTOSCALE_DECISION_SECONDS.observe(max(0.0, time.time() - triggered_at), direction=direction)
+            AUTOSCALE_EVENTS.inc(service=service, direction=direction)
+            AUTOSCALE_REPLICAS.set(desired, service=service)
+            logger.info(f"Scaled {service} ({state.deployment}) {direction} from {state.replicas} to {desired} replicas")
+            state.replicas = desired
+            state.last_scale = time.time()
+            state.healthy_since = None
+        except Exception as e:
+            logger.error(f"Scaling {service} failed: {e}")
+            # Do not retry on every evaluation; wait for the next cooldown
+            state.last_scale = time.time()
+            state.replicas = None
+        finally:
+            state.in_flight = False
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {service: {"deployment": s.deployment, "replicas": s.replicas}
+                for service, s in self._state.items()}
@@ -0,0 +1,101 @@
+# file_watch.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional, Tuple
+
+logger = logging.getLogger("SwarmAgent")
+
+# Called with the new file content once a change has settled
+ChangeCallback = Callable[[bytes], Awaitable[None]]
+
+
+def _fingerprint(path: str) -> Optional[Tuple]:
+    """Cheap identity of the file behind `path`, following symlinks."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return os.path.realpath(path), st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class FileWatcher:
+    """
+    Debounced, content-hashed watcher for one mounted file.
+
+    ConfigMap volumes are updated by the kubelet swapping the `..data`
+    symlink, which inotify on the file itself misses, so the watcher
+    polls a stat fingerprint (resolved path, inode, mtime, size) instead.
+    A change is reported only after the fingerprint has stayed stable
+    for `debounce` seconds and only if the content hash differs from the
+    last reported one, so touches and repeated swaps of the same data
+    never trigger work.
+    """
+
+    def __init__(self, path: str, on_change: ChangeCallback, interval: float = 5.0,
+                 debounce: float = 3.0, name: Optional[str] = None):
+        """
+        Args:
+            path: File to watch
+            on_change: Coroutine function called with the new content
+            interval: Seconds between fingerprint checks
+            debounce: Seconds the file must be unchanged before it is read
+            name: Label used in log messages
+        """
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self.name = name or os.path.basename(path)
+        self.digest: Optional[str] = None
+        self._fingerprint = _fingerprint(path)
+        self._changed_at: Optional[float] = None
+
+    def prime(self, content: Optional[bytes] = None) -> "FileWatcher":
+        """Record the content the agent is currently running with."""
+        if content is None:
+            try:
+                with open(self.path, "rb") as f:
+                    content = f.read()
+            except OSError:
+                return self
+        self.digest = hashlib.sha256(content).hexdigest()
+        return self
+
+    async def run(self) -> None:
+        """Poll until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            fingerprint = _fingerprint(self.path)
+            if fingerprint != self._fingerprint:
+                self._fingerprint = fingerprint
+                self._changed_at = time.monotonic()
+                continue
+            if self._changed_at is None or time.monotonic() - self._changed_at < self.debounce:
+                continue
+            self._changed_at = None
+            await self._check_content()
+
+    async def _check_content(self) -> None:
+        try:
+            content = await asyncio.to_thread(self._read)
+        except OSError as e:
+            logger.warning(f"Could not read changed {self.name}: {e}")
+            return
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self.digest:
+            logger.debug(f"{self.name} touched but content unchanged")
+            return
+        logger.info(f"{self.name} changed ({(self.digest or 'none')[:12]} -> {digest[:12]})")
+        self.digest = digest
+        try:
+            await self.on_change(content)
+        except Exception as e:
+            logger.error(f"Reloading {self.name} failed: {e}")
+
+    def _read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
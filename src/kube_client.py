@@ -0,0 +1,105 @@
+# kube_client.py
+
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from kubernetes import client, config, dynamic
+
+logger = logging.getLogger("SwarmAgent")
+
+# Concurrent apply workers plus long-lived watches share one pool
+DEFAULT_POOL_SIZE = 32
+
+_lock = threading.Lock()
+_api_client: Optional[client.ApiClient] = None
+_dynamic_client: Optional[dynamic.DynamicClient] = None
+_node_labels: Dict[str, Dict[str, str]] = {}
+_nodes: List[Dict[str, Any]] = []
+_nodes_listed_at = 0.0
+
+
+def _keepalive_socket_options():
+    options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+               (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+    # Detect dead API server connections (e.g. idle watches) within about a minute
+    for name, value in (("TCP_KEEPIDLE", 30), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def get_api_client() -> client.ApiClient:
+    """
+    Return the process-wide Kubernetes API client.
+
+    Loaded once from the in-cluster ServiceAccount (falling back to the
+    local kubeconfig), with a connection pool large enough for the apply
+    workers and watches and TCP keep-alive on every connection, so all
+    callers share TLS sessions instead of paying a handshake each.
+    """
+    global _api_client
+    with _lock:
+        if _api_client is None:
+            configuration = client.Configuration()
+            try:
+                config.load_incluster_config(client_configuration=configuration)
+            except config.ConfigException:
+                config.load_kube_config(client_configuration=configuration)
+            configuration.connection_pool_maxsize = int(os.getenv("SA_KUBE_POOL_SIZE", DEFAULT_POOL_SIZE))
+            configuration.socket_options = _keepalive_socket_options()
+            _api_client = client.ApiClient(configuration)
+            logger.info(f"Kubernetes client ready ({configuration.host}, "
+                        f"pool size {configuration.connection_pool_maxsize})")
+        return _api_client
+
+
+def get_dynamic_client() -> dynamic.DynamicClient:
+    """Return the process-wide dynamic client; API discovery runs only once."""
+    global _dynamic_client
+    api_client = get_api_client()
+    with _lock:
+        if _dynamic_client is None:
+            _dynamic_client = dynamic.DynamicClient(api_client)
+        return _dynamic_client
+
+
+def get_core_v1() -> client.CoreV1Api:
+    return client.CoreV1Api(get_api_client())
+
+
+def get_apps_v1() -> client.AppsV1Api:
+    return client.AppsV1Api(get_api_client())
+
+
+def get_node_labels(node_name: str, refresh: bool = False) -> Dict[str, str]:
+    """Labels of `node_name`, read from the API server once and then cached."""
+    with _lock:
+        if not refresh and node_name in _node_labels:
+            return _node_labels[node_name]
+    labels = get_core_v1().read_node(node_name).metadata.labels or {}
+    with _lock:
+        _node_labels[node_name] = labels
+    return labels
+
+
+def list_nodes(max_age: float = 60.0) -> List[Dict[str, Any]]:
+    """
+    All Node objects as dicts, listed at most once per `max_age` seconds.
+
+    Also refreshes the node label cache used by get_node_labels().
+    """
+    global _nodes, _nodes_listed_at
+    with _lock:
+        if _nodes and time.monotonic() - _nodes_listed_at < max_age:
+            return _nodes
+    items = get_api_client().sanitize_for_serialization(get_core_v1().list_node().items)
+    with _lock:
+        _nodes, _nodes_listed_at = items, time.monotonic()
+        for item in items:
+            meta = item.get("metadata") or {}
+            _node_labels[meta.get("name")] = meta.get("labels") or {}
+    return items
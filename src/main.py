@@ -1,19 +1,27 @@
+import asyncio
 import os
-import subprocess
 import sys
 import signal
 import logging
-from SA import SwarmAgent
-from utility import setup_logging
+from startup_profile import PROFILER
 
+with PROFILER.phase("imports"):
+    from SA import SwarmAgent
+    from utility import setup_logging
 
-def signal_handler(signum, frame):
-    """Handle shutdown signals gracefully"""
+
+def handle_signal(sa, signum):
+    """Handle shutdown signals gracefully: wake the event loop and drain"""
     print(f"\nReceived signal {signum}, shutting down...")
-    global sa
-    if sa:
-        sa.stop()
-    sys.exit(0)
+    sa.stop()
+
+
+async def run_agent(sa):
+    """Run the agent on the event loop, draining immediately on SIGINT/SIGTERM"""
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, handle_signal, sa, signum)
+    await sa.run()
 
 
 def get_node_role():
@@ -22,10 +30,9 @@ def get_node_role():
         return "default"
 
     try:
-        role = subprocess.check_output([
-            "kubectl", "get", "node", node_name,
-            "-o", "jsonpath={.metadata.labels.role}"
-        ]).decode("utf-8").strip()
+        # Shared, pooled client; node labels are read once and cached
+        from kube_client import get_node_labels
+        role = get_node_labels(node_name).get("role", "")
         return role or "default"
     except Exception as e:
         print(f"⚠️ Could not fetch node role: {e}")
@@ -41,11 +48,6 @@ def main():
 
     logger.info("Starting Swarm Agent Application")
 
-    # Setup signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-
-    global sa
     sa = None
 
     try:
@@ -53,7 +55,13 @@ def main():
         print(f"node name is {node_name}")
 
         default_config = f"/config/config-{node_name}.yaml"
+        # Large clusters ship one shared base config instead of a file per node
+        if not os.path.exists(default_config) and os.path.exists("/config/base.yaml"):
+            default_config = "/config/base.yaml"
         default_tosca  = f"/tosca/tosca.yaml"
+        # Large SATs ship gzip-packaged, described by a manifest (generate-configMaps.py --compress)
+        if not os.path.exists(default_tosca) and os.path.exists("/tosca/tosca.manifest.json"):
+            default_tosca = "/tosca/tosca.manifest.json"
 
         config_path = sys.argv[1] if len(sys.argv) > 1 else default_config
         tosca_path = sys.argv[2] if len(sys.argv) > 2 else default_tosca
@@ -61,27 +69,11 @@ def main():
         print(f"✅ Using config: {config_path}")
         print(f"✅ Using tosca: {tosca_path}")
 
-        # Create and start Swarm Agent
+        # Create the Swarm Agent and run it until a shutdown signal arrives
         sa = SwarmAgent(config_path=config_path, tosca_path=tosca_path)
-        sa.start()
-
-        # Keep the application running
         logger.info("Swarm Agent is running. Press Ctrl+C to stop.")
+        asyncio.run(run_agent(sa))
 
-        # Simple main loop
-        while sa.is_running:
-            try:
-                # Print status periodically
-                status = sa.get_status()
-                logger.info(f"Status: SA {status['sa_id']} ({status['role']}) - Running: {status['is_running']}")
-
-                # Sleep for 30 seconds
-                import time
-                time.sleep(30)
-                
-            except KeyboardInterrupt:
-                break
-                
     except Exception as e:
         logger.error(f"Error in main: {e}")
         return 1
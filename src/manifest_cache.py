@@ -0,0 +1,135 @@
+# manifest_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("SwarmAgent")
+
+# Bump when the on-disk entry layout changes so stale entries are never reused
+CACHE_FORMAT_VERSION = "1"
+TRANSLATOR_PACKAGE = "k3s-client"
+
+
+def get_translator_version() -> str:
+    """Return the installed version of the TOSCA translator package."""
+    try:
+        from importlib.metadata import version
+        return version(TRANSLATOR_PACKAGE)
+    except Exception:
+        return "unknown"
+
+
+class ManifestCache:
+    """
+    Persistent, content-addressed cache of TOSCA-to-manifest translations.
+
+    Entries are keyed by a hash of the SAT contents, the image pull secret
+    and the translator version, and stored as one JSON file per key. The
+    cache is bounded by entry count and total bytes; the least recently
+    used entries (by mtime) are evicted first.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int = 32,
+                 max_bytes: int = 64 * 1024 * 1024, enabled: bool = True):
+        """
+        Args:
+            cache_dir: Directory holding cache entries
+            max_entries: Maximum number of entries kept on disk
+            max_bytes: Maximum total size of entries kept on disk
+            enabled: When False every lookup is a miss and nothing is stored
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(sat_content: bytes, image_pull_secret: str,
+                 translator_version: Optional[str] = None) -> str:
+        """Compute the cache key for a SAT translation."""
+        if translator_version is None:
+            translator_version = get_translator_version()
+        digest = hashlib.sha256()
+        for part in (CACHE_FORMAT_VERSION.encode(), translator_version.encode(),
+                     image_pull_secret.encode(), sat_content):
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached manifests for `key`, or None on a miss."""
+        if not self.enabled:
+            self.misses += 1
+            return None
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            manifests = entry["manifests"]
+            # Refresh mtime so eviction keeps recently used entries
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable manifest cache entry {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return manifests
+
+    def put(self, key: str, manifests: List[Dict[str, Any]]) -> None:
+        """Store manifests under `key` and evict entries over the size bounds."""
+        if not self.enabled:
+            return
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "manifests": manifests}, f, separators=(",", ":"))
+            os.replace(tmp_path, self._entry_path(key))
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to store manifest cache entry {key}: {e}")
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        try:
+            entries = []
+            for path in self.cache_dir.glob("*.json"):
+                st = path.stat()
+                entries.append((st.st_mtime, st.st_size, path))
+        except OSError as e:
+            logger.warning(f"Failed to scan manifest cache {self.cache_dir}: {e}")
+            return
+
+        entries.sort(key=lambda e: e[0], reverse=True)
+        total = 0
+        for index, (_, size, path) in enumerate(entries):
+            total += size
+            # Never evict the most recent entry, even if it alone exceeds max_bytes
+            if index > 0 and (index >= self.max_entries or total > self.max_bytes):
+                logger.info(f"Evicting manifest cache entry {path.name}")
+                self._remove(path)
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,355 @@
+# metrics.py
+
+import asyncio
+import bisect
+import json
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("SwarmAgent")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers single object applies (ms) up to full translations (tens of s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down.
+
+    Either set explicitly, or computed at scrape time by a callback that
+    returns {label values tuple: value} (or a plain number without labels),
+    which keeps hot paths free of bookkeeping for derived values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback: Optional[Callable[[], Any]] = None
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, callback: Optional[Callable[[], Any]]) -> None:
+        self._callback = callback
+
+    def value(self, **labels) -> Optional[float]:
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def _collect(self) -> List[Tuple[Tuple[str, ...], float]]:
+        if self._callback is None:
+            with self._lock:
+                return list(self._values.items())
+        try:
+            result = self._callback()
+        except Exception as e:
+            logger.warning(f"Collecting {self.name} failed: {e}")
+            return []
+        if result is None:
+            return []
+        if isinstance(result, dict):
+            return [((key,) if not isinstance(key, tuple) else key, value)
+                    for key, value in result.items() if value is not None]
+        return [((), result)]
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in self._collect()]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets, optionally per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of the enclosed block."""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(s[0]), s[1], s[2]) for key, s in self._series.items()]
+        lines = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Registry:
+    """Ordered collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry and the agent's series
+REGISTRY = Registry()
+
+TRANSLATION_SECONDS = REGISTRY.histogram(
+        "swarm_agent_translation_duration_seconds", "Time spent translating the SAT into manifests.",
+        ["cache"])
+MANIFEST_CACHE_LOOKUPS = REGISTRY.counter(
+        "swarm_agent_manifest_cache_lookups_total", "Translation cache lookups by result.", ["result"])
+APPLY_SECONDS = REGISTRY.histogram(
+        "swarm_agent_apply_duration_seconds", "Latency of applying one object, per kind and outcome.",
+        ["kind", "status"])
+APPLY_RUN_SECONDS = REGISTRY.histogram(
+        "swarm_agent_apply_run_duration_seconds", "Wall time of one full apply of the manifest set.")
+API_ERRORS = REGISTRY.counter(
+        "swarm_agent_apiserver_errors_total", "Failed Kubernetes API calls by operation and HTTP status.",
+        ["operation", "code"])
+P2P_MESSAGES = REGISTRY.counter(
+        "swarm_agent_p2p_messages_total", "P2P messages by direction and type.", ["direction", "type"])
+P2P_QUEUE_DEPTH = REGISTRY.gauge(
+        "swarm_agent_p2p_queue_depth", "Messages waiting in each peer's send queue.", ["peer"])
+P2P_DROPPED = REGISTRY.gauge(
+        "swarm_agent_p2p_dropped_messages", "Messages dropped or coalesced away per peer since start.",
+        ["peer"])
+P2P_UNPACED = REGISTRY.counter(
+        "swarm_agent_p2p_unpaced_sends_total",
+        "Frames sent to peers whose transport buffer could not be read, so nothing held them back.")
+P2P_JOIN_SECONDS = REGISTRY.histogram(
+        "swarm_agent_p2p_join_seconds", "Time from the first join attempt to joining the P2P network, or giving up.",
+        ["outcome"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+P2P_JOIN_ATTEMPTS = REGISTRY.counter(
+        "swarm_agent_p2p_join_attempts_total", "P2P join attempts per candidate source and outcome.",
+        ["source", "outcome"])
+RECONCILE_LAG = REGISTRY.gauge(
+        "swarm_agent_reconcile_lag_seconds", "How long the most overdue object has waited for reconciliation.")
+RECONCILE_SECONDS = REGISTRY.histogram(
+        "swarm_agent_reconcile_duration_seconds", "Time from an object being queued to it being reconciled.",
+        ["action"])
+RECONCILE_ACTIONS = REGISTRY.counter(
+        "swarm_agent_reconcile_actions_total", "Reconcile outcomes: in_sync, created, repaired or failed.",
+        ["action"])
+RECONCILE_QUEUE_DEPTH = REGISTRY.gauge(
+        "swarm_agent_reconcile_queue_depth", "Objects queued for reconciliation, including backed-off ones.")
+EVENT_LOOP_LAG = REGISTRY.gauge(
+        "swarm_agent_event_loop_lag_seconds", "Scheduling delay of the agent's event loop at the last heartbeat.")
+STARTUP_PHASE_SECONDS = REGISTRY.gauge(
+        "swarm_agent_startup_phase_seconds", "Wall time spent in each startup phase.", ["phase"])
+READY = REGISTRY.gauge("swarm_agent_ready", "1 when the agent has finished starting up.")
+
+
+def record_api_error(operation: str, error: BaseException) -> None:
+    """Count a failed API call, labelled with its HTTP status when there is one."""
+    API_ERRORS.inc(operation=operation, code=getattr(error, "status", None) or "error")
+
+
+class MetricsServer:
+    """
+    Minimal HTTP server for /metrics, /healthz and /readyz.
+
+    Runs on the agent's event loop with asyncio streams, so it needs no
+    extra thread or dependency and answering /healthz proves the loop is
+    responsive. Probe callbacks return (ok, detail dict). With
+    `serve_metrics` off only the health endpoints are served.
+    """
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 9090,
+                 registry: Registry = REGISTRY,
+                 liveness: Optional[Callable[[], Tuple[bool, Dict[str, Any]]]] = None,
+                 readiness: Optional[Callable[[], Tuple[bool, Dict[str, Any]]]] = None,
+                 serve_metrics: bool = True):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.liveness = liveness or (lambda: (True, {}))
+        self.readiness = readiness or (lambda: (True, {}))
+        self.serve_metrics = serve_metrics
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> "MetricsServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"{'Metrics and health' if self.serve_metrics else 'Health'} endpoints "
+                    f"listening on {self.host}:{self.port}")
+        return self
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _route(self, path: str) -> Tuple[int, str, bytes]:
+        if path == "/metrics" and self.serve_metrics:
+            return 200, CONTENT_TYPE, self.registry.render().encode()
+        if path in ("/healthz", "/livez", "/readyz"):
+            probe = self.readiness if path == "/readyz" else self.liveness
+            try:
+                ok, detail = probe()
+            except Exception as e:
+                ok, detail = False, {"error": str(e)}
+            body = json.dumps({"status": "ok" if ok else "fail", **detail}, default=str).encode()
+            return (200 if ok else 503), "application/json", body
+        return 404, "text/plain", b"not found\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain headers; probes and scrapers send no body on GET
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b"\r\n", b"\n"):
+                    break
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] not in ("GET", "HEAD"):
+                status, content_type, body = 405, "text/plain", b"method not allowed\n"
+            else:
+                status, content_type, body = self._route(parts[1].split("?", 1)[0])
+            reason = {200: "OK", 404: "Not Found", 405: "Method Not Allowed",
+                      503: "Service Unavailable"}[status]
+            head = (f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+            writer.write(head if parts and parts[0] == "HEAD" else head + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.warning(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
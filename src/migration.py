@@ -0,0 +1,489 @@
+# migration.py
+
+import asyncio
+import copy
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from kubernetes.client.exceptions import ApiException
+
+from metrics import REGISTRY, record_api_error
+from readiness import rollout_complete
+from sharding import HOSTNAME_LABEL, pod_spec_of
+from slo_engine import SLOEngine, SLOStatus
+
+logger = logging.getLogger("SwarmAgent")
+
+MIGRATION_FIELD_MANAGER = "swarm-agent-migration"
+MIGRATED_AT_ANNOTATION = "swarmchestrate.eu/migrated-at"
+# Node a migration pinned the Deployment to; survives agent restarts and
+# tells every agent where the Deployment now lives
+MIGRATED_TO_ANNOTATION = "swarmchestrate.eu/migrated-to"
+PREPULL_LABEL = "swarmchestrate.eu/prepull"
+# Pod placement fields a migration changes; the reconciler keeps their live values
+PLACEMENT_PATHS = ("spec.template.spec.affinity", "spec.template.spec.nodeSelector")
+# Node conditions that mean the node is degraded when True
+PRESSURE_CONDITIONS = ("MemoryPressure", "DiskPressure", "PIDPressure", "NetworkUnavailable")
+# Container waiting reasons that mean the image could not be pulled
+PULL_FAILURES = ("ErrImagePull", "ImagePullBackOff", "InvalidImageName", "ErrImageNeverPull")
+
+_DURATION_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+MIGRATION_SECONDS = REGISTRY.histogram(
+        "swarm_agent_migration_seconds", "Duration of a service migration, from decision to old pods drained.",
+        ["result"], buckets=_DURATION_BUCKETS)
+MIGRATION_PREPULL_SECONDS = REGISTRY.histogram(
+        "swarm_agent_migration_prepull_seconds", "Time to pre-pull a migrating service's images on the target node.",
+        buckets=_DURATION_BUCKETS)
+MIGRATION_UNAVAILABLE_SECONDS = REGISTRY.histogram(
+        "swarm_agent_migration_unavailable_seconds",
+        "Time during a migration with fewer available replicas than desired.",
+        buckets=(0.0, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+MIGRATIONS = REGISTRY.counter(
+        "swarm_agent_migrations_total", "Service migrations per reason and result.", ["service", "reason", "result"])
+
+
+def node_degraded(node: Dict[str, Any]) -> Optional[str]:
+    """Why a Node object is degraded (cordoned, not ready, under pressure), or None."""
+    if (node.get("spec") or {}).get("unschedulable"):
+        return "cordoned"
+    for condition in (node.get("status") or {}).get("conditions") or []:
+        kind, status = condition.get("type"), condition.get("status")
+        if kind == "Ready" and status != "True":
+            return "not ready"
+        if kind in PRESSURE_CONDITIONS and status == "True":
+            return kind
+    return None
+
+
+def pinned_node(pod_spec: Dict[str, Any]) -> Optional[str]:
+    """The single node a pod spec is pinned to by nodeName, hostname selector or affinity."""
+    if pod_spec.get("nodeName"):
+        return pod_spec["nodeName"]
+    selected = (pod_spec.get("nodeSelector") or {}).get(HOSTNAME_LABEL)
+    if selected:
+        return selected
+    required = (((pod_spec.get("affinity") or {}).get("nodeAffinity") or {})
+                .get("requiredDuringSchedulingIgnoredDuringExecution") or {})
+    terms = required.get("nodeSelectorTerms") or []
+    if len(terms) == 1:
+        for expression in terms[0].get("matchExpressions") or []:
+            if (expression.get("key") == HOSTNAME_LABEL and expression.get("operator") == "In"
+                    and len(expression.get("values") or []) == 1):
+                return expression["values"][0]
+    return None
+
+
+def pin_patch(pod_spec: Dict[str, Any], node: str) -> Dict[str, Any]:
+    """Pod spec patch moving the pods to `node`, in the form the spec already uses."""
+    if (pod_spec.get("nodeSelector") or {}).get(HOSTNAME_LABEL):
+        return {"nodeSelector": {HOSTNAME_LABEL: node}}
+    return {"affinity": {"nodeAffinity": {"requiredDuringSchedulingIgnoredDuringExecution": {"nodeSelectorTerms": [
+        {"matchExpressions": [{"key": HOSTNAME_LABEL, "operator": "In", "values": [node]}]}]}}}}
+
+
+def migrated_nodes(deployments: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+    """Deployment name -> node, for the live Deployments a migration pinned."""
+    nodes = {}
+    for obj in deployments:
+        meta = obj.get("metadata") or {}
+        node = (meta.get("annotations") or {}).get(MIGRATED_TO_ANNOTATION)
+        if node and meta.get("name"):
+            nodes[meta["name"]] = node
+    return nodes
+
+
+def apply_pins(manifests: Iterable[Dict[str, Any]], nodes: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Copy of `manifests` with each Deployment named in `nodes` pinned to
+    its node, as Migrator patches the live object.
+    """
+    pinned = []
+    for obj in manifests:
+        node = nodes.get((obj.get("metadata") or {}).get("name"))
+        if obj.get("kind") == "Deployment" and node:
+            obj = copy.deepcopy(obj)
+            pod_spec = pod_spec_of(obj)
+            patch = pin_patch(pod_spec, node)
+            if "nodeSelector" in patch:
+                pod_spec["nodeSelector"].update(patch["nodeSelector"])
+            else:
+                affinity = pod_spec.setdefault("affinity", {}).setdefault("nodeAffinity", {})
+                affinity.update(patch["affinity"]["nodeAffinity"])
+        pinned.append(obj)
+    return pinned
+
+
+def prepull_pod(name: str, node: str, pod_spec: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    Short-lived pod that pulls every image of `pod_spec` on `node`.
+
+    Bound to the node directly (no scheduling), one container per image
+    with the image's own entrypoint; the pod is deleted as soon as every
+    image is pulled, and activeDeadlineSeconds bounds it if the agent
+    goes away first.
+    """
+    images: List[str] = []
+    for container in (pod_spec.get("initContainers") or []) + (pod_spec.get("containers") or []):
+        if container.get("image") and container["image"] not in images:
+            images.append(container["image"])
+    spec = {
+        "nodeName": node,
+        "restartPolicy": "Never",
+        "activeDeadlineSeconds": max(1, int(timeout)),
+        "terminationGracePeriodSeconds": 0,
+        "automountServiceAccountToken": False,
+        "containers": [{"name": f"pull-{i}", "image": image, "imagePullPolicy": "IfNotPresent",
+                        "resources": {"requests": {"cpu": "1m", "memory": "1Mi"}}}
+                       for i, image in enumerate(images)],
+    }
+    for key in ("imagePullSecrets", "tolerations"):
+        if pod_spec.get(key):
+            spec[key] = pod_spec[key]
+    return {"apiVersion": "v1", "kind": "Pod",
+            "metadata": {"name": name, "labels": {PREPULL_LABEL: "true"}}, "spec": spec}
+
+
+def images_pulled(pod: Dict[str, Any]) -> Optional[bool]:
+    """True once every container got past its image pull, False if a pull failed, None while pulling."""
+    statuses = (pod.get("status") or {}).get("containerStatuses") or []
+    expected = len((pod.get("spec") or {}).get("containers") or [])
+    if len(statuses) < expected:
+        return None
+    for status in statuses:
+        state = status.get("state") or {}
+        waiting = state.get("waiting")
+        if waiting:
+            if waiting.get("reason") in PULL_FAILURES:
+                return False
+            # Creating the container comes after the pull only once imageID is known
+            if waiting.get("reason") in (None, "ContainerCreating", "PodInitializing") and not status.get("imageID"):
+                return None
+    return True
+
+
+class Migrator:
+    """
+    Moves a Deployment's pods to another node with overlap-based cutover.
+
+    1. Pre-pulls the pod images on the target node with a short-lived pod.
+    2. Re-pins the pod template to the target with a RollingUpdate of
+       maxSurge 1 / maxUnavailable 0, so each new pod has to become
+       ready before an old one is drained.
+    3. Follows the rollout to completion, measuring the time with fewer
+       available replicas than desired. A rollout that does not finish
+       in time is reverted to the original node.
+    """
+
+    def __init__(self, core_v1, apps_v1, namespace: str, prepull_timeout: float = 300.0,
+                 rollout_timeout: float = 600.0, poll_interval: float = 0.5):
+        """
+        Args:
+            core_v1: kubernetes.client.CoreV1Api
+            apps_v1: kubernetes.client.AppsV1Api
+            namespace: Namespace of the Deployments
+            prepull_timeout: Seconds to wait for the images on the target node
+            rollout_timeout: Seconds to wait for the new pods to become ready
+            poll_interval: Seconds between status reads
+        """
+        self.core_v1 = core_v1
+        self.apps_v1 = apps_v1
+        self.namespace = namespace
+        self.prepull_timeout = prepull_timeout
+        self.rollout_timeout = rollout_timeout
+        self.poll_interval = poll_interval
+
+    def _read_deployment(self, name: str) -> Dict[str, Any]:
+        obj = self.apps_v1.read_namespaced_deployment(name, self.namespace)
+        data = self.apps_v1.api_client.sanitize_for_serialization(obj)
+        data.setdefault("kind", "Deployment")
+        return data
+
+    def current_node(self, deployment: str) -> Optional[str]:
+        return pinned_node(pod_spec_of(self._read_deployment(deployment)) or {})
+
+    def prepull(self, deployment: str, node: str) -> float:
+        """Pull the Deployment's images on `node`; returns the seconds it took."""
+        started = time.monotonic()
+        pod_spec = pod_spec_of(self._read_deployment(deployment)) or {}
+        suffix = hashlib.sha256(f"{deployment}/{node}/{time.time()}".encode()).hexdigest()[:8]
+        name = f"swarm-prepull-{deployment}"[:52] + f"-{suffix}"
+        self.core_v1.create_namespaced_pod(self.namespace, prepull_pod(name, node, pod_spec, self.prepull_timeout),
+                                           field_manager=MIGRATION_FIELD_MANAGER)
+        try:
+            while True:
+                pod = self.core_v1.api_client.sanitize_for_serialization(
+                        self.core_v1.read_namespaced_pod(name, self.namespace))
+                pulled = images_pulled(pod)
+                if pulled:
+                    break
+                if pulled is False:
+                    raise RuntimeError(f"images of {deployment} could not be pulled on {node}")
+                if time.monotonic() - started > self.prepull_timeout:
+                    raise TimeoutError(f"pre-pulling {deployment} on {node} timed out")
+                time.sleep(self.poll_interval)
+        finally:
+            try:
+                self.core_v1.delete_namespaced_pod(name, self.namespace, grace_period_seconds=0)
+            except ApiException as e:
+                if e.status != 404:
+                    record_api_error("delete", e)
+        seconds = time.monotonic() - started
+        MIGRATION_PREPULL_SECONDS.observe(seconds)
+        return seconds
+
+    def _patch_node(self, deployment: str, pod_spec: Dict[str, Any], node: str) -> None:
+        body = {
+            "metadata": {"annotations": {MIGRATED_AT_ANNOTATION: datetime.now(timezone.utc).isoformat(),
+                                         MIGRATED_TO_ANNOTATION: node}},
+            "spec": {"strategy": {"type": "RollingUpdate",
+                                  "rollingUpdate": {"maxSurge": 1, "maxUnavailable": 0}},
+                     "template": {"spec": pin_patch(pod_spec, node)}},
+        }
+        self.apps_v1.patch_namespaced_deployment(deployment, self.namespace, body,
+                                                 field_manager=MIGRATION_FIELD_MANAGER)
+
+    def cutover(self, deployment: str, node: str) -> Tuple[bool, float]:
+        """
+        Re-pin the Deployment to `node` and wait for the rollout.
+
+        Returns:
+            (completed, seconds with fewer available replicas than desired)
+        """
+        live = self._read_deployment(deployment)
+        pod_spec = pod_spec_of(live) or {}
+        previous = pinned_node(pod_spec)
+        self._patch_node(deployment, pod_spec, node)
+
+        started = last = time.monotonic()
+        unavailable = 0.0
+        while True:
+            obj = self._read_deployment(deployment)
+            now = time.monotonic()
+            status = obj.get("status") or {}
+            if (status.get("availableReplicas") or 0) < (obj.get("spec") or {}).get("replicas", 1):
+                unavailable += now - last
+            last = now
+            if rollout_complete(obj):
+                return True, unavailable
+            if now - started > self.rollout_timeout:
+                break
+            time.sleep(self.poll_interval)
+
+        logger.error(f"Migration of {deployment} to {node} did not complete, moving it back to {previous}")
+        if previous:
+            self._patch_node(deployment, pod_spec, previous)
+        return False, unavailable
+
+    def migrate(self, deployment: str, node: str) -> Tuple[bool, float]:
+        """Pre-pull, then cut over (blocking). Returns (completed, unavailable seconds)."""
+        self.prepull(deployment, node)
+        return self.cutover(deployment, node)
+
+
+class MigrationController:
+    """
+    Decides when and where services move.
+
+    A service migrates when the node it is pinned to degrades (see
+    node_degraded) or when one of its SLO constraints has stayed
+    violated for `slo_after` seconds. The target comes from the
+    `choose_target` callback (the placement solver without the nodes to
+    avoid); colocated services move together, and when one of them fails
+    the ones that already moved go back. A service migrates at most
+    once per `cooldown`.
+    """
+
+    def __init__(self, migrator: Migrator, deployments: Dict[str, str],
+                 choose_target: Callable[[str, Set[str], Dict[str, str]], Optional[str]],
+                 groups: Iterable[Iterable[str]] = (), slo_after: float = 600.0, cooldown: float = 900.0,
+                 on_migrated: Optional[Callable[[str, str], None]] = None):
+        """
+        Args:
+            migrator: Performs the moves
+            deployments: Service name -> Deployment name
+            choose_target: (service, nodes to avoid, current service -> node pins) -> target node or None
+            groups: Colocation groups; services of a group move together
+            slo_after: Seconds an SLO must stay violated before its service moves
+            cooldown: Minimum seconds between two migrations of a service
+            on_migrated: Called with (service, node) after each completed move
+        """
+        self.migrator = migrator
+        self.deployments = dict(deployments)
+        self.choose_target = choose_target
+        self.slo_after = slo_after
+        self.cooldown = cooldown
+        self.on_migrated = on_migrated
+        self._group_of: Dict[str, List[str]] = {}
+        for group in groups:
+            members = [s for s in group if s in self.deployments]
+            for service in members:
+                self._group_of[service] = members
+        self.pins: Dict[str, str] = {}
+        self.degraded: Dict[str, str] = {}
+        self._violated_since: Dict[Tuple[str, str, str], float] = {}
+        self._last_migration: Dict[str, float] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: set = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def set_pins(self, manifests: Iterable[Dict[str, Any]]) -> None:
+        """Record the node each managed Deployment is pinned to in `manifests`."""
+        by_deployment = {deployment: service for service, deployment in self.deployments.items()}
+        for obj in manifests:
+            service = by_deployment.get((obj.get("metadata") or {}).get("name"))
+            if obj.get("kind") == "Deployment" and service:
+                node = pinned_node(pod_spec_of(obj) or {})
+                if node:
+                    self.pins[service] = node
+
+    def inherit(self, previous: "MigrationController") -> None:
+        """
+        Carry node health, cooldowns and running migrations over from the
+        controller this one replaces.
+
+        Migrations still running in `previous` are adopted rather than
+        restarted: their services stay in flight here, and the state they
+        record when they finish (pins, cooldowns) lands in this controller.
+        """
+        self.degraded.update(previous.degraded)
+        self._last_migration.update(previous._last_migration)
+        self._in_flight.update(previous._in_flight)
+        for service in previous._in_flight:
+            if service in previous.pins:
+                self.pins[service] = previous.pins[service]
+        previous.pins, previous._last_migration, previous._in_flight = self.pins, self._last_migration, self._in_flight
+        for task in previous._tasks:
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        previous._tasks = set()
+
+    def attach(self, engine: Optional[SLOEngine], loop: asyncio.AbstractEventLoop) -> "MigrationController":
+        self.loop = loop
+        if engine is not None:
+            engine.add_listener(self.observe, changes_only=False)
+        return self
+
+    def observe(self, status: SLOStatus) -> None:
+        """SLO engine observer (event loop)."""
+        if status.service not in self.deployments:
+            return
+        key = (status.service, status.slo, status.group)
+        if not status.violated:
+            self._violated_since.pop(key, None)
+            return
+        since = self._violated_since.setdefault(key, status.timestamp)
+        if status.timestamp - since >= self.slo_after:
+            self._violated_since.pop(key, None)
+            self.trigger(status.service, f"slo:{status.slo}")
+
+    def node_event(self, event_type: str, node: Dict[str, Any]) -> None:
+        """Node watch listener (watch thread)."""
+        name = (node.get("metadata") or {}).get("name")
+        reason = "deleted" if event_type == "DELETED" else node_degraded(node)
+        if self.loop is None or not name:
+            return
+        self.loop.call_soon_threadsafe(self._node_changed, name, reason)
+
+    def _node_changed(self, name: str, reason: Optional[str]) -> None:
+        if reason is None:
+            if self.degraded.pop(name, None):
+                logger.info(f"Node {name} recovered")
+            return
+        if name not in self.degraded:
+            logger.warning(f"Node {name} degraded ({reason})")
+        self.degraded[name] = reason
+        for service, node in sorted(self.pins.items()):
+            if node == name:
+                self.trigger(service, f"node:{reason}")
+
+    def trigger(self, service: str, reason: str) -> None:
+        group = self._group_of.get(service, [service])
+        now = time.monotonic()
+        if any(s in self._in_flight for s in group):
+            return
+        if now - self._last_migration.get(service, -self.cooldown) < self.cooldown:
+            logger.info(f"Not migrating {service} ({reason}): migrated less than {self.cooldown:.0f}s ago")
+            return
+        self._in_flight.update(group)
+        task = self.loop.create_task(self._migrate(group, reason))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _migrate(self, group: List[str], reason: str) -> None:
+        started = time.monotonic()
+        result = "failed"
+        current: Optional[str] = None
+        moved: List[str] = []
+        try:
+            current = self.pins.get(group[0]) or await asyncio.to_thread(
+                    self.migrator.current_node, self.deployments[group[0]])
+            avoid = set(self.degraded) | ({current} if current else set())
+            fixed = {s: n for s, n in self.pins.items() if s not in group}
+            target = await asyncio.to_thread(self.choose_target, group[0], avoid, fixed)
+            if not target:
+                result = "no_target"
+                logger.warning(f"No node to migrate {group} to ({reason})")
+                return
+            logger.info(f"Migrating {group} from {current} to {target} ({reason})")
+            # Every image is on the target before the first service moves,
+            # so a failed pull cannot split the group
+            for service in group:
+                await asyncio.to_thread(self.migrator.prepull, self.deployments[service], target)
+            unavailable = 0.0
+            for service in group:
+                completed, window = await asyncio.to_thread(self.migrator.cutover, self.deployments[service], target)
+                unavailable += window
+                if not completed:
+                    result = "rolled_back"
+                    await self._move_back(moved, current)
+                    return
+                moved.append(service)
+                self._pin(service, target)
+            result = "completed"
+            MIGRATION_UNAVAILABLE_SECONDS.observe(unavailable)
+            logger.info(f"Migrated {group} to {target} in {time.monotonic() - started:.1f}s "
+                        f"({unavailable:.1f}s with fewer available replicas than desired)")
+        except Exception as e:
+            logger.error(f"Migrating {group} failed: {e}")
+            await self._move_back(moved, current)
+        finally:
+            MIGRATION_SECONDS.observe(time.monotonic() - started, result=result)
+            for service in group:
+                MIGRATIONS.inc(service=service, reason=reason.split(":", 1)[0], result=result)
+                self._last_migration[service] = time.monotonic()
+            self._in_flight.difference_update(group)
+
+    def _pin(self, service: str, node: str) -> None:
+        self.pins[service] = node
+        if self.on_migrated:
+            self.on_migrated(service, node)
+
+    async def _move_back(self, services: List[str], node: Optional[str]) -> None:
+        """Return the members of a group that already moved to `node`, keeping the group together."""
+        if not services:
+            return
+        if not node:
+            logger.error(f"Cannot move {services} back: the node they came from is unknown")
+            return
+        for service in reversed(services):
+            try:
+                completed, _ = await asyncio.to_thread(self.migrator.cutover, self.deployments[service], node)
+            except Exception as e:
+                logger.error(f"Moving {service} back to {node} failed: {e}")
+                continue
+            if completed:
+                self._pin(service, node)
+                logger.info(f"Moved {service} back to {node} with the rest of its group")
+            else:
+                logger.error(f"{service} could not be moved back to {node}")
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pins": dict(self.pins), "degraded": dict(self.degraded), "in_flight": sorted(self._in_flight)}
@@ -0,0 +1,224 @@
+# p2p_bootstrap.py
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from metrics import P2P_JOIN_ATTEMPTS, P2P_JOIN_SECONDS
+
+logger = logging.getLogger("SwarmAgent")
+
+# Once joined, an agent tells its peers where it accepts connections:
+#   MSG_PEER_ENDPOINT {"endpoint": "host:port"}
+# and every agent keeps the endpoints it hears in its peer cache, so after
+# a restart it can enter through any peer it knew, not only the bootstrap
+MSG_PEER_ENDPOINT = "MSG_PEER_ENDPOINT"
+
+Endpoint = Tuple[str, int]
+# (host, port) -> awaitable that resolves once the peer accepted the join
+EnterFn = Callable[[str, int], Awaitable[Any]]
+
+WILDCARD_IPS = ("", "0.0.0.0", "::")
+
+
+class JoinError(RuntimeError):
+    """No bootstrap candidate accepted the join before the deadline."""
+
+
+def parse_endpoint(value: Any) -> Endpoint:
+    """Read a "host:port" string, a (host, port) pair or an {"ip", "port"} mapping."""
+    if isinstance(value, dict):
+        return str(value["ip"]), int(value["port"])
+    if isinstance(value, (list, tuple)):
+        host, port = value
+        return str(host), int(port)
+    host, _, port = str(value).rpartition(":")
+    if not host:
+        raise ValueError(f"Endpoint {value!r} is not host:port")
+    return host.strip("[]"), int(port)
+
+
+def format_endpoint(endpoint: Endpoint) -> str:
+    host, port = endpoint
+    return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+
+
+class PeerCache:
+    """Endpoints of the peers last seen in the swarm, kept on local storage across restarts."""
+
+    def __init__(self, path: str, max_peers: int = 64, max_age: float = 24 * 3600):
+        """
+        Args:
+            path: JSON file holding the cache
+            max_peers: Most recently seen endpoints kept
+            max_age: Seconds after which an endpoint that was not seen again is dropped
+        """
+        self.path = Path(path)
+        self.max_peers = max_peers
+        self.max_age = max_age
+        # endpoint string -> {"peer": peer id or None, "seen": wall-clock time}
+        self._peers: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+
+    def load(self) -> "PeerCache":
+        try:
+            with open(self.path, "r") as f:
+                peers = json.load(f).get("peers", {})
+        except FileNotFoundError:
+            return self
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable peer cache {self.path}: {e}")
+            return self
+        now = time.time()
+        self._peers = {endpoint: entry for endpoint, entry in peers.items()
+                       if isinstance(entry, dict) and now - entry.get("seen", 0) <= self.max_age}
+        return self
+
+    def record(self, endpoint: Endpoint, peer_id: Optional[str] = None) -> None:
+        key = format_endpoint(endpoint)
+        entry = self._peers.get(key)
+        self._peers[key] = {"peer": peer_id or (entry or {}).get("peer"), "seen": time.time()}
+        self.dirty = True
+        if len(self._peers) > self.max_peers:
+            for stale in sorted(self._peers, key=lambda k: self._peers[k]["seen"])[:len(self._peers) - self.max_peers]:
+                del self._peers[stale]
+
+    def endpoints(self) -> List[Endpoint]:
+        """Cached endpoints, most recently seen first."""
+        ordered = sorted(self._peers.items(), key=lambda item: item[1]["seen"], reverse=True)
+        result = []
+        for key, _ in ordered:
+            try:
+                result.append(parse_endpoint(key))
+            except ValueError:
+                continue
+        return result
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"peers": self._peers}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"Could not save peer cache {self.path}: {e}")
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+
+def bootstrap_candidates(configured: Iterable[Endpoint], cached: Iterable[Endpoint],
+                         own: Optional[Endpoint] = None, max_cached: int = 8) -> List[Tuple[Endpoint, str]]:
+    """
+    Join candidates with their source ("bootstrap" or "cache"), without duplicates.
+
+    Configured bootstrap endpoints are always tried; at most `max_cached`
+    of the most recently seen cached peers are tried next to them.
+    """
+    seen = {own} if own else set()
+    candidates = []
+    for endpoint in configured:
+        if endpoint not in seen:
+            seen.add(endpoint)
+            candidates.append((endpoint, "bootstrap"))
+    added = 0
+    for endpoint in cached:
+        if added >= max_cached:
+            break
+        if endpoint not in seen:
+            seen.add(endpoint)
+            candidates.append((endpoint, "cache"))
+            added += 1
+    return candidates
+
+
+async def join_first(enter: EnterFn, candidates: List[Tuple[Endpoint, str]],
+                     attempt_timeout: float) -> Tuple[Endpoint, str]:
+    """
+    Enter through all candidates at once and return the first that accepts.
+
+    The remaining attempts are cancelled once one succeeds.
+
+    Raises:
+        JoinError: When every candidate failed or timed out
+    """
+    async def attempt(endpoint: Endpoint, source: str):
+        try:
+            await asyncio.wait_for(enter(*endpoint), attempt_timeout)
+        except asyncio.TimeoutError:
+            P2P_JOIN_ATTEMPTS.inc(source=source, outcome="timeout")
+            raise
+        except asyncio.CancelledError:
+            P2P_JOIN_ATTEMPTS.inc(source=source, outcome="cancelled")
+            raise
+        except Exception:
+            P2P_JOIN_ATTEMPTS.inc(source=source, outcome="failed")
+            raise
+        P2P_JOIN_ATTEMPTS.inc(source=source, outcome="joined")
+        return endpoint, source
+
+    if not candidates:
+        raise JoinError("No bootstrap candidates")
+    pending = {asyncio.ensure_future(attempt(endpoint, source)): endpoint for endpoint, source in candidates}
+    errors = []
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                endpoint = pending.pop(task)
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+                errors.append(f"{format_endpoint(endpoint)}: {type(error).__name__} {error}".rstrip())
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    raise JoinError("; ".join(errors))
+
+
+async def join_with_retry(enter: EnterFn, candidates: Callable[[], List[Tuple[Endpoint, str]]],
+                          deadline: float, attempt_timeout: float,
+                          backoff: float = 1.0, max_backoff: float = 15.0) -> Tuple[Endpoint, str]:
+    """
+    Retry join_first with jittered exponential backoff until `deadline` seconds have passed.
+
+    Candidates are recomputed before every round, so endpoints learnt in
+    the meantime are picked up.
+
+    Raises:
+        JoinError: When no round succeeded within the deadline
+    """
+    started = time.monotonic()
+    delay = backoff
+    rounds = 0
+    while True:
+        rounds += 1
+        remaining = deadline - (time.monotonic() - started)
+        try:
+            result = await join_first(enter, candidates(), min(attempt_timeout, max(remaining, 0.1)))
+        except JoinError as e:
+            remaining = deadline - (time.monotonic() - started)
+            if remaining <= 0:
+                P2P_JOIN_SECONDS.observe(time.monotonic() - started, outcome="failed")
+                raise JoinError(f"No join within {deadline:.0f}s after {rounds} rounds: {e}") from e
+            sleep = min(delay * random.uniform(0.5, 1.0), remaining)
+            logger.warning(f"P2P join round {rounds} failed ({e}), retrying in {sleep:.1f}s")
+            await asyncio.sleep(sleep)
+            delay = min(delay * 2, max_backoff)
+            continue
+        seconds = time.monotonic() - started
+        P2P_JOIN_SECONDS.observe(seconds, outcome="joined")
+        logger.info(f"Joined P2P network through {format_endpoint(result[0])} ({result[1]}) "
+                    f"in {seconds:.2f}s, round {rounds}")
+        return result
@@ -0,0 +1,330 @@
+# p2p_dispatch.py
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Optional
+
+from metrics import P2P_MESSAGES, P2P_UNPACED
+
+logger = logging.getLogger("SwarmAgent")
+
+# Envelope carrying several small messages in one frame: {"messages": [{"type", "payload"}]}
+MSG_BATCH = "MSG_BATCH"
+
+SendFn = Callable[[str, str, Dict[str, Any]], Any]
+Handler = Callable[[str, Dict[str, Any]], Any]
+# peer id -> bytes written to the peer's transport but not yet sent, or None when unknown
+PendingBytesFn = Callable[[str], Optional[int]]
+
+
+def transport_pending_bytes(transport: Any) -> Optional[int]:
+    """Bytes buffered in a Twisted transport (unwrapping TLS), or None if it does not say."""
+    for _ in range(3):
+        if transport is None:
+            return None
+        if hasattr(transport, "dataBuffer"):
+            # twisted.internet.abstract.FileDescriptor write buffer
+            return (len(transport.dataBuffer) - getattr(transport, "offset", 0)
+                    + getattr(transport, "_tempDataLen", 0))
+        transport = getattr(transport, "transport", None)
+    return None
+
+
+class _Entry:
+    __slots__ = ("msg_type", "payload", "coalesce_key", "droppable", "enqueued_at")
+
+    def __init__(self, msg_type, payload, coalesce_key, droppable):
+        self.msg_type = msg_type
+        self.payload = payload
+        self.coalesce_key = coalesce_key
+        self.droppable = droppable
+        self.enqueued_at = time.monotonic()
+
+
+class _PeerQueue:
+    def __init__(self):
+        self.entries: deque = deque()
+        self.by_key: Dict[Hashable, _Entry] = {}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.high_watermark = 0
+        self.space = asyncio.Event()
+        self.stats = {"enqueued": 0, "sent": 0, "batches": 0, "coalesced": 0, "dropped": 0,
+                      "rejected": 0, "paused": 0, "unpaced": 0}
+
+
+class PeerDispatcher:
+    """
+    Asynchronous P2P send layer with one bounded queue per peer.
+
+    Handlers enqueue replies and return immediately; a sender task per
+    peer drains its own queue on the event loop, so a slow peer only
+    delays its own messages. Replies with the same coalesce key replace
+    the pending one instead of queueing twice, full queues drop their
+    oldest droppable entry, and small messages of batchable types are
+    packed into one MSG_BATCH frame.
+
+    Writes to the transport do not block, so with `pending_bytes` a
+    sender stops draining while its peer's transport buffer holds more
+    than `max_pending_bytes`: a slow peer's backlog stays in its bounded
+    queue instead of growing in the transport. A peer whose buffer cannot
+    be read is logged once and its sends are counted as unpaced.
+    """
+
+    def __init__(self, send: SendFn, register: Callable[[str, Handler], Any],
+                 max_queue: int = 256, max_age: float = 30.0,
+                 batch_types: FrozenSet[str] = frozenset(), max_batch: int = 32,
+                 max_batch_bytes: int = 16 * 1024, pending_bytes: Optional[PendingBytesFn] = None,
+                 max_pending_bytes: int = 1024 * 1024):
+        """
+        Args:
+            send: Underlying send function, e.g. SwchPeer.send
+            register: Underlying handler registration, e.g. SwchPeer.register_message_handler
+            max_queue: Maximum queued messages per peer before dropping
+            max_age: Droppable messages older than this are discarded as stale
+            batch_types: Message types receivers can unpack from MSG_BATCH
+            max_batch: Maximum messages per batch frame
+            max_batch_bytes: Only messages whose encoded payload is smaller are batched
+            pending_bytes: Bytes still buffered in a peer's transport, see transport_pending_bytes
+            max_pending_bytes: Sending to a peer pauses while more than this is buffered
+        """
+        self._send = send
+        self._register = register
+        self.max_queue = max_queue
+        self.max_age = max_age
+        self.batch_types = batch_types
+        self.max_batch = max_batch
+        self.max_batch_bytes = max_batch_bytes
+        self.pending_bytes = pending_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self._queues: Dict[str, _PeerQueue] = {}
+        self._handlers: Dict[str, Handler] = {}
+        self._received: Dict[str, int] = {}
+        # Peers already reported as having no readable transport buffer
+        self._unpaced: set = set()
+        self._closed = False
+        self._register(MSG_BATCH, self._on_batch)
+
+    def register_message_handler(self, msg_type: str, handler: Handler) -> None:
+        """Register a handler for direct and batched deliveries of `msg_type`."""
+        def counted(peer_id, message):
+            self._received[msg_type] = self._received.get(msg_type, 0) + 1
+            P2P_MESSAGES.inc(direction="received", type=msg_type)
+            return handler(peer_id, message)
+        self._handlers[msg_type] = counted
+        self._register(msg_type, counted)
+
+    def _on_batch(self, peer_id: str, message: Dict[str, Any]) -> None:
+        for inner in message.get("messages", []):
+            handler = self._handlers.get(inner.get("type"))
+            if handler is None:
+                logger.warning(f"No handler for batched {inner.get('type')} from {peer_id}")
+                continue
+            try:
+                handler(peer_id, inner.get("payload") or {})
+            except Exception as e:
+                logger.error(f"Batched {inner.get('type')} handler failed: {e}")
+
+    def _queue(self, peer_id: str) -> _PeerQueue:
+        queue = self._queues.get(peer_id)
+        if queue is None:
+            queue = self._queues[peer_id] = _PeerQueue()
+        return queue
+
+    def send(self, peer_id: str, msg_type: str, payload: Dict[str, Any],
+             coalesce_key: Optional[Hashable] = None, droppable: bool = True) -> bool:
+        """
+        Queue a message for `peer_id` without blocking.
+
+        Args:
+            coalesce_key: Pending messages with the same key are replaced by this one
+            droppable: False for messages that must not be dropped under backpressure
+
+        Returns:
+            False when the message was not queued: the queue is full of
+            messages that cannot be dropped (see send_when_ready) or the
+            dispatcher is closed
+        """
+        if self._closed:
+            return False
+        queue = self._queue(peer_id)
+        queue.stats["enqueued"] += 1
+
+        if coalesce_key is not None:
+            pending = queue.by_key.get(coalesce_key)
+            if pending is not None:
+                # Merge: the newest state wins, the queue position is kept
+                pending.msg_type, pending.payload = msg_type, payload
+                queue.stats["coalesced"] += 1
+                return True
+
+        if len(queue.entries) >= self.max_queue and not self._drop_oldest(queue):
+            # Nothing droppable left: the queue stays bounded, the new message is refused
+            queue.stats["rejected" if not droppable else "dropped"] += 1
+            if not droppable:
+                logger.warning(f"Send queue to {peer_id} is full, refusing {msg_type}")
+            return False
+        entry = _Entry(msg_type, payload, coalesce_key, droppable)
+        queue.entries.append(entry)
+        if coalesce_key is not None:
+            queue.by_key[coalesce_key] = entry
+        queue.high_watermark = max(queue.high_watermark, len(queue.entries))
+
+        queue.wakeup.set()
+        if queue.task is None or queue.task.done():
+            queue.task = asyncio.get_running_loop().create_task(
+                    self._drain(peer_id, queue), name=f"p2p-send-{peer_id}")
+        return True
+
+    async def send_when_ready(self, peer_id: str, msg_type: str, payload: Dict[str, Any],
+                              coalesce_key: Optional[Hashable] = None) -> bool:
+        """Queue a message that must not be dropped, waiting while the peer's queue is full."""
+        queue = self._queue(peer_id)
+        while not self._closed and len(queue.entries) >= self.max_queue and not self._has_droppable(queue):
+            queue.space.clear()
+            await queue.space.wait()
+        return self.send(peer_id, msg_type, payload, coalesce_key=coalesce_key, droppable=False)
+
+    @staticmethod
+    def _has_droppable(queue: _PeerQueue) -> bool:
+        return any(entry.droppable for entry in queue.entries)
+
+    def _drop_oldest(self, queue: _PeerQueue) -> bool:
+        for entry in queue.entries:
+            if entry.droppable:
+                self._remove(queue, entry)
+                queue.stats["dropped"] += 1
+                return True
+        return False
+
+    @staticmethod
+    def _remove(queue: _PeerQueue, entry: _Entry) -> None:
+        queue.entries.remove(entry)
+        if entry.coalesce_key is not None and queue.by_key.get(entry.coalesce_key) is entry:
+            del queue.by_key[entry.coalesce_key]
+        queue.space.set()
+
+    async def _wait_writable(self, peer_id: str, queue: _PeerQueue) -> None:
+        """Hold the sender while the peer's transport buffer is over max_pending_bytes."""
+        if self.pending_bytes is None:
+            return
+        delay = 0.005
+        paused = False
+        while not self._closed:
+            try:
+                pending = self.pending_bytes(peer_id)
+                error = None
+            except Exception as e:
+                pending, error = None, e
+            if pending is None:
+                self._unpaced_send(peer_id, queue, error)
+                return
+            if pending <= self.max_pending_bytes:
+                return
+            if not paused:
+                paused = True
+                queue.stats["paused"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def _unpaced_send(self, peer_id: str, queue: _PeerQueue, error: Optional[Exception]) -> None:
+        queue.stats["unpaced"] += 1
+        P2P_UNPACED.inc()
+        if peer_id not in self._unpaced:
+            self._unpaced.add(peer_id)
+            reason = f": {error}" if error else ""
+            logger.warning(f"Cannot read the transport buffer to {peer_id}{reason}; "
+                           f"sends to it are not paced by max_pending_bytes")
+
+    def _is_stale(self, entry: _Entry) -> bool:
+        return entry.droppable and time.monotonic() - entry.enqueued_at > self.max_age
+
+    def _pop(self, queue: _PeerQueue) -> Optional[_Entry]:
+        while queue.entries:
+            entry = queue.entries[0]
+            self._remove(queue, entry)
+            if self._is_stale(entry):
+                queue.stats["dropped"] += 1
+                continue
+            return entry
+        return None
+
+    def _batchable(self, entry: _Entry) -> bool:
+        if entry.msg_type not in self.batch_types:
+            return False
+        return len(json.dumps(entry.payload, separators=(",", ":"), default=str)) < self.max_batch_bytes
+
+    async def _drain(self, peer_id: str, queue: _PeerQueue) -> None:
+        while not self._closed:
+            # Entries wait in the bounded queue, not the transport, while the peer is slow
+            if queue.entries:
+                await self._wait_writable(peer_id, queue)
+            entry = self._pop(queue)
+            if entry is None:
+                queue.wakeup.clear()
+                try:
+                    await asyncio.wait_for(queue.wakeup.wait(), timeout=self.max_age)
+                except asyncio.TimeoutError:
+                    # Idle peer: release the task, the next send starts a new one
+                    return
+                continue
+
+            batch = [entry]
+            if self._batchable(entry):
+                while len(batch) < self.max_batch and queue.entries:
+                    nxt = queue.entries[0]
+                    if self._is_stale(nxt):
+                        self._remove(queue, nxt)
+                        queue.stats["dropped"] += 1
+                        continue
+                    if not self._batchable(nxt):
+                        break
+                    self._remove(queue, nxt)
+                    batch.append(nxt)
+
+            try:
+                if len(batch) == 1:
+                    self._send(peer_id, entry.msg_type, entry.payload)
+                else:
+                    self._send(peer_id, MSG_BATCH, {"messages": [
+                            {"type": e.msg_type, "payload": e.payload} for e in batch]})
+                    queue.stats["batches"] += 1
+                queue.stats["sent"] += len(batch)
+                for sent in batch:
+                    P2P_MESSAGES.inc(direction="sent", type=sent.msg_type)
+            except Exception as e:
+                logger.error(f"Sending {len(batch)} messages to {peer_id} failed: {e}")
+            # Yield after every frame so one busy peer cannot starve the others
+            await asyncio.sleep(0)
+
+    def queue_depth(self, peer_id: Optional[str] = None) -> int:
+        if peer_id is not None:
+            queue = self._queues.get(peer_id)
+            return len(queue.entries) if queue else 0
+        return sum(len(q.entries) for q in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Backpressure metrics, per peer and in total."""
+        peers = {peer_id: {**q.stats, "depth": len(q.entries), "high_watermark": q.high_watermark}
+                 for peer_id, q in self._queues.items()}
+        totals: Dict[str, int] = {}
+        for peer_stats in peers.values():
+            for key, value in peer_stats.items():
+                if key == "high_watermark":
+                    totals[key] = max(totals.get(key, 0), value)
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return {"peers": peers, "total": totals, "received": dict(self._received)}
+
+    async def close(self) -> None:
+        """Stop all sender tasks; queued messages are discarded."""
+        self._closed = True
+        for queue in self._queues.values():
+            queue.space.set()
+        tasks = [q.task for q in self._queues.values() if q.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
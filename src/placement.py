@@ -0,0 +1,535 @@
+# placement.py
+
+import copy
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import REGISTRY
+from qos import QOS_OBJECTIVES, QoSScorer, Weights, service_qos_weights
+from sharding import HOSTNAME_LABEL, WORKLOAD_KINDS, pod_spec_of
+from slo_engine import OPERATORS
+
+logger = logging.getLogger("SwarmAgent")
+
+PLACEMENT_SECONDS = REGISTRY.histogram(
+        "swarm_agent_placement_seconds", "Time to solve the placement of the SAT's microservices.")
+PLACEMENT_UNPLACED = REGISTRY.gauge(
+        "swarm_agent_placement_unplaced", "Microservices the last placement found no node for.")
+
+# node_filter operators -> comparison
+FILTER_OPERATORS = {"$greater_or_equal": ">=", "$greater_than": ">", "$less_or_equal": "<=",
+                    "$less_than": "<", "$equal": "=="}
+CPU_PROPERTY = "num-cpus"
+MEMORY_PROPERTY = "mem-size"
+COLOCATION_POLICY = "swch:Scheduling.Colocation"
+# Templates that describe the swarm or its resources rather than a microservice
+NON_SERVICE_TYPES = ("swch:Swarm", "swch:Resource", "swch:Volume")
+
+_BINARY_SUFFIXES = {"Ki": 2 ** 10, "Mi": 2 ** 20, "Gi": 2 ** 30, "Ti": 2 ** 40, "Pi": 2 ** 50}
+_DECIMAL_SUFFIXES = {"n": 1e-9, "u": 1e-6, "m": 1e-3, "": 1, "k": 1e3, "K": 1e3, "M": 1e6,
+                     "G": 1e9, "T": 1e12, "P": 1e15}
+_SIZE_UNITS = {"b": 1, "kb": 1e3, "mb": 1e6, "gb": 1e9, "tb": 1e12,
+               "kib": 2 ** 10, "mib": 2 ** 20, "gib": 2 ** 30, "tib": 2 ** 40}
+
+
+def parse_quantity(value: Any) -> float:
+    """Value of a Kubernetes quantity such as "3500m", "16Gi" or 4."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"\s*([\d.]+(?:[eE][-+]?\d+)?)\s*([A-Za-z]*)\s*", str(value))
+    if not match:
+        raise ValueError(f"Unrecognised quantity: {value!r}")
+    number, suffix = float(match.group(1)), match.group(2)
+    if suffix in _BINARY_SUFFIXES:
+        return number * _BINARY_SUFFIXES[suffix]
+    if suffix in _DECIMAL_SUFFIXES:
+        return number * _DECIMAL_SUFFIXES[suffix]
+    raise ValueError(f"Unrecognised quantity suffix: {value!r}")
+
+
+def parse_size(value: Any) -> float:
+    """Bytes in a TOSCA size such as "8 GB" or "512 MiB"; bare numbers are GB."""
+    if isinstance(value, (int, float)):
+        return float(value) * 1e9
+    match = re.fullmatch(r"\s*([\d.]+)\s*([A-Za-z]*)\s*", str(value))
+    if not match or (match.group(2) and match.group(2).lower() not in _SIZE_UNITS):
+        raise ValueError(f"Unrecognised size: {value!r}")
+    return float(match.group(1)) * _SIZE_UNITS.get(match.group(2).lower() or "gb")
+
+
+@dataclass(frozen=True)
+class Predicate:
+    """One node_filter comparison on a node property (or node label)."""
+    prop: str
+    operator: str
+    value: Any
+
+
+@dataclass
+class NodeInfo:
+    """Schedulable capacity, labels and QoS values of one node; memory in bytes."""
+    name: str
+    cpus: float
+    memory: float
+    labels: Dict[str, str] = field(default_factory=dict)
+    # QoS objective (see qos.QOS_OBJECTIVES) -> value, e.g. price per hour
+    qos: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class Workload:
+    """A microservice to place: node requirements and total resource demand."""
+    name: str
+    replicas: int = 1
+    predicates: Tuple[Predicate, ...] = ()
+    cpu: float = 0.0
+    memory: float = 0.0
+    qos: Weights = ()
+
+
+@dataclass
+class PlacementResult:
+    assignments: Dict[str, str]
+    unplaced: List[str]
+    seconds: float = 0.0
+
+
+def parse_node_filter(node_filter: Optional[Dict[str, Any]]) -> Tuple[Predicate, ...]:
+    """
+    Flatten a TOSCA node_filter into predicates.
+
+    Supports `$and` (nested) of comparisons whose first operand is a
+    `$get_property` path; the property is its last element (num-cpus,
+    mem-size, provider, ...). Other operators are ignored with a warning.
+    """
+    predicates: List[Predicate] = []
+    pending = [node_filter] if node_filter else []
+    while pending:
+        clause = pending.pop()
+        if isinstance(clause, list):
+            pending.extend(reversed(clause))
+            continue
+        if not isinstance(clause, dict):
+            continue
+        for key, operands in clause.items():
+            if key == "$and":
+                pending.extend(reversed(operands or []))
+            elif key in FILTER_OPERATORS and isinstance(operands, list) and len(operands) == 2:
+                path = (operands[0] or {}).get("$get_property") if isinstance(operands[0], dict) else None
+                if not path:
+                    logger.warning(f"Ignoring node_filter clause without a property: {clause}")
+                    continue
+                prop, value = path[-1], operands[1]
+                if prop == MEMORY_PROPERTY:
+                    value = parse_size(value)
+                elif prop == CPU_PROPERTY:
+                    value = float(value)
+                predicates.append(Predicate(prop, FILTER_OPERATORS[key], value))
+            else:
+                logger.warning(f"Ignoring unsupported node_filter operator {key}")
+    return tuple(predicates)
+
+
+def nodes_from_kubernetes(items: Iterable[Dict[str, Any]]) -> List[NodeInfo]:
+    """NodeInfo of schedulable Kubernetes Node objects, from their allocatable resources."""
+    nodes = []
+    for item in items:
+        if (item.get("spec") or {}).get("unschedulable"):
+            continue
+        meta = item.get("metadata") or {}
+        allocatable = (item.get("status") or {}).get("allocatable") or {}
+        labels = dict(meta.get("labels") or {})
+        labels.setdefault(HOSTNAME_LABEL, meta.get("name"))
+        nodes.append(NodeInfo(meta.get("name"), parse_quantity(allocatable.get("cpu", 0)),
+                              parse_quantity(allocatable.get("memory", 0)), labels,
+                              _qos_values({**labels, **(meta.get("annotations") or {})})))
+    return nodes
+
+
+def _qos_values(properties: Dict[str, Any]) -> Dict[str, float]:
+    """QoS objective values among labels/annotations (any prefix) or TOSCA properties."""
+    values = {}
+    for key, value in properties.items():
+        objective = key.rsplit("/", 1)[-1]
+        objective = "price" if objective == "cost" else objective
+        if isinstance(value, dict):
+            value = value.get("default")
+        if objective in QOS_OBJECTIVES and value is not None:
+            try:
+                values[objective] = float(value)
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring non-numeric QoS value {key}={value!r}")
+    return values
+
+
+def nodes_from_node_types(node_types: Dict[str, Any]) -> List[NodeInfo]:
+    """
+    NodeInfo from a capacity file's `node_types`, keyed by resource id
+    (the format scripts/utility.get_resource_capacity reads).
+    """
+    nodes = []
+    for res_id, resource_type in (node_types or {}).items():
+        capabilities = (resource_type or {}).get("capabilities") or {}
+        props = (capabilities.get("host") or {}).get("properties") or {}
+        cpus = (props.get(CPU_PROPERTY) or {}).get("default", 0)
+        memory = (props.get(MEMORY_PROPERTY) or {}).get("default", 0)
+        labels, qos = {HOSTNAME_LABEL: res_id}, {}
+        for name, capability in capabilities.items():
+            capability_props = (capability or {}).get("properties") or {}
+            qos.update(_qos_values(capability_props))
+            if name == "host":
+                continue
+            # Other properties (e.g. resource.provider) filter like node labels
+            for prop, value in capability_props.items():
+                value = value.get("default") if isinstance(value, dict) else value
+                if prop not in qos and isinstance(value, (str, int, float)):
+                    labels[prop] = str(value)
+        nodes.append(NodeInfo(res_id, float(cpus), parse_size(memory), labels, qos))
+    return nodes
+
+
+def _pod_requests(pod_spec: Dict[str, Any]) -> Tuple[float, float]:
+    cpu = memory = 0.0
+    for container in pod_spec.get("containers") or []:
+        requests = (container.get("resources") or {}).get("requests") or {}
+        cpu += parse_quantity(requests.get("cpu", 0))
+        memory += parse_quantity(requests.get("memory", 0))
+    return cpu, memory
+
+
+def _service_of(obj: Dict[str, Any], services: Iterable[str]) -> Optional[str]:
+    meta = obj.get("metadata") or {}
+    labels = meta.get("labels") or {}
+    for candidate in (meta.get("name"), labels.get("service"), labels.get("app")):
+        if candidate in services:
+            return candidate
+    return None
+
+
+def parse_workloads(sat: Dict[str, Any], manifests: Iterable[Dict[str, Any]]) -> Dict[str, Workload]:
+    """
+    Workloads to place: the SAT's microservices that have a workload
+    manifest, with the node_filter of their host requirement (inline or
+    on the referenced Resource template), the non-hostname nodeSelector
+    entries of the manifest, the pod resource requests times replicas
+    and the weights of the SAT's QoS policies.
+    """
+    templates = ((sat or {}).get("service_template") or {}).get("node_templates") or {}
+    services = {name: t for name, t in templates.items()
+                if isinstance(t, dict) and not str(t.get("type", "")).startswith(NON_SERVICE_TYPES)}
+
+    weights = service_qos_weights(sat, services)
+    workloads: Dict[str, Workload] = {}
+    for obj in manifests:
+        if obj.get("kind") not in WORKLOAD_KINDS or obj.get("kind") == "DaemonSet":
+            continue
+        service = _service_of(obj, services)
+        if service is None or service in workloads:
+            continue
+        predicates: List[Predicate] = []
+        for requirement in services[service].get("requirements") or []:
+            host = (requirement or {}).get("host") if isinstance(requirement, dict) else None
+            if isinstance(host, dict) and "node" in host:
+                host = host["node"]
+            if isinstance(host, str):
+                host = templates.get(host) or {}
+            if isinstance(host, dict):
+                predicates.extend(parse_node_filter(host.get("node_filter")))
+        pod_spec = pod_spec_of(obj) or {}
+        for key, value in (pod_spec.get("nodeSelector") or {}).items():
+            if key != HOSTNAME_LABEL:
+                predicates.append(Predicate(key, "==", str(value)))
+        replicas = int((obj.get("spec") or {}).get("replicas") or 1) if obj.get("kind") != "Pod" else 1
+        cpu, memory = _pod_requests(pod_spec)
+        workloads[service] = Workload(service, replicas, tuple(predicates), cpu * replicas, memory * replicas,
+                                      weights[service])
+    return workloads
+
+
+def colocation_groups(sat: Dict[str, Any], services: Iterable[str]) -> List[List[str]]:
+    """
+    Sets of services that must share a node, from the SAT's Colocation
+    policies; overlapping policies are merged.
+    """
+    services = set(services)
+    parent = {name: name for name in services}
+
+    def find(name: str) -> str:
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for entry in ((sat or {}).get("service_template") or {}).get("policies") or []:
+        for policy in (entry.values() if isinstance(entry, dict) else []):
+            if not isinstance(policy, dict) or policy.get("type") != COLOCATION_POLICY:
+                continue
+            targets = [t for t in policy.get("targets") or [] if t in services]
+            for target in targets[1:]:
+                parent[find(target)] = find(targets[0])
+
+    groups: Dict[str, List[str]] = {}
+    for name in sorted(services):
+        groups.setdefault(find(name), []).append(name)
+    return list(groups.values())
+
+
+class NodeIndex:
+    """
+    Column store of node capacities with indexes for candidate filtering.
+
+    Numeric properties are kept sorted, so a threshold predicate is one
+    binary search; label equality uses a precomputed mask per
+    (key, value). Masks are cached per predicate, so services sharing a
+    requirement cost nothing after the first.
+    """
+
+    def __init__(self, nodes: Sequence[NodeInfo]):
+        nodes = sorted(nodes, key=lambda n: n.name)
+        self.names = [n.name for n in nodes]
+        self.labels = [n.labels for n in nodes]
+        self.cpus = np.array([n.cpus for n in nodes], dtype=float)
+        self.memory = np.array([n.memory for n in nodes], dtype=float)
+        self._numeric = {CPU_PROPERTY: self.cpus, MEMORY_PROPERTY: self.memory}
+        self._sorted = {prop: (np.argsort(values, kind="stable"), np.sort(values))
+                        for prop, values in self._numeric.items()}
+        # TOSCA properties match labels by key or by name, e.g. provider -> swarmchestrate.eu/provider
+        self._label_masks: Dict[Tuple[str, str], np.ndarray] = {}
+        for i, labels in enumerate(self.labels):
+            for key, value in labels.items():
+                for prop in {key, key.rsplit("/", 1)[-1]}:
+                    mask = self._label_masks.setdefault((prop, str(value)), np.zeros(len(nodes), dtype=bool))
+                    mask[i] = True
+        self._cache: Dict[Predicate, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _threshold(self, prop: str, operator: str, value: float) -> np.ndarray:
+        order, ordered = self._sorted[prop]
+        mask = np.zeros(len(self), dtype=bool)
+        if operator in (">=", ">"):
+            mask[order[np.searchsorted(ordered, value, side="left" if operator == ">=" else "right"):]] = True
+        elif operator in ("<=", "<"):
+            mask[order[:np.searchsorted(ordered, value, side="right" if operator == "<=" else "left")]] = True
+        else:
+            mask = OPERATORS[operator](self._numeric[prop], value)
+        return mask
+
+    @staticmethod
+    def _label_values(labels: Dict[str, str], prop: str) -> List[str]:
+        return [value for key, value in labels.items() if prop in (key, key.rsplit("/", 1)[-1])]
+
+    def mask(self, predicate: Predicate) -> np.ndarray:
+        cached = self._cache.get(predicate)
+        if cached is not None:
+            return cached
+        if predicate.prop in self._numeric:
+            mask = self._threshold(predicate.prop, predicate.operator, float(predicate.value))
+        elif predicate.operator == "==":
+            mask = self._label_masks.get((predicate.prop, str(predicate.value)), np.zeros(len(self), dtype=bool))
+        else:
+            compare = OPERATORS[predicate.operator]
+            mask = np.array([any(_compare(compare, v, predicate.value)
+                                 for v in self._label_values(labels, predicate.prop))
+                             for labels in self.labels], dtype=bool)
+        self._cache[predicate] = mask
+        return mask
+
+    def candidates(self, predicates: Iterable[Predicate]) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        for predicate in predicates:
+            mask &= self.mask(predicate)
+        return mask
+
+
+def _compare(compare, actual: Any, expected: Any) -> bool:
+    try:
+        return compare(float(actual), float(expected))
+    except (TypeError, ValueError):
+        return compare(str(actual), str(expected))
+
+
+class PlacementSolver:
+    """
+    Greedy capacity-aware placement of workloads onto nodes.
+
+    Colocated workloads are placed as one unit. Units are placed largest
+    demand first; each goes to the candidate node (satisfying every
+    node_filter predicate and with enough free CPU and memory) with the
+    best score: the most free capacity left for "spread", the least for
+    "pack". With a QoSScorer, units that have QoS weights blend that
+    capacity score with the node's QoS score (see qos.QoSScorer), the
+    QoS share given by `qos_weight`. Ties go to the node with fewer
+    units, then by name, so every agent computes the same placement
+    from the same node data.
+    """
+
+    STRATEGIES = ("spread", "pack")
+
+    def __init__(self, nodes: Sequence[NodeInfo], strategy: str = "spread",
+                 scorer: Optional[QoSScorer] = None, qos_weight: float = 0.5):
+        """
+        Args:
+            nodes: Candidate nodes
+            strategy: "spread" or "pack"
+            scorer: QoS scorer; refreshed from `nodes`, reusing its cached scores when they are unchanged
+            qos_weight: Share of the QoS score in a node's score, 0..1
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown placement strategy {strategy!r}, expected one of {self.STRATEGIES}")
+        self.index = NodeIndex(nodes)
+        self.strategy = strategy
+        self.scorer = scorer
+        self.qos_weight = min(1.0, max(0.0, float(qos_weight)))
+        if scorer is not None:
+            scorer.update(nodes)
+
+    def solve(self, workloads: Dict[str, Workload], groups: Optional[List[List[str]]] = None,
+              fixed: Optional[Dict[str, str]] = None) -> PlacementResult:
+        """
+        Args:
+            workloads: Service name -> Workload
+            groups: Colocation groups, see colocation_groups(); default one unit per service
+            fixed: Service -> node assignments to keep (e.g. migrated services); a unit
+                is kept on the node of its first fixed member while that node is still in the index
+        """
+        started = time.perf_counter()
+        index = self.index
+        groups = groups or [[name] for name in sorted(workloads)]
+        units = [[name for name in group if name in workloads] for group in groups]
+        units = [unit for unit in units if unit]
+
+        free_cpu, free_memory = index.cpus.copy(), index.memory.copy()
+        # Zero capacity (unknown) counts as fully used rather than dividing by zero
+        cpu_scale = np.where(index.cpus > 0, 1.0 / np.maximum(index.cpus, 1e-12), 0.0)
+        memory_scale = np.where(index.memory > 0, 1.0 / np.maximum(index.memory, 1e-12), 0.0)
+        mean_cpu = float(index.cpus.mean()) if len(index) and index.cpus.mean() > 0 else 1.0
+        mean_memory = float(index.memory.mean()) if len(index) and index.memory.mean() > 0 else 1.0
+        unit_counts = np.zeros(len(index), dtype=np.int64)
+        positions = {name: i for i, name in enumerate(index.names)}
+        fixed = fixed or {}
+
+        demands = []
+        for unit in units:
+            cpu = sum(workloads[name].cpu for name in unit)
+            memory = sum(workloads[name].memory for name in unit)
+            # Colocated services share a node, so the first QoS weights in the unit decide
+            weights = next((workloads[name].qos for name in unit if workloads[name].qos), ())
+            demands.append((cpu / mean_cpu + memory / mean_memory, unit[0], unit, cpu, memory, weights))
+        demands.sort(key=lambda d: (-d[0], d[1]))
+
+        assignments: Dict[str, str] = {}
+        unplaced: List[str] = []
+        # Fixed units take their capacity first
+        pending = []
+        for demand in demands:
+            unit, cpu, memory = demand[2], demand[3], demand[4]
+            node = next((fixed[name] for name in unit if name in fixed), None)
+            if node not in positions:
+                pending.append(demand)
+                continue
+            best = positions[node]
+            free_cpu[best] -= cpu
+            free_memory[best] -= memory
+            unit_counts[best] += 1
+            for name in unit:
+                assignments[name] = node
+
+        for _, _, unit, cpu, memory, weights in pending:
+            mask = index.candidates(p for name in unit for p in workloads[name].predicates)
+            mask &= (free_cpu >= cpu) & (free_memory >= memory)
+            if not mask.any():
+                unplaced.extend(unit)
+                continue
+            # Fraction of the node's CPU and memory left free after placing the unit, 0..1
+            left = ((free_cpu - cpu) * cpu_scale + (free_memory - memory) * memory_scale) / 2
+            score = left if self.strategy == "spread" else 1.0 - left
+            if weights and self.scorer is not None and self.qos_weight:
+                score = (1.0 - self.qos_weight) * score + self.qos_weight * self.scorer.scores(weights)
+            score[~mask] = -np.inf
+            # Best score, then fewest units, then lowest index (name); argmin returns the first minimum
+            tied = np.flatnonzero(score == score.max())
+            best = tied[np.argmin(unit_counts[tied])] if len(tied) > 1 else tied[0]
+            free_cpu[best] -= cpu
+            free_memory[best] -= memory
+            unit_counts[best] += 1
+            for name in unit:
+                assignments[name] = index.names[best]
+
+        seconds = time.perf_counter() - started
+        PLACEMENT_SECONDS.observe(seconds)
+        PLACEMENT_UNPLACED.set(len(unplaced))
+        return PlacementResult(assignments, sorted(unplaced), seconds)
+
+
+def apply_placement(manifests: Iterable[Dict[str, Any]], assignments: Dict[str, str],
+                    mode: str = "affinity") -> List[Dict[str, Any]]:
+    """
+    Pin the workloads of placed services to their node.
+
+    Replaces any hostname nodeSelector the translator emitted with a
+    required node affinity ("affinity") or a hostname nodeSelector
+    ("selector"). Modified objects are copies; the rest are returned as is.
+    """
+    if mode not in ("affinity", "selector"):
+        raise ValueError(f"Unknown placement mode {mode!r}")
+    placed = []
+    for obj in manifests:
+        service = _service_of(obj, assignments) if obj.get("kind") in WORKLOAD_KINDS else None
+        if service is None or obj.get("kind") == "DaemonSet":
+            placed.append(obj)
+            continue
+        obj = copy.deepcopy(obj)
+        pod_spec = pod_spec_of(obj)
+        node = assignments[service]
+        selector = pod_spec.get("nodeSelector") or {}
+        selector.pop(HOSTNAME_LABEL, None)
+        if mode == "selector":
+            selector[HOSTNAME_LABEL] = node
+        if selector:
+            pod_spec["nodeSelector"] = selector
+        else:
+            pod_spec.pop("nodeSelector", None)
+        if mode == "affinity":
+            node_affinity = pod_spec.setdefault("affinity", {}).setdefault("nodeAffinity", {})
+            node_affinity["requiredDuringSchedulingIgnoredDuringExecution"] = {"nodeSelectorTerms": [
+                {"matchExpressions": [{"key": HOSTNAME_LABEL, "operator": "In", "values": [node]}]}]}
+        placed.append(obj)
+    return placed
+
+
+def place_manifests(sat: Dict[str, Any], manifests: List[Dict[str, Any]], nodes: Sequence[NodeInfo],
+                    strategy: str = "spread", mode: str = "affinity", scorer: Optional[QoSScorer] = None,
+                    qos_weight: float = 0.5, fixed: Optional[Dict[str, str]] = None
+                    ) -> Tuple[List[Dict[str, Any]], PlacementResult]:
+    """
+    Solve the placement of the SAT's microservices and pin their manifests.
+
+    Args:
+        sat: Parsed SAT (TOSCA) document
+        manifests: Translated manifest objects
+        nodes: Capacities of the candidate nodes
+        strategy: "spread" or "pack", see PlacementSolver
+        mode: "affinity" or "selector", see apply_placement()
+        scorer: QoS scorer, kept by the caller so its scores stay cached across placements
+        qos_weight: Share of the QoS score in a node's score
+        fixed: Service -> node assignments to keep, e.g. from migrations
+
+    Returns:
+        (placed manifests, placement result); unplaced services keep
+        their manifests unchanged and are left to the scheduler
+    """
+    workloads = parse_workloads(sat, manifests)
+    result = PlacementSolver(nodes, strategy, scorer, qos_weight).solve(
+            workloads, colocation_groups(sat, workloads), fixed)
+    if result.unplaced:
+        logger.warning(f"No node satisfies the requirements of {result.unplaced}; leaving them to the scheduler")
+    logger.info(f"Placed {len(result.assignments)} of {len(workloads)} microservices on {len(nodes)} nodes "
+                f"in {result.seconds * 1000:.1f}ms")
+    return apply_placement(manifests, result.assignments, mode), result
@@ -0,0 +1,167 @@
+# qos.py
+
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from qos_priorities import extract_qos_priorities
+
+logger = logging.getLogger("SwarmAgent")
+
+# QoS objective -> direction: +1 when higher node values are better, -1 when lower are
+QOS_OBJECTIVES = {"bandwidth": 1, "latency": -1, "price": -1, "energy": -1}
+# SAT policy types -> objective, for policies whose name is not the objective itself
+QOS_POLICY_TYPES = {
+    "swch:QoS.Performance.Bandwidth": "bandwidth",
+    "swch:QoS.Performance.Latency": "latency",
+    "swch:QoS.Cost.Budget": "price",
+    "swch:QoS.Energy.Budget": "energy",
+}
+QOS_POLICY_PREFIX = "swch:QoS."
+
+# Sorted (objective, weight) pairs; hashable, so usable as a cache key
+Weights = Tuple[Tuple[str, float], ...]
+
+
+def qos_weights(priorities: Dict[str, Any]) -> Weights:
+    """
+    Normalise QoS priorities into weights that sum to 1.
+
+    Unknown objectives and non-positive priorities are dropped.
+    """
+    known = {}
+    for objective, priority in (priorities or {}).items():
+        try:
+            priority = float(priority)
+        except (TypeError, ValueError):
+            continue
+        if objective in QOS_OBJECTIVES and priority > 0:
+            known[objective] = priority
+    total = sum(known.values())
+    return tuple(sorted((objective, priority / total) for objective, priority in known.items())) if total else ()
+
+
+def service_qos_weights(sat: Dict[str, Any], services: Iterable[str]) -> Dict[str, Weights]:
+    """
+    QoS weights of every service, from the SAT's QoS policies.
+
+    Policies without `targets` apply to all services, targeted ones
+    override them for their targets. Policies are keyed by objective:
+    their name when it is one (as extract_qos_priorities expects), else
+    their type.
+    """
+    services = list(services)
+    common: List[Dict[str, Any]] = []
+    targeted: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in ((sat or {}).get("service_template") or {}).get("policies") or []:
+        for name, policy in (entry.items() if isinstance(entry, dict) else []):
+            if not isinstance(policy, dict) or not str(policy.get("type", "")).startswith(QOS_POLICY_PREFIX):
+                continue
+            objective = name
+            if name not in QOS_OBJECTIVES and name != "cost":
+                objective = QOS_POLICY_TYPES.get(policy["type"], name)
+            keyed = {objective: policy}
+            targets = policy.get("targets") or []
+            if not targets:
+                common.append(keyed)
+            for target in targets:
+                targeted.setdefault(target, []).append(keyed)
+
+    base = extract_qos_priorities(common)
+    weights = {}
+    for service in services:
+        priorities = dict(base)
+        priorities.update(extract_qos_priorities(targeted.get(service, [])))
+        weights[service] = qos_weights(priorities)
+    return weights
+
+
+class QoSScorer:
+    """
+    Ranks nodes on QoS objectives with one matrix product.
+
+    Keeps a node-by-objective matrix, each column normalised to [0, 1]
+    with 1 the best value (the highest bandwidth, the lowest price,
+    energy or latency). Nodes without a value score the column's midpoint.
+    A node's score for a set of weights is the matrix times the weight
+    vector. Score vectors are cached per weights until update() sees
+    different node data.
+    """
+
+    def __init__(self, nodes: Sequence[Any] = ()):
+        """
+        Args:
+            nodes: Objects with `name` and a `qos` dict of objective -> value (placement.NodeInfo)
+        """
+        self.objectives = sorted(QOS_OBJECTIVES)
+        self.names: List[str] = []
+        self.matrix = np.zeros((0, len(self.objectives)))
+        self._fingerprint: Optional[str] = None
+        self._cache: Dict[Weights, np.ndarray] = {}
+        self.hits = self.misses = 0
+        self.update(nodes)
+
+    @staticmethod
+    def fingerprint(nodes: Sequence[Any]) -> str:
+        digest = hashlib.sha256()
+        for node in sorted(nodes, key=lambda n: n.name):
+            digest.update(repr((node.name, getattr(node, "cpus", None), getattr(node, "memory", None),
+                                sorted((getattr(node, "qos", None) or {}).items()))).encode())
+        return digest.hexdigest()
+
+    def update(self, nodes: Sequence[Any]) -> bool:
+        """Rebuild the matrix if the node data changed; returns True when it did."""
+        fingerprint = self.fingerprint(nodes)
+        if fingerprint == self._fingerprint:
+            return False
+        nodes = sorted(nodes, key=lambda n: n.name)
+        raw = np.array([[float((node.qos or {}).get(o, np.nan)) for o in self.objectives] for node in nodes],
+                       dtype=float).reshape(len(nodes), len(self.objectives))
+        self.names = [node.name for node in nodes]
+        self.matrix = self._normalise(raw)
+        self._fingerprint = fingerprint
+        self._cache.clear()
+        return True
+
+    def _normalise(self, raw: np.ndarray) -> np.ndarray:
+        matrix = np.full(raw.shape, 0.5)
+        if not raw.size:
+            return matrix
+        known = ~np.isnan(raw)
+        low = np.where(known, raw, np.inf).min(axis=0)
+        high = np.where(known, raw, -np.inf).max(axis=0)
+        span = high - low
+        scaled = np.divide(raw - low, span, out=np.zeros(raw.shape), where=known & (span > 0))
+        directions = np.array([QOS_OBJECTIVES[o] for o in self.objectives])
+        scaled = np.where(directions > 0, scaled, 1.0 - scaled)
+        # A column with a single distinct value does not discriminate: every node with it gets 1
+        scaled = np.where(span > 0, scaled, 1.0)
+        return np.where(known, scaled, matrix)
+
+    def scores(self, weights: Weights) -> np.ndarray:
+        """Score in [0, 1] of every node (in `names` order) for the weights."""
+        cached = self._cache.get(weights)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        vector = np.zeros(len(self.objectives))
+        for objective, weight in weights:
+            vector[self.objectives.index(objective)] = weight
+        scores = self.matrix @ vector
+        scores.flags.writeable = False
+        self._cache[weights] = scores
+        return scores
+
+    def rank(self, weights: Weights, candidates: Optional[np.ndarray] = None) -> List[str]:
+        """Node names best first; `candidates` is an optional mask over `names`."""
+        scores = self.scores(weights)
+        positions = np.arange(len(self.names)) if candidates is None else np.flatnonzero(candidates)
+        ordered = positions[np.lexsort((positions, -scores[positions]))]
+        return [self.names[i] for i in ordered]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"nodes": len(self.names), "cached_weights": len(self._cache),
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,51 @@
+# qos_priorities.py
+# Shared by the agent and scripts/utility.py (scripts/qos_priorities.py links here)
+
+import logging
+from typing import Any, Dict
+
+
+def extract_qos_priorities(qos_data) -> Dict[str, Any]:
+    """
+    Priorities of the QoS policies in a SAT's `policies` block.
+
+    Args:
+        qos_data: Dict of policy name -> policy, or a list of such dicts
+
+    Returns:
+        Policy name -> priority; "cost" is reported as "price"
+    """
+    qos_priority = {}
+
+    if not qos_data:
+        return qos_priority
+
+    # Case 1: qos_data is already a dict:
+    # {"bandwidth": {...}, "cost": {...}, "energy": {...}}
+    if isinstance(qos_data, dict):
+        iterator = qos_data.items()
+
+    # Case 2: qos_data is a list:
+    # [{"bandwidth": {...}}, {"cost": {...}}]
+    elif isinstance(qos_data, list):
+        iterator = []
+        for item in qos_data:
+            if isinstance(item, dict):
+                iterator.extend(item.items())
+    else:
+        logging.warning(f"Unexpected QoS format: {type(qos_data)}")
+        return qos_priority
+
+    for key, val in iterator:
+        if not isinstance(val, dict):
+            continue
+
+        priority = val.get("priority")
+        if priority is None:
+            priority = val.get("properties", {}).get("priority")
+
+        if priority is not None:
+            normalized_key = "price" if key == "cost" else key
+            qos_priority[normalized_key] = priority
+
+    return qos_priority
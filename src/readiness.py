@@ -0,0 +1,146 @@
+# readiness.py
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from watch_cache import WatchCache
+
+logger = logging.getLogger("SwarmAgent")
+
+TRACKED_KINDS = {
+    "Deployment": "apps/v1",
+    "StatefulSet": "apps/v1",
+    "DaemonSet": "apps/v1",
+}
+
+
+def rollout_complete(obj: Dict[str, Any]) -> bool:
+    """Check whether a Deployment/StatefulSet/DaemonSet has finished rolling out."""
+    kind = obj.get("kind")
+    meta = obj.get("metadata") or {}
+    spec = obj.get("spec") or {}
+    status = obj.get("status") or {}
+    if (status.get("observedGeneration") or 0) < (meta.get("generation") or 0):
+        return False
+
+    if kind == "DaemonSet":
+        desired = status.get("desiredNumberScheduled") or 0
+        return ((status.get("updatedNumberScheduled") or 0) >= desired
+                and (status.get("numberAvailable") or 0) >= desired)
+
+    replicas = spec.get("replicas", 1)
+    updated = status.get("updatedReplicas") or 0
+    if kind == "StatefulSet":
+        return updated >= replicas and (status.get("readyReplicas") or 0) >= replicas
+    # Deployment: all replicas updated and available, no old replicas left
+    return (updated >= replicas
+            and (status.get("availableReplicas") or 0) >= replicas
+            and (status.get("replicas") or 0) <= updated)
+
+
+class RolloutTracker:
+    """
+    Event-driven readiness tracker for the workloads of one application.
+
+    Opens one watch per workload kind in the namespace (not one per
+    object) and marks each expected workload ready when a watch event
+    shows its rollout complete, recording time-to-ready per workload and
+    for the whole application.
+    """
+
+    def __init__(self, dynamic_client, namespace: str):
+        """
+        Args:
+            dynamic_client: kubernetes.dynamic.DynamicClient
+            namespace: Namespace the application is deployed in
+        """
+        self.dynamic_client = dynamic_client
+        self.namespace = namespace
+        self.started_at: Optional[float] = None
+        self.completed_at: Optional[float] = None
+        # (kind, name) -> time-to-ready in seconds, None while pending
+        self.ready_times: Dict[Tuple[str, str], Optional[float]] = {}
+        self._caches: Dict[str, WatchCache] = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._done_callbacks: List[Callable[[], None]] = []
+
+    def track(self, manifests: Iterable[Dict[str, Any]], started_at: Optional[float] = None) -> "RolloutTracker":
+        """Start tracking every Deployment/StatefulSet/DaemonSet in `manifests`."""
+        self.started_at = started_at or time.time()
+        for obj in manifests:
+            kind = obj.get("kind")
+            if kind in TRACKED_KINDS:
+                self.ready_times[(kind, obj["metadata"]["name"])] = None
+        if not self.ready_times:
+            self._complete()
+            return self
+
+        for kind in {kind for kind, _ in self.ready_times}:
+            cache = WatchCache(self.dynamic_client, TRACKED_KINDS[kind], kind, namespace=self.namespace)
+            cache.add_listener(self._on_event)
+            self._caches[kind] = cache.start()
+        logger.info(f"Tracking rollout of {len(self.ready_times)} workloads "
+                    f"with {len(self._caches)} watches")
+        return self
+
+    def _on_event(self, event_type: str, obj: Dict[str, Any]) -> None:
+        if event_type == "DELETED":
+            return
+        key = (obj.get("kind"), (obj.get("metadata") or {}).get("name"))
+        with self._lock:
+            if key not in self.ready_times or self.ready_times[key] is not None:
+                return
+            if not rollout_complete(obj):
+                return
+            elapsed = time.time() - self.started_at
+            self.ready_times[key] = elapsed
+            pending = sum(1 for t in self.ready_times.values() if t is None)
+        logger.info(f"{key[0]}/{key[1]} ready after {elapsed:.2f}s ({pending} pending)")
+        if pending == 0:
+            self._complete()
+
+    def _complete(self) -> None:
+        self.completed_at = time.time()
+        total = self.completed_at - (self.started_at or self.completed_at)
+        logger.info(f"Application ready: {len(self.ready_times)} workloads in {total:.2f}s")
+        with self._lock:
+            self._done.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        self.stop()
+        for callback in callbacks:
+            callback()
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        """Call `callback` (from a watch thread) once every workload is ready."""
+        with self._lock:
+            if not self._done.is_set():
+                self._done_callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every workload is ready; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    @property
+    def is_ready(self) -> bool:
+        return self._done.is_set()
+
+    def stop(self) -> None:
+        for cache in self._caches.values():
+            cache.stop()
+
+    def report(self) -> Dict[str, Any]:
+        """Time-to-ready per workload and for the whole application."""
+        with self._lock:
+            workloads = {f"{kind}/{name}": t for (kind, name), t in self.ready_times.items()}
+        total = (self.completed_at - self.started_at) if self.completed_at and self.started_at else None
+        return {
+                "ready": self.is_ready,
+                "time_to_ready": total,
+                "pending": [name for name, t in workloads.items() if t is None],
+                "workloads": workloads,
+                }
@@ -0,0 +1,401 @@
+# reconcile.py
+
+import asyncio
+import heapq
+import logging
+import re
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from apply_engine import FIELD_MANAGER, HASH_ANNOTATION, MANAGED_BY_LABEL, ApplyEngine, get_path, object_hash
+from metrics import RECONCILE_ACTIONS, RECONCILE_SECONDS
+from watch_cache import WatchCache, object_key
+
+logger = logging.getLogger("SwarmAgent")
+
+# (apiVersion, kind, namespace or None, name)
+ObjectKey = Tuple[str, str, Optional[str], str]
+
+_QUANTITY = re.compile(r"^([+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+))([eE][+-]?[0-9]+|Ki|Mi|Gi|Ti|Pi|Ei|[numkMGTPE])?$")
+_QUANTITY_SUFFIXES = {
+    "": Decimal(1), "n": Decimal("1e-9"), "u": Decimal("1e-6"), "m": Decimal("1e-3"),
+    "k": Decimal("1e3"), "M": Decimal("1e6"), "G": Decimal("1e9"), "T": Decimal("1e12"),
+    "P": Decimal("1e15"), "E": Decimal("1e18"),
+    "Ki": Decimal(2) ** 10, "Mi": Decimal(2) ** 20, "Gi": Decimal(2) ** 30,
+    "Ti": Decimal(2) ** 40, "Pi": Decimal(2) ** 50, "Ei": Decimal(2) ** 60,
+}
+
+
+def quantity_value(value: Any) -> Optional[Decimal]:
+    """Numeric value of a Kubernetes resource quantity ("500m", "1Gi", 2), or None."""
+    if isinstance(value, bool):
+        return None
+    match = _QUANTITY.match(str(value).strip())
+    if not match:
+        return None
+    number, suffix = match.groups()
+    try:
+        if suffix and suffix[0] in "eE" and len(suffix) > 1:
+            return Decimal(number + suffix)
+        return Decimal(number) * _QUANTITY_SUFFIXES[suffix or ""]
+    except InvalidOperation:
+        return None
+
+
+def _is_quantity_path(path: str) -> bool:
+    # Fields the API server stores in canonical quantity form
+    return ".resources." in f".{path}" or path.endswith(("sizeLimit", "storage"))
+
+
+def diff_object(desired: Any, live: Any, path: str = "",
+                ignore_paths: Iterable[str] = ()) -> List[str]:
+    """
+    Paths where `live` does not match `desired`.
+
+    `desired` is treated as a subset of `live`: fields the API server
+    defaults or other controllers add are not drift, fields we set but
+    that were changed or removed are. Paths in `ignore_paths` (dotted,
+    e.g. "spec.replicas") are skipped. Resource quantities are compared
+    by value, as the API server rewrites e.g. "0.5" to "500m".
+    """
+    if path in ignore_paths:
+        return []
+    if isinstance(desired, dict):
+        if not isinstance(live, dict):
+            return [path or "."]
+        drift = []
+        for key, value in desired.items():
+            drift.extend(diff_object(value, live.get(key), f"{path}.{key}" if path else key, ignore_paths))
+        return drift
+    if isinstance(desired, list):
+        if not isinstance(live, list) or len(desired) != len(live):
+            return [path]
+        drift = []
+        for index, (want, have) in enumerate(zip(desired, live)):
+            drift.extend(diff_object(want, have, f"{path}[{index}]", ignore_paths))
+        return drift
+    if desired == live or str(desired) == str(live):
+        return []
+    if _is_quantity_path(path):
+        wanted = quantity_value(desired)
+        if wanted is not None and wanted == quantity_value(live):
+            return []
+    return [path]
+
+
+class _RateLimiter:
+    """Token bucket shared by all reconcile workers."""
+
+    def __init__(self, qps: float, burst: int):
+        self.qps = qps
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.qps)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.qps)
+
+
+class Reconciler:
+    """
+    Level-triggered reconcile loop for the objects this agent deployed.
+
+    Live state comes from one watch cache per (kind, namespace) of the
+    desired set. Watch events for desired objects and a periodic resync
+    queue object keys; workers compare each desired object with its live
+    copy and server-side apply it when it is missing or has drifted.
+    Objects are never deleted: other agents apply their own shards with
+    the same field manager.
+
+    Work is rate limited by a token bucket, and every object that keeps
+    needing repair (or keeps failing) is requeued with exponential
+    backoff, so one flapping resource cannot flood the API server. Watch
+    events cannot pull a backed-off object forward, and its backoff only
+    resets once it has stayed in sync for as long as its next delay.
+    """
+
+    def __init__(self, engine: ApplyEngine, namespace: str, manifests: Iterable[Dict[str, Any]],
+                 resync_interval: float = 300.0, qps: float = 5.0, burst: int = 10,
+                 workers: int = 2, base_backoff: float = 1.0, max_backoff: float = 300.0,
+                 ignore_paths: Iterable[str] = (), preserve_paths: Iterable[str] = ()):
+        """
+        Args:
+            engine: ApplyEngine used for repairs (its dynamic client also backs the watches)
+            namespace: Default namespace of namespaced objects
+            manifests: Desired objects, i.e. this agent's share of the application
+            resync_interval: Seconds between full passes over the desired set
+            qps: Sustained reconciles per second
+            burst: Reconciles allowed back to back before qps applies
+            workers: Objects reconciled concurrently
+            base_backoff: First retry delay of an object that needed repair or failed
+            max_backoff: Upper bound of the per-object retry delay
+            ignore_paths: Dotted field paths never treated as drift
+            preserve_paths: Dotted field paths owned by another actor (e.g. the
+                autoscaler's spec.replicas); repairs keep their live value
+        """
+        self.engine = engine
+        self.namespace = namespace
+        self.resync_interval = resync_interval
+        self.workers = workers
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.preserve_paths = frozenset(preserve_paths)
+        self.ignore_paths = frozenset(ignore_paths) | self.preserve_paths
+        self._limiter = _RateLimiter(qps, burst)
+
+        self._manifests = list(manifests)
+        self._desired: Dict[ObjectKey, Dict[str, Any]] = {}
+        self._caches: Dict[Tuple[str, str, Optional[str]], WatchCache] = {}
+        # resourceVersion we last applied or confirmed in sync, per object
+        self._confirmed: Dict[ObjectKey, str] = {}
+        self._attempts: Dict[ObjectKey, int] = {}
+        # Backed-off objects are not reconciled before this time, whatever queues them
+        self._not_before: Dict[ObjectKey, float] = {}
+        self._last_repair: Dict[ObjectKey, float] = {}
+
+        # Work queue, only touched on the event loop
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._due: Dict[ObjectKey, float] = {}
+        self._queued_at: Dict[ObjectKey, float] = {}
+        self._heap: List[Tuple[float, ObjectKey]] = []
+        self._processing: Set[ObjectKey] = set()
+        self._dirty: Set[ObjectKey] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.last_resync: Optional[float] = None
+
+    def start(self) -> "Reconciler":
+        """Resolve the desired objects and open their watches (blocking)."""
+        self.set_desired(self._manifests)
+        return self
+
+    def set_desired(self, manifests: Iterable[Dict[str, Any]]) -> List[ObjectKey]:
+        """
+        Replace the desired set (blocking), opening watches for new kinds
+        and closing those no longer needed.
+
+        Returns:
+            Keys of objects that are new or whose desired content changed
+        """
+        desired: Dict[ObjectKey, Dict[str, Any]] = {}
+        for obj in manifests:
+            api_version, kind = obj.get("apiVersion", ""), obj.get("kind", "")
+            meta = obj.get("metadata") or {}
+            try:
+                resource = self.engine.dynamic_client.resources.get(api_version=api_version, kind=kind)
+            except Exception as e:
+                logger.warning(f"Not reconciling {kind}/{meta.get('name')}: {e}")
+                continue
+            namespace = (meta.get("namespace") or self.namespace) if resource.namespaced else None
+            desired[(api_version, kind, namespace, meta.get("name"))] = obj
+
+        changed = [key for key, obj in desired.items()
+                   if key not in self._desired or object_hash(obj) != object_hash(self._desired[key])]
+        # A new desired state is worth applying now, whatever the old one's backoff
+        for key in changed:
+            self._not_before.pop(key, None)
+            self._attempts.pop(key, None)
+        for key in self._desired.keys() - desired.keys():
+            self._confirmed.pop(key, None)
+            self._attempts.pop(key, None)
+            self._not_before.pop(key, None)
+            self._last_repair.pop(key, None)
+        self._desired = desired
+
+        groups = {key[:3] for key in desired}
+        for group in list(self._caches):
+            if group not in groups:
+                self._caches.pop(group).stop()
+        for group in groups - self._caches.keys():
+            api_version, kind, namespace = group
+            cache = WatchCache(self.engine.dynamic_client, api_version, kind, namespace=namespace,
+                               label_selector=f"{MANAGED_BY_LABEL}={FIELD_MANAGER}")
+            cache.add_listener(lambda event_type, live, group=group: self._on_event(group, live))
+            self._caches[group] = cache
+            cache.start()
+        logger.info(f"Reconciling {len(self._desired)} objects through {len(self._caches)} watches")
+        return changed
+
+    def set_rate_limit(self, qps: float, burst: int) -> None:
+        self._limiter.qps = qps
+        self._limiter.burst = burst
+
+    def enqueue_threadsafe(self, keys: Iterable[ObjectKey]) -> None:
+        """Queue `keys` from any thread."""
+        if self.loop is not None and not self.loop.is_closed():
+            for key in keys:
+                self.loop.call_soon_threadsafe(self.enqueue, key)
+
+    def stop(self) -> None:
+        for cache in list(self._caches.values()):
+            cache.stop()
+
+    async def run(self) -> None:
+        """Reconcile until cancelled."""
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        for cache in list(self._caches.values()):
+            await asyncio.to_thread(cache.synced.wait)
+        workers = [self.loop.create_task(self._worker(), name=f"reconcile-{i}") for i in range(self.workers)]
+        try:
+            while True:
+                self.last_resync = time.time()
+                for key in list(self._desired):
+                    self.enqueue(key)
+                await asyncio.sleep(self.resync_interval)
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def _on_event(self, group: Tuple[str, str, Optional[str]], live: Dict[str, Any]) -> None:
+        # Called from watch threads
+        key = group + ((live.get("metadata") or {}).get("name"),)
+        if key in self._desired:
+            self.enqueue_threadsafe([key])
+
+    def enqueue(self, key: ObjectKey, delay: float = 0.0) -> None:
+        """Queue `key` for reconciliation after `delay` seconds (event loop only)."""
+        if key in self._processing:
+            self._dirty.add(key)
+            return
+        due = max(time.monotonic() + delay, self._not_before.get(key, 0.0))
+        if key in self._due and self._due[key] <= due:
+            return
+        self._due[key] = due
+        self._queued_at.setdefault(key, time.monotonic())
+        heapq.heappush(self._heap, (due, key))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _next(self) -> ObjectKey:
+        while True:
+            # Drop heap entries superseded by an earlier enqueue of the same key
+            while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            now = time.monotonic()
+            if self._heap and self._heap[0][0] <= now:
+                _, key = heapq.heappop(self._heap)
+                del self._due[key]
+                self._processing.add(key)
+                return key
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._next()
+            try:
+                await self._limiter.acquire()
+                action = await asyncio.to_thread(self._reconcile_one, key)
+            except Exception as e:
+                logger.error(f"Reconciling {key[1]}/{key[3]} failed: {e}")
+                action = "failed"
+            finally:
+                self._processing.discard(key)
+            queued_at = self._queued_at.pop(key, None)
+            if queued_at is not None:
+                RECONCILE_SECONDS.observe(time.monotonic() - queued_at, action=action)
+            RECONCILE_ACTIONS.inc(action=action)
+
+            now = time.monotonic()
+            if action == "in_sync":
+                attempts = self._attempts.get(key, 0)
+                # Our own repair shows up as an in-sync event right after the
+                # backoff; only a quiet spell as long as the next delay resets it
+                if attempts and now - self._last_repair.get(key, now) >= self._backoff(attempts):
+                    self._attempts.pop(key, None)
+                    self._not_before.pop(key, None)
+                    self._last_repair.pop(key, None)
+                if key in self._dirty:
+                    self._dirty.discard(key)
+                    self.enqueue(key)
+            else:
+                # Repairs and failures back off: a resource someone keeps
+                # changing is re-checked less and less often
+                attempts = self._attempts.get(key, 0)
+                self._attempts[key] = attempts + 1
+                self._last_repair[key] = now
+                self._not_before[key] = now + self._backoff(attempts)
+                self._dirty.discard(key)
+                self.enqueue(key)
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.max_backoff, self.base_backoff * 2 ** attempts)
+
+    def _live(self, key: ObjectKey) -> Optional[Dict[str, Any]]:
+        api_version, kind, namespace, name = key
+        cache = self._caches.get((api_version, kind, namespace))
+        if cache is None:
+            return None
+        return cache.get(object_key({"metadata": {"namespace": namespace, "name": name}}))
+
+    def plan(self, key: ObjectKey) -> Tuple[Optional[str], List[str]]:
+        """
+        Decide what `key` needs: ("create", []), ("repair", drifted paths) or (None, []).
+        """
+        desired = self._desired.get(key)
+        if desired is None:
+            # Removed from the desired set while queued
+            return None, []
+        live = self._live(key)
+        if live is None:
+            return "create", []
+        meta = live.get("metadata") or {}
+        if (meta.get("annotations") or {}).get(HASH_ANNOTATION) != object_hash(desired):
+            return "repair", [f"metadata.annotations.{HASH_ANNOTATION}"]
+        if meta.get("resourceVersion") and meta.get("resourceVersion") == self._confirmed.get(key):
+            # Unchanged since we last applied or checked it
+            return None, []
+        drift = diff_object({k: v for k, v in desired.items() if k != "status"}, live,
+                            ignore_paths=self.ignore_paths)
+        if not drift:
+            self._confirmed[key] = meta.get("resourceVersion")
+            return None, []
+        return "repair", drift
+
+    def _reconcile_one(self, key: ObjectKey) -> str:
+        action, drift = self.plan(key)
+        if action is None:
+            return "in_sync"
+        kind, name = key[1], key[3]
+        if action == "create":
+            logger.warning(f"{kind}/{name} is missing, recreating it")
+        else:
+            logger.warning(f"{kind}/{name} drifted at {', '.join(drift[:5])}, repairing it")
+        overrides = {}
+        live = self._live(key) if action == "repair" else None
+        for path in self.preserve_paths:
+            value = get_path(live, path) if live else None
+            if value is not None and get_path(self._desired[key], path) is not None:
+                overrides[path] = value
+        result = self.engine.apply_one(self._desired[key], overrides=overrides)
+        if result.status == "failed":
+            return "failed"
+        if result.resource_version:
+            self._confirmed[key] = result.resource_version
+        return "created" if action == "create" else "repaired"
+
+    def queue_depth(self) -> int:
+        return len(self._due) + len(self._processing)
+
+    def lag(self) -> float:
+        """Seconds the most overdue queued object has been waiting."""
+        now = time.monotonic()
+        overdue = [now - due for due in self._due.values() if due <= now]
+        return max(overdue, default=0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"objects": len(self._desired), "queued": self.queue_depth(),
+                "backing_off": sum(1 for n in self._attempts.values() if n), "lag": round(self.lag(), 3)}
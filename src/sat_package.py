@@ -0,0 +1,139 @@
+# sat_package.py
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("SwarmAgent")
+
+# Written by scripts/generate-configMaps.py --compress: the swarm-agent-tosca
+# ConfigMap holds this manifest and the last gzip part; any earlier parts sit
+# in ConfigMaps named after the SAT digest, which only the manifest refers to
+#   {"version": 1, "encoding": "gzip", "digest": <sha256 of the SAT>, "size": n,
+#    "namespace": ns, "parts": [{"configmap", "key", "sha256", "size"}, ...]}
+MANIFEST_KEY = "tosca.manifest.json"
+
+BLOCK_SIZE = 64 * 1024
+
+SAT_UNPACK_SECONDS = REGISTRY.histogram(
+        "swarm_agent_sat_unpack_seconds", "Time to fetch, verify and decompress a packaged SAT.",
+        buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+# (namespace, configmap, key) -> part bytes
+PartFetcher = Callable[[str, str, str], bytes]
+
+
+class SATPackageError(ValueError):
+    """A packaged SAT is malformed or does not match its manifest."""
+
+
+def is_package(path: str) -> bool:
+    return os.path.basename(path) == MANIFEST_KEY
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SATPackageError(f"Unreadable SAT manifest {path}: {e}") from e
+    if manifest.get("encoding") != "gzip" or not manifest.get("parts") or not manifest.get("digest"):
+        raise SATPackageError(f"Unsupported SAT manifest {path}")
+    return manifest
+
+
+def fetch_configmap_part(namespace: str, configmap: str, key: str) -> bytes:
+    """Read one binaryData entry of a ConfigMap through the API."""
+    from kube_client import get_core_v1
+    configmap_obj = get_core_v1().read_namespaced_config_map(configmap, namespace)
+    data = (configmap_obj.binary_data or {}).get(key)
+    if data is None:
+        raise SATPackageError(f"ConfigMap {namespace}/{configmap} has no {key}")
+    return base64.b64decode(data)
+
+
+def _stored_digest(path: Path) -> str:
+    """sha256 of a file, read in BLOCK_SIZE blocks."""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def unpack(manifest_path: str, store_dir: Path, fetch_part: Optional[PartFetcher] = None) -> Path:
+    """
+    Decompress a packaged SAT into `store_dir`/<digest>.yaml and return that path.
+
+    Nothing is fetched when the store already holds a file whose content
+    matches the digest (e.g. from an earlier start or a P2P transfer); a
+    stored file that does not match is replaced. Otherwise parts are taken from the
+    manifest's directory when mounted there and fetched with `fetch_part`
+    when not, checked against their hashes and decompressed as a stream;
+    the result is checked against the SAT digest before it is moved into
+    place.
+
+    Raises:
+        SATPackageError: On a missing part or a hash or size mismatch
+    """
+    manifest = read_manifest(manifest_path)
+    digest = manifest["digest"]
+    target = Path(store_dir) / f"{digest}.yaml"
+    if target.exists() and target.stat().st_size == manifest.get("size", target.stat().st_size):
+        if _stored_digest(target) == digest:
+            return target
+        logger.warning(f"Stored SAT {target} does not match digest {digest[:12]}, unpacking it again")
+
+    started = time.perf_counter()
+    fetch_part = fetch_part or fetch_configmap_part
+    mounted = Path(manifest_path).parent
+    namespace = manifest.get("namespace", "swarm-system")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_suffix(".tmp")
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    sat_hash = hashlib.sha256()
+    size = fetched = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            for part in manifest["parts"]:
+                local = mounted / part["key"]
+                if local.exists():
+                    data = local.read_bytes()
+                else:
+                    data = fetch_part(namespace, part["configmap"], part["key"])
+                    fetched += 1
+                if hashlib.sha256(data).hexdigest() != part["sha256"]:
+                    raise SATPackageError(f"SAT part {part['configmap']}/{part['key']} does not match its hash")
+                for offset in range(0, len(data), BLOCK_SIZE):
+                    chunk = decompressor.decompress(data[offset:offset + BLOCK_SIZE])
+                    sat_hash.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+            chunk = decompressor.flush()
+            sat_hash.update(chunk)
+            size += len(chunk)
+            out.write(chunk)
+        if not decompressor.eof:
+            raise SATPackageError("Packaged SAT is truncated")
+        if sat_hash.hexdigest() != digest or size != manifest.get("size", size):
+            raise SATPackageError(f"Packaged SAT does not match digest {digest[:12]}")
+        tmp_path.replace(target)
+    except zlib.error as e:
+        raise SATPackageError(f"Packaged SAT is corrupt: {e}") from e
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    seconds = time.perf_counter() - started
+    SAT_UNPACK_SECONDS.observe(seconds)
+    logger.info(f"Unpacked SAT {digest[:12]} from {len(manifest['parts'])} parts "
+                f"({fetched} fetched, {size} bytes) in {seconds:.2f}s")
+    return target
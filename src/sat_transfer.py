@@ -0,0 +1,169 @@
+# sat_transfer.py
+
+import base64
+import hashlib
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("SwarmAgent")
+
+# P2P message types of the chunked transfer protocol:
+#   sender   -> receiver  MSG_SAT_OFFER  {digest, kind, size, total, relay}
+#   receiver -> sender    MSG_SAT_PULL   {digest}   (only if digest not held)
+#   sender   -> receiver  MSG_SAT_CHUNK  {digest, kind, index, total, chunk_digest, data}
+#   receiver -> any       MSG_SAT_WANT   {appid}    (late joiners ask for an offer)
+# `relay` lists the peers the receiver offers the payload to once it holds
+# it (see relay_tree), so every holder serves chunks, not only the LSA
+MSG_SAT_OFFER = "MSG_SAT_OFFER"
+MSG_SAT_PULL = "MSG_SAT_PULL"
+MSG_SAT_CHUNK = "MSG_SAT_CHUNK"
+MSG_SAT_WANT = "MSG_SAT_WANT"
+
+DEFAULT_CHUNK_SIZE = 256 * 1024
+DEFAULT_FANOUT = 4
+
+
+def content_digest(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()
+
+
+def relay_tree(peers: List[str], fanout: int = DEFAULT_FANOUT) -> List[Tuple[str, List[str]]]:
+    """
+    Split `peers` among at most `fanout` direct receivers.
+
+    Returns (receiver, peers it relays to) pairs; receivers split their
+    own share the same way, so no holder uploads more than `fanout`
+    copies and the depth grows with log(len(peers)).
+    """
+    fanout = max(1, fanout)
+    children = peers[:fanout]
+    rest = peers[fanout:]
+    return [(child, rest[i::len(children)]) for i, child in enumerate(children)]
+
+
+class ChunkedPayload:
+    """A payload compressed once and split into content-hashed chunks."""
+
+    def __init__(self, payload: bytes, kind: str = "sat", chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Args:
+            payload: Raw bytes to distribute (e.g. the SAT file)
+            kind: What the payload is, so receivers know how to use it
+            chunk_size: Maximum compressed bytes per chunk
+        """
+        self.kind = kind
+        self.size = len(payload)
+        self.digest = content_digest(payload)
+        compressed = zlib.compress(payload, 6)
+        self.compressed_size = len(compressed)
+        self._chunks = [compressed[i:i + chunk_size]
+                        for i in range(0, len(compressed), chunk_size)] or [b""]
+
+    @property
+    def total(self) -> int:
+        return len(self._chunks)
+
+    def offer(self) -> Dict[str, Any]:
+        return {"digest": self.digest, "kind": self.kind, "size": self.size, "total": self.total}
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """Chunk messages, with base64 data so they survive JSON framing."""
+        return [{
+                "digest": self.digest,
+                "kind": self.kind,
+                "index": index,
+                "total": self.total,
+                "chunk_digest": content_digest(chunk),
+                "data": base64.b64encode(chunk).decode("ascii"),
+                } for index, chunk in enumerate(self._chunks)]
+
+
+class ChunkAssembler:
+    """
+    Reassemble and verify chunked payloads on the receiving side.
+
+    Chunks may arrive in any order and duplicates are ignored. Each chunk
+    is checked against its own hash and the reassembled payload against
+    the content digest. Digests already held are skipped entirely.
+    """
+
+    def __init__(self, max_pending: int = 4, pending_timeout: float = 300.0, max_held: int = 2):
+        """
+        Args:
+            max_pending: Maximum number of partially received payloads kept
+            pending_timeout: Seconds after which an incomplete payload is dropped
+            max_held: Completed payloads kept in memory, most recent first
+        """
+        self.max_pending = max_pending
+        self.pending_timeout = pending_timeout
+        self.max_held = max_held
+        self.held: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    def holds(self, digest: str) -> bool:
+        return digest in self.held
+
+    def add_held(self, payload: bytes) -> str:
+        """Register a payload obtained another way (e.g. a mounted SAT)."""
+        digest = content_digest(payload)
+        self._hold(digest, payload)
+        return digest
+
+    def _hold(self, digest: str, payload: bytes) -> None:
+        self.held[digest] = payload
+        self.held.move_to_end(digest)
+        while len(self.held) > self.max_held:
+            self.held.popitem(last=False)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for digest in [d for d, p in self._pending.items() if now - p["started"] > self.pending_timeout]:
+            logger.warning(f"Dropping incomplete transfer {digest[:12]}")
+            del self._pending[digest]
+
+    def add_chunk(self, message: Dict[str, Any]) -> Optional[bytes]:
+        """
+        Add one chunk message.
+
+        Returns:
+            The verified payload once the last chunk arrives, otherwise None
+        """
+        digest = message["digest"]
+        if digest in self.held:
+            return None
+
+        self._expire()
+        pending = self._pending.get(digest)
+        if pending is None:
+            if len(self._pending) >= self.max_pending:
+                oldest = min(self._pending, key=lambda d: self._pending[d]["started"])
+                del self._pending[oldest]
+            pending = {"total": int(message["total"]), "chunks": {}, "started": time.monotonic()}
+            self._pending[digest] = pending
+
+        index = int(message["index"])
+        if index in pending["chunks"] or not 0 <= index < pending["total"]:
+            return None
+        chunk = base64.b64decode(message["data"])
+        if content_digest(chunk) != message["chunk_digest"]:
+            logger.warning(f"Chunk {index} of {digest[:12]} failed verification, ignoring")
+            return None
+        pending["chunks"][index] = chunk
+        if len(pending["chunks"]) < pending["total"]:
+            return None
+
+        del self._pending[digest]
+        compressed = b"".join(pending["chunks"][i] for i in range(pending["total"]))
+        try:
+            payload = zlib.decompress(compressed)
+        except zlib.error as e:
+            logger.error(f"Transfer {digest[:12]} failed to decompress: {e}")
+            return None
+        if content_digest(payload) != digest:
+            logger.error(f"Transfer {digest[:12]} failed content verification")
+            return None
+        self._hold(digest, payload)
+        return payload
@@ -0,0 +1,193 @@
+# sharding.py
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("SwarmAgent")
+
+WORKLOAD_KINDS = {"Deployment", "StatefulSet", "DaemonSet", "ReplicaSet", "Job", "CronJob", "Pod"}
+# Objects that workloads reference by name and that can follow their workload
+DEPENDENT_KINDS = {"ConfigMap", "Secret", "PersistentVolumeClaim"}
+HOSTNAME_LABEL = "kubernetes.io/hostname"
+
+
+def pod_spec_of(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the pod spec of a workload object, or None for other kinds."""
+    kind = obj.get("kind")
+    spec = obj.get("spec") or {}
+    if kind == "Pod":
+        return spec
+    if kind == "CronJob":
+        spec = (spec.get("jobTemplate") or {}).get("spec") or {}
+    elif kind not in WORKLOAD_KINDS:
+        return None
+    return (spec.get("template") or {}).get("spec") or {}
+
+
+def _pod_labels_of(obj: Dict[str, Any]) -> Dict[str, str]:
+    if obj.get("kind") == "Pod":
+        return obj.get("metadata", {}).get("labels") or {}
+    spec = obj.get("spec") or {}
+    if obj.get("kind") == "CronJob":
+        spec = (spec.get("jobTemplate") or {}).get("spec") or {}
+    return ((spec.get("template") or {}).get("metadata") or {}).get("labels") or {}
+
+
+def _match_expression(expr: Dict[str, Any], value: Optional[str]) -> bool:
+    operator = expr.get("operator")
+    values = expr.get("values") or []
+    if operator == "In":
+        return value is not None and value in values
+    if operator == "NotIn":
+        return value is None or value not in values
+    if operator == "Exists":
+        return value is not None
+    if operator == "DoesNotExist":
+        return value is None
+    if operator in ("Gt", "Lt") and value is not None and values:
+        try:
+            if operator == "Gt":
+                return int(value) > int(values[0])
+            return int(value) < int(values[0])
+        except ValueError:
+            return False
+    return False
+
+
+def placement_matches(pod_spec: Dict[str, Any], node_name: str,
+                      node_labels: Dict[str, str]) -> Optional[bool]:
+    """
+    Check whether a pod spec is placed on the given node.
+
+    Returns:
+        True/False when the spec pins its pods through nodeName, nodeSelector
+        or required node affinity, None when it is not placed at all
+    """
+    constrained = False
+
+    if pod_spec.get("nodeName"):
+        constrained = True
+        if pod_spec["nodeName"] != node_name:
+            return False
+
+    selector = pod_spec.get("nodeSelector") or {}
+    if selector:
+        constrained = True
+        if any(node_labels.get(key) != str(value) for key, value in selector.items()):
+            return False
+
+    required = (((pod_spec.get("affinity") or {}).get("nodeAffinity") or {})
+                .get("requiredDuringSchedulingIgnoredDuringExecution") or {})
+    terms = required.get("nodeSelectorTerms") or []
+    if terms:
+        constrained = True
+        # Terms are ORed; expressions within a term are ANDed
+        if not any(
+                all(_match_expression(e, node_labels.get(e.get("key"))) for e in term.get("matchExpressions") or [])
+                and all(_match_expression(e, node_name if e.get("key") == "metadata.name" else None)
+                        for e in term.get("matchFields") or [])
+                for term in terms):
+            return False
+
+    return True if constrained else None
+
+
+def _referenced_names(pod_spec: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    """Collect (kind, name) of ConfigMaps, Secrets and PVCs a pod spec uses."""
+    refs: Set[Tuple[str, str]] = set()
+    for volume in pod_spec.get("volumes") or []:
+        if "configMap" in volume:
+            refs.add(("ConfigMap", volume["configMap"].get("name")))
+        if "secret" in volume:
+            refs.add(("Secret", volume["secret"].get("secretName")))
+        if "persistentVolumeClaim" in volume:
+            refs.add(("PersistentVolumeClaim", volume["persistentVolumeClaim"].get("claimName")))
+        for source in (volume.get("projected") or {}).get("sources") or []:
+            if "configMap" in source:
+                refs.add(("ConfigMap", source["configMap"].get("name")))
+            if "secret" in source:
+                refs.add(("Secret", source["secret"].get("name")))
+    for secret in pod_spec.get("imagePullSecrets") or []:
+        refs.add(("Secret", secret.get("name")))
+    for container in (pod_spec.get("containers") or []) + (pod_spec.get("initContainers") or []):
+        for env_from in container.get("envFrom") or []:
+            if "configMapRef" in env_from:
+                refs.add(("ConfigMap", env_from["configMapRef"].get("name")))
+            if "secretRef" in env_from:
+                refs.add(("Secret", env_from["secretRef"].get("name")))
+        for env in container.get("env") or []:
+            value_from = env.get("valueFrom") or {}
+            if "configMapKeyRef" in value_from:
+                refs.add(("ConfigMap", value_from["configMapKeyRef"].get("name")))
+            if "secretKeyRef" in value_from:
+                refs.add(("Secret", value_from["secretKeyRef"].get("name")))
+    return refs
+
+
+def shard_manifests(manifests: Iterable[Dict[str, Any]], node_name: str,
+                    node_labels: Dict[str, str], is_leader: bool) -> List[Dict[str, Any]]:
+    """
+    Select the share of the manifests that the agent on `node_name` applies.
+
+    Workloads are owned by the node their placement selects. ConfigMaps,
+    Secrets and PVCs follow the workloads that reference them, Services
+    follow the workloads they select. Anything unplaced or shared by no
+    workload (Namespaces, orphan config, unknown kinds) is owned by the
+    leader.
+
+    Args:
+        manifests: Full list of translated manifest objects
+        node_name: Name of this agent's node
+        node_labels: Labels of this agent's node
+        is_leader: Whether this agent is the Lead Swarm Agent
+
+    Returns:
+        The objects this agent should apply, in their original order
+    """
+    labels = dict(node_labels)
+    labels.setdefault(HOSTNAME_LABEL, node_name)
+    manifests = list(manifests)
+
+    owned_ids: Set[int] = set()
+    owned_refs: Set[Tuple[str, str]] = set()
+    referenced: Set[Tuple[str, str]] = set()
+    owned_pod_labels: List[Dict[str, str]] = []
+    all_pod_labels: List[Dict[str, str]] = []
+
+    for obj in manifests:
+        pod_spec = pod_spec_of(obj)
+        if pod_spec is None:
+            continue
+        refs = _referenced_names(pod_spec)
+        referenced |= refs
+        pod_labels = _pod_labels_of(obj)
+        all_pod_labels.append(pod_labels)
+        placed = placement_matches(pod_spec, node_name, labels)
+        if placed or (placed is None and is_leader):
+            owned_ids.add(id(obj))
+            owned_refs |= refs
+            owned_pod_labels.append(pod_labels)
+
+    def selects(selector: Dict[str, str], pod_labels: Dict[str, str]) -> bool:
+        return bool(selector) and all(pod_labels.get(k) == v for k, v in selector.items())
+
+    share = []
+    for obj in manifests:
+        kind = obj.get("kind")
+        name = obj.get("metadata", {}).get("name")
+        if id(obj) in owned_ids:
+            share.append(obj)
+        elif kind in WORKLOAD_KINDS:
+            continue
+        elif kind in DEPENDENT_KINDS and (kind, name) in referenced:
+            if (kind, name) in owned_refs:
+                share.append(obj)
+        elif kind == "Service" and any(selects((obj.get("spec") or {}).get("selector") or {}, pl)
+                                       for pl in all_pod_labels):
+            if any(selects(obj["spec"]["selector"], pl) for pl in owned_pod_labels):
+                share.append(obj)
+        elif is_leader:
+            share.append(obj)
+
+    logger.info(f"Node {node_name} owns {len(share)} of {len(manifests)} manifest objects")
+    return share
@@ -0,0 +1,466 @@
+# slo_engine.py
+
+import asyncio
+import json
+import logging
+import math
+import operator
+import random
+import re
+import time
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import REGISTRY
+
+logger = logging.getLogger("SwarmAgent")
+
+SLO_VALUE = REGISTRY.gauge(
+        "swarm_agent_slo_metric_value", "Latest value of each composite SLO metric per group.",
+        ["service", "metric", "group"])
+SLO_VIOLATED = REGISTRY.gauge(
+        "swarm_agent_slo_violated", "1 while an SLO constraint is violated for a group.",
+        ["service", "slo", "group"])
+SLO_VIOLATIONS = REGISTRY.counter(
+        "swarm_agent_slo_violations_total", "Transitions of an SLO constraint into violation.",
+        ["service", "slo"])
+
+_UNITS = {"ms": 0.001, "s": 1, "sec": 1, "secs": 1, "second": 1, "seconds": 1,
+          "m": 60, "min": 60, "mins": 60, "minute": 60, "minutes": 60,
+          "h": 3600, "hour": 3600, "hours": 3600, "d": 86400, "day": 86400, "days": 86400}
+
+OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne,
+}
+
+# Window functions; sum/mean/count use the running sums of the ring buffer
+AGGREGATIONS = ("mean", "avg", "sum", "min", "max", "count", "last")
+
+# grouping -> Sample attribute the group key comes from (None: one global group)
+GROUPINGS = {"per_zone": "zone", "per_node": "node", "per_instance": "instance",
+             "global": None, "none": None}
+
+GLOBAL_GROUP = "all"
+
+
+def parse_duration(value: Any) -> float:
+    """Seconds in a TOSCA duration such as "30 sec", "5 min" or 10."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]*)\s*", str(value))
+    if not match or (match.group(2) and match.group(2).lower() not in _UNITS):
+        raise ValueError(f"Unrecognised duration: {value!r}")
+    return float(match.group(1)) * _UNITS.get(match.group(2).lower() or "s")
+
+
+@dataclass
+class RawMetric:
+    """A metric collected directly from a sensor."""
+    name: str
+    sensor: str
+    frequency: float
+    config: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def aggregation(self) -> str:
+        """How samples of several instances are combined per group (SUM or MEAN)."""
+        return str(self.config.get("results-aggregation", "SUM")).upper()
+
+
+@dataclass
+class CompositeMetric:
+    """A windowed aggregation of a raw metric, e.g. mean(cpu_util_instance) over 5 min."""
+    name: str
+    function: str
+    source: str
+    frequency: float
+    window: float
+    grouping: str = "global"
+
+
+@dataclass
+class SLOConstraint:
+    name: str
+    metric: str
+    operator: str
+    threshold: float
+
+    def violated(self, value: float) -> bool:
+        return bool(OPERATORS[self.operator](value, self.threshold))
+
+
+@dataclass
+class ServiceMetrics:
+    """Metric definitions and SLO constraints of one SAT node template."""
+    service: str
+    raw: Dict[str, RawMetric] = field(default_factory=dict)
+    composite: Dict[str, CompositeMetric] = field(default_factory=dict)
+    constraints: List[SLOConstraint] = field(default_factory=list)
+
+
+@dataclass
+class Sample:
+    """One measurement of a raw metric from one instance."""
+    value: float
+    instance: str
+    node: Optional[str] = None
+    zone: Optional[str] = None
+
+
+@dataclass
+class SLOStatus:
+    """Evaluation of one constraint for one group."""
+    service: str
+    slo: str
+    metric: str
+    group: str
+    value: float
+    violated: bool
+    timestamp: float
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _parse_formula(formula: str) -> Tuple[str, str]:
+    match = re.fullmatch(r"\s*(\w+)\s*\(\s*([\w.-]+)\s*\)\s*", formula)
+    if not match or match.group(1).lower() not in AGGREGATIONS:
+        raise ValueError(f"Unsupported formula {formula!r}; expected one of {AGGREGATIONS}(metric)")
+    return match.group(1).lower(), match.group(2)
+
+
+def parse_metric_definitions(sat: Dict[str, Any]) -> Dict[str, ServiceMetrics]:
+    """
+    Read the metrics capability and slo-constraints of every node template.
+
+    Args:
+        sat: Parsed SAT document
+
+    Returns:
+        Service name -> its metric definitions; services without metrics are omitted
+    """
+    templates = ((sat or {}).get("service_template") or {}).get("node_templates") or {}
+    services: Dict[str, ServiceMetrics] = {}
+    for service, template in templates.items():
+        capabilities = (template or {}).get("capabilities") or {}
+        props = ((capabilities.get("metrics") or {}).get("properties")) or {}
+        definitions = ServiceMetrics(service)
+        for raw in _as_list(props.get("raw")):
+            definitions.raw[raw["name"]] = RawMetric(
+                    name=raw["name"], sensor=str(raw.get("sensor", "stub")),
+                    frequency=parse_duration(raw.get("collection_frequency", 30)),
+                    config=raw.get("config") or {})
+        for composite in _as_list(props.get("composite")):
+            function, source = _parse_formula(composite["formula"])
+            if source not in definitions.raw:
+                raise ValueError(f"{service}: {composite['name']} refers to unknown metric {source}")
+            frequency = parse_duration(composite.get("collection_frequency", definitions.raw[source].frequency))
+            definitions.composite[composite["name"]] = CompositeMetric(
+                    name=composite["name"], function=function, source=source, frequency=frequency,
+                    window=parse_duration(composite.get("window_size", frequency)),
+                    grouping=composite.get("grouping", "global"))
+        for slo in _as_list(((capabilities.get("slo-constraints") or {}).get("properties"))):
+            if slo.get("operator") not in OPERATORS:
+                raise ValueError(f"{service}: unsupported SLO operator {slo.get('operator')!r}")
+            if slo.get("metric") not in definitions.composite and slo.get("metric") not in definitions.raw:
+                raise ValueError(f"{service}: SLO {slo.get('name')} refers to unknown metric {slo.get('metric')}")
+            definitions.constraints.append(SLOConstraint(
+                    name=slo.get("name", slo["metric"]), metric=slo["metric"],
+                    operator=slo["operator"], threshold=float(slo["threshold"])))
+        if definitions.raw:
+            services[service] = definitions
+    return services
+
+
+class RingBuffer:
+    """
+    Fixed-capacity window of (timestamp, value) samples backed by numpy.
+
+    Memory is constant per series. Running sums make sum/mean/count O(1)
+    while every sample is inside the window; otherwise (missed
+    collections left old samples behind) the window is masked by
+    timestamp and reduced in one vectorised pass.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.values = np.zeros(self.capacity, dtype=np.float64)
+        self.timestamps = np.full(self.capacity, -np.inf, dtype=np.float64)
+        self.size = 0
+        self._head = 0
+        self._sum = 0.0
+
+    def push(self, timestamp: float, value: float) -> None:
+        if self.size == self.capacity:
+            self._sum -= float(self.values[self._head])
+        else:
+            self.size += 1
+        self.values[self._head] = value
+        self.timestamps[self._head] = timestamp
+        self._sum += value
+        self._head = (self._head + 1) % self.capacity
+        if self._head == 0:
+            # Re-sum once per lap so floating point error cannot accumulate
+            self._sum = float(self.values[:self.size].sum())
+
+    def oldest(self) -> float:
+        if self.size < self.capacity:
+            return self.timestamps[0] if self.size else math.inf
+        return self.timestamps[self._head]
+
+    def last(self) -> Optional[float]:
+        return float(self.values[self._head - 1]) if self.size else None
+
+    def aggregate(self, function: str, now: float, window: float) -> Optional[float]:
+        """Aggregate the samples no older than `window` seconds; None if there are none."""
+        if not self.size:
+            return None
+        if function == "last":
+            return self.last()
+        if self.oldest() >= now - window and function in ("sum", "mean", "avg", "count"):
+            if function == "count":
+                return float(self.size)
+            return float(self._sum if function == "sum" else self._sum / self.size)
+        selected = self.values[self.timestamps >= now - window]
+        if not selected.size:
+            return None
+        if function == "count":
+            return float(selected.size)
+        reducer = {"sum": np.sum, "mean": np.mean, "avg": np.mean, "min": np.min, "max": np.max}[function]
+        return float(reducer(selected))
+
+
+class StubMetricSource:
+    """
+    Local metric source for tests and clusters without a sensor.
+
+    Values come from `set_values` (fixed per metric) or, by default, a
+    bounded random walk per instance, spread over `zones`.
+    """
+
+    def __init__(self, zones: Tuple[str, ...] = ("zone-a",), instances_per_zone: int = 1,
+                 base: float = 50.0, jitter: float = 5.0, seed: Optional[int] = 0):
+        self.zones = zones
+        self.instances_per_zone = instances_per_zone
+        self.base = base
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._walk: Dict[Tuple[str, str], float] = {}
+        self._fixed: Dict[str, List[Sample]] = {}
+
+    def set_values(self, metric: str, samples: List[Sample]) -> None:
+        """Return exactly `samples` for `metric` from now on."""
+        self._fixed[metric] = samples
+
+    def collect(self, service: str, metric: RawMetric) -> List[Sample]:
+        if metric.name in self._fixed:
+            return list(self._fixed[metric.name])
+        samples = []
+        for zone in self.zones:
+            for index in range(self.instances_per_zone):
+                instance = f"{service}-{zone}-{index}"
+                value = self._walk.get((metric.name, instance), self.base)
+                value = min(100.0, max(0.0, value + self._random.uniform(-self.jitter, self.jitter)))
+                self._walk[(metric.name, instance)] = value
+                samples.append(Sample(value, instance, node=f"node-{zone}", zone=zone))
+        return samples
+
+
+class NetdataSource:
+    """
+    Netdata sensor, queried through the v2 data API of each node's agent.
+
+    The raw metric's `config` is passed as query parameters (e.g.
+    scope_contexts), results are grouped per instance and averaged over
+    one collection interval. `zone_of` maps a node name to its zone.
+    """
+
+    def __init__(self, url: str = "http://localhost:19999", timeout: float = 5.0,
+                 zone_of: Optional[Callable[[str], Optional[str]]] = None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.zone_of = zone_of or (lambda node: None)
+
+    def collect(self, service: str, metric: RawMetric) -> List[Sample]:
+        params = {key: value for key, value in metric.config.items() if key != "results-aggregation"}
+        params.update({"after": -int(metric.frequency), "points": 1, "time_group": "average",
+                       "group_by": "instance", "format": "json2", "scope_instances": f"*{service}*"})
+        url = f"{self.url}/api/v2/data?{urllib.parse.urlencode(params)}"
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            result = json.load(response).get("result") or {}
+        labels = result.get("labels") or []
+        rows = result.get("data") or []
+        if not rows:
+            return []
+        samples = []
+        for label, value in zip(labels[1:], rows[-1][1:]):
+            # json2 points are [value, anomaly rate, annotations]
+            value = value[0] if isinstance(value, list) else value
+            if value is None:
+                continue
+            node = label.split("@", 1)[1] if "@" in label else None
+            samples.append(Sample(float(value), instance=label, node=node, zone=self.zone_of(node)))
+        return samples
+
+
+MetricSource = Any  # anything with collect(service, RawMetric) -> List[Sample]
+
+
+def _group_values(samples: List[Sample], grouping: str, aggregation: str) -> Dict[str, float]:
+    """Combine the samples of one collection into one value per group, vectorised."""
+    attribute = GROUPINGS.get(grouping)
+    if grouping not in GROUPINGS:
+        raise ValueError(f"Unsupported grouping {grouping!r}; expected one of {tuple(GROUPINGS)}")
+    keys = [GLOBAL_GROUP if attribute is None else (getattr(s, attribute) or "unknown") for s in samples]
+    names, index = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    values = np.fromiter((s.value for s in samples), dtype=np.float64, count=len(samples))
+    sums = np.bincount(index, weights=values, minlength=len(names))
+    if aggregation in ("MEAN", "AVG", "AVERAGE"):
+        sums = sums / np.bincount(index, minlength=len(names))
+    return dict(zip(names.tolist(), sums.tolist()))
+
+
+class SLOEngine:
+    """
+    Collects the SAT's raw metrics, maintains windowed composites and
+    evaluates SLO constraints as new samples arrive.
+
+    Each (service, composite metric, group) series is one RingBuffer
+    sized to window / collection frequency, so memory stays constant
+    however long the agent runs. Constraint listeners are called on the
+    event loop with an SLOStatus whenever a group enters or leaves
+    violation; observers are called on every evaluation.
+    """
+
+    def __init__(self, services: Dict[str, ServiceMetrics], source: MetricSource,
+                 sources: Optional[Dict[str, MetricSource]] = None):
+        """
+        Args:
+            services: Definitions from parse_metric_definitions()
+            source: Default metric source
+            sources: Per-sensor sources (lower-case sensor name -> source), overriding `source`
+        """
+        self.services = services
+        self.source = source
+        self.sources = sources or {}
+        self._buffers: Dict[Tuple[str, str, str], RingBuffer] = {}
+        self._status: Dict[Tuple[str, str, str], SLOStatus] = {}
+        self._listeners: List[Callable[[SLOStatus], None]] = []
+        self._observers: List[Callable[[SLOStatus], None]] = []
+        self._due: Dict[Tuple[str, str], float] = {}
+
+    def add_listener(self, listener: Callable[[SLOStatus], None], changes_only: bool = True) -> None:
+        """
+        Args:
+            listener: Called with an SLOStatus on the event loop
+            changes_only: False to be called on every evaluation, not only on transitions
+        """
+        (self._listeners if changes_only else self._observers).append(listener)
+
+    def _notify(self, listeners: List[Callable[[SLOStatus], None]], status: SLOStatus) -> None:
+        for listener in listeners:
+            try:
+                listener(status)
+            except Exception as e:
+                logger.error(f"SLO listener failed: {e}")
+
+    def _buffer(self, service: str, composite: CompositeMetric, group: str) -> RingBuffer:
+        key = (service, composite.name, group)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            capacity = math.ceil(composite.window / max(composite.frequency, 1e-9))
+            buffer = self._buffers[key] = RingBuffer(capacity)
+        return buffer
+
+    def ingest(self, service: str, metric: RawMetric, samples: List[Sample],
+               now: Optional[float] = None) -> List[SLOStatus]:
+        """
+        Add one collection of `metric` and re-evaluate the constraints it feeds.
+
+        Returns:
+            Statuses of constraints that changed state
+        """
+        now = time.time() if now is None else now
+        definitions = self.services[service]
+        changed = []
+        if not samples:
+            return changed
+        for composite in definitions.composite.values():
+            if composite.source != metric.name:
+                continue
+            for group, value in _group_values(samples, composite.grouping, metric.aggregation).items():
+                buffer = self._buffer(service, composite, group)
+                buffer.push(now, value)
+                aggregate = buffer.aggregate(composite.function, now, composite.window)
+                if aggregate is None:
+                    continue
+                SLO_VALUE.set(aggregate, service=service, metric=composite.name, group=group)
+                changed.extend(self._evaluate(service, composite.name, group, aggregate, now))
+        # Constraints directly on a raw metric use the latest global value
+        raw_constraints = [c for c in definitions.constraints if c.metric == metric.name]
+        if raw_constraints:
+            value = _group_values(samples, "global", metric.aggregation)[GLOBAL_GROUP]
+            changed.extend(self._evaluate(service, metric.name, GLOBAL_GROUP, value, now))
+        return changed
+
+    def _evaluate(self, service: str, metric: str, group: str, value: float, now: float) -> List[SLOStatus]:
+        changed = []
+        for constraint in self.services[service].constraints:
+            if constraint.metric != metric:
+                continue
+            violated = constraint.violated(value)
+            key = (service, constraint.name, group)
+            previous = self._status.get(key)
+            status = SLOStatus(service, constraint.name, metric, group, value, violated, now)
+            self._status[key] = status
+            SLO_VIOLATED.set(int(violated), service=service, slo=constraint.name, group=group)
+            if previous is None or previous.violated != violated:
+                if violated:
+                    SLO_VIOLATIONS.inc(service=service, slo=constraint.name)
+                    logger.warning(f"SLO {constraint.name} of {service} violated in {group}: "
+                                   f"{metric}={value:.2f} {constraint.operator} {constraint.threshold}")
+                elif previous is not None:
+                    logger.info(f"SLO {constraint.name} of {service} recovered in {group}: {metric}={value:.2f}")
+                changed.append(status)
+                self._notify(self._listeners, status)
+            self._notify(self._observers, status)
+        return changed
+
+    def _source_for(self, metric: RawMetric) -> MetricSource:
+        return self.sources.get(metric.sensor.lower(), self.source)
+
+    async def run(self) -> None:
+        """Collect every raw metric at its collection_frequency until cancelled."""
+        metrics = [(service, raw) for service, d in self.services.items() for raw in d.raw.values()]
+        if not metrics:
+            return
+        logger.info(f"SLO engine collecting {len(metrics)} metrics for {len(self.services)} services")
+        while True:
+            now = time.monotonic()
+            for service, raw in metrics:
+                if self._due.get((service, raw.name), 0.0) > now:
+                    continue
+                self._due[(service, raw.name)] = now + raw.frequency
+                try:
+                    samples = await asyncio.to_thread(self._source_for(raw).collect, service, raw)
+                except Exception as e:
+                    logger.warning(f"Collecting {raw.name} for {service} failed: {e}")
+                    continue
+                self.ingest(service, raw, samples)
+            next_due = min(self._due.values()) - time.monotonic()
+            await asyncio.sleep(max(0.05, next_due))
+
+    def status(self) -> List[SLOStatus]:
+        """Latest evaluation of every constraint and group."""
+        return list(self._status.values())
+
+    def violations(self) -> List[SLOStatus]:
+        return [s for s in self._status.values() if s.violated]
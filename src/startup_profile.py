@@ -0,0 +1,79 @@
+# startup_profile.py
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+# Reference point for "time since start"; main imports this module first
+PROCESS_START = time.perf_counter()
+
+
+class _Frame:
+    __slots__ = ("parent", "children")
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.children = 0.0
+
+
+class StartupProfiler:
+    """
+    Accumulates wall-clock time per startup phase.
+
+    A phase nested in another (e.g. "imports" inside "translation") only
+    counts for the inner phase, so the phases add up to at most the total.
+    Nothing is recorded after mark_ready(): later reloads are not startup.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # Open phases per thread; phases in a worker thread nest separately
+        self._local = threading.local()
+        self.ready_at = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block and add its self-time to phase `name`."""
+        if self.ready_at is not None:
+            yield
+            return
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = _Frame(stack[-1] if stack else None)
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.remove(frame)
+            if frame.parent is not None:
+                frame.parent.children += elapsed
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + max(0.0, elapsed - frame.children)
+
+    def mark_ready(self) -> None:
+        """Record the moment startup finished."""
+        self.ready_at = time.perf_counter()
+
+    def report(self) -> Dict[str, float]:
+        """Seconds per phase, plus the total time since process start."""
+        with self._lock:
+            report = {name: round(seconds, 4) for name, seconds in self.phases.items()}
+        end = self.ready_at if self.ready_at is not None else time.perf_counter()
+        report["total"] = round(end - PROCESS_START, 4)
+        return report
+
+    def log(self, logger: logging.Logger) -> None:
+        report = self.report()
+        total = report.pop("total")
+        breakdown = ", ".join(f"{name}={seconds:.3f}s" for name, seconds in report.items())
+        logger.info(f"Startup took {total:.3f}s: {breakdown}")
+
+
+# Process-wide profiler used by main and the agent
+PROFILER = StartupProfiler()
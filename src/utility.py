@@ -1,17 +1,45 @@
 # utility.py
 
+import os
 import yaml
 import logging
 from pathlib import Path
 from typing import Dict, Any, Optional
 
 
+def resolve_node_config(config: Dict[str, Any], node_name: Optional[str]) -> Dict[str, Any]:
+    """
+    Compose one node's configuration from a shared base configuration.
+
+    A base configuration (scripts/generate-configMaps.py --layout base) names
+    the `leader` node instead of carrying SA_id, SA_role and resource_id; they
+    are derived from the node name. Its `node_overrides` entry for the node,
+    if any, is applied last. Per-node configurations are returned unchanged.
+
+    Args:
+        config: Loaded configuration
+        node_name: This agent's node (NODE_NAME)
+
+    Returns:
+        The node's configuration
+    """
+    if 'leader' not in config or not node_name:
+        return config
+    resolved = {key: value for key, value in config.items() if key not in ('leader', 'node_overrides')}
+    resolved.setdefault('SA_id', f"SA-{node_name}")
+    resolved.setdefault('SA_role', "leader" if node_name == config['leader'] else "worker")
+    resolved.setdefault('resource_id', node_name)
+    resolved.update((config.get('node_overrides') or {}).get(node_name) or {})
+    return resolved
+
+
 def load_configuration(config_path: str = "config.yaml") -> Optional[Dict[str, Any]]:
     """
     Load configuration from YAML file
     
     Args:
-        config_path: Path to configuration file
+        config_path: Path to configuration file (per-node, or a shared base
+            resolved for NODE_NAME, see resolve_node_config)
         
     Returns:
         Dictionary containing configuration or None if failed
@@ -25,6 +53,7 @@ def load_configuration(config_path: str = "config.yaml") -> Optional[Dict[str, A
             
         with open(config_file, 'r') as file:
             config = yaml.safe_load(file)
+            config = resolve_node_config(config or {}, os.getenv("NODE_NAME"))
             print("Loaded configuration:", config)
 
         # Validate required fields
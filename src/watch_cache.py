@@ -0,0 +1,176 @@
+# watch_cache.py
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from kubernetes import watch
+from kubernetes.client.exceptions import ApiException
+
+from metrics import record_api_error
+
+logger = logging.getLogger("SwarmAgent")
+
+# Listener signature: (event_type, object) with event_type ADDED/MODIFIED/DELETED
+Listener = Callable[[str, Dict[str, Any]], None]
+
+
+def object_key(obj: Dict[str, Any]) -> str:
+    """Cache key of an object: "namespace/name", or "name" when cluster-scoped."""
+    meta = obj.get("metadata") or {}
+    namespace = meta.get("namespace")
+    return f"{namespace}/{meta.get('name')}" if namespace else meta.get("name")
+
+
+class WatchCache:
+    """
+    Local, watch-maintained copy of one resource kind.
+
+    A single background thread LISTs the kind once, then follows a WATCH
+    from the returned resourceVersion and applies every event to an
+    in-memory store of raw object dicts. Expired watches (410 Gone) and
+    connection errors trigger a relist. Listeners are called from the
+    watch thread for every change.
+    """
+
+    def __init__(self, dynamic_client, api_version: str, kind: str,
+                 namespace: Optional[str] = None, label_selector: Optional[str] = None,
+                 watch_timeout: int = 300, retry_delay: float = 2.0):
+        """
+        Args:
+            dynamic_client: kubernetes.dynamic.DynamicClient
+            api_version: API version of the kind, e.g. "apps/v1"
+            kind: Resource kind, e.g. "Deployment"
+            namespace: Namespace to watch; None watches all namespaces or a cluster-scoped kind
+            label_selector: Optional label selector applied to list and watch
+            watch_timeout: Server-side timeout of one watch request in seconds
+            retry_delay: Delay before relisting after an error
+        """
+        self.dynamic_client = dynamic_client
+        self.api_version = api_version
+        self.kind = kind
+        self.namespace = namespace
+        self.label_selector = label_selector
+        self.watch_timeout = watch_timeout
+        self.retry_delay = retry_delay
+
+        self.synced = threading.Event()
+        self.last_sync: Optional[float] = None
+        self.last_event: Optional[float] = None
+        self.resource_version: Optional[str] = None
+
+        self._store: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Listener] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[watch.Watch] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    def start(self) -> "WatchCache":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"watch-{self.kind}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.stop()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._store.get(key)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._store.values())
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._store.keys())
+
+    def _notify(self, event_type: str, obj: Dict[str, Any]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event_type, obj)
+            except Exception as e:
+                logger.error(f"{self.kind} watch listener failed: {e}")
+
+    def _relist(self, resource) -> None:
+        listed = resource.get(namespace=self.namespace, label_selector=self.label_selector).to_dict()
+        items = {object_key(item): item for item in listed.get("items", [])}
+        for item in items.values():
+            item.setdefault("kind", self.kind)
+            item.setdefault("apiVersion", self.api_version)
+        with self._lock:
+            removed = [obj for key, obj in self._store.items() if key not in items]
+            self._store = items
+        self.resource_version = (listed.get("metadata") or {}).get("resourceVersion")
+        self.last_sync = time.time()
+        for obj in removed:
+            self._notify("DELETED", obj)
+        for obj in items.values():
+            self._notify("ADDED", obj)
+        self.synced.set()
+
+    def _apply_event(self, event_type: str, obj: Dict[str, Any]) -> None:
+        key = object_key(obj)
+        with self._lock:
+            if event_type == "DELETED":
+                self._store.pop(key, None)
+            else:
+                self._store[key] = obj
+        self.resource_version = (obj.get("metadata") or {}).get("resourceVersion") or self.resource_version
+        self.last_event = self.last_sync = time.time()
+        self._notify(event_type, obj)
+
+    def _run(self) -> None:
+        resource = None
+        need_relist = True
+        while not self._stop.is_set():
+            try:
+                if resource is None:
+                    resource = self.dynamic_client.resources.get(api_version=self.api_version, kind=self.kind)
+                if need_relist:
+                    self._relist(resource)
+                    need_relist = False
+
+                self._watcher = watch.Watch()
+                for event in self.dynamic_client.watch(
+                        resource, namespace=self.namespace, label_selector=self.label_selector,
+                        resource_version=self.resource_version, timeout=self.watch_timeout,
+                        watcher=self._watcher, allow_watch_bookmarks=True):
+                    event_type = event["type"]
+                    raw = event["raw_object"]
+                    if event_type == "ERROR":
+                        if raw.get("code") == 410:
+                            need_relist = True
+                            break
+                        raise RuntimeError(raw.get("message", raw))
+                    if event_type == "BOOKMARK":
+                        # Periodic proof that the watch is current
+                        self.resource_version = (raw.get("metadata") or {}).get("resourceVersion") or self.resource_version
+                        self.last_sync = time.time()
+                        continue
+                    self._apply_event(event_type, raw)
+                else:
+                    # Server-side timeout: reconnect from the last resourceVersion
+                    self.last_sync = time.time()
+            except ApiException as e:
+                if e.status == 410:
+                    need_relist = True
+                    continue
+                record_api_error("watch", e)
+                logger.warning(f"{self.kind} watch failed ({e.status}), relisting: {e.reason}")
+                need_relist = True
+                self._stop.wait(self.retry_delay)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f"{self.kind} watch failed, relisting: {e}")
+                need_relist = True
+                self._stop.wait(self.retry_delay)